@@ -15,7 +15,9 @@ The main actions are:
 import math
 import datetime
 import a3assets
+import a3calendar
 import a3helpers
+import a3taxes
 
 #--------------------------------------Part 1 ---------------------------------------------
 def open_portfolio(to_invest,fee):
@@ -58,13 +60,19 @@ def invest_BitCoin(portfolio,amount):
     """
     assert type(amount)==int and amount>0
     assert isinstance(portfolio,a3assets.Portfolio)
-    bitcoins=a3helpers.get_BTC_price()
-    if (portfolio.cash -(bitcoins+portfolio.commission_fee  )>=0):
-        portfolio.coins=amount
-        portfolio.cash=portfolio.cash -(bitcoins*portfolio.coins+portfolio.commission_fee)
+    return _invest_BitCoin_at(portfolio,amount,a3helpers.get_BTC_price())
+
+def _invest_BitCoin_at(portfolio,amount,bitcoins):
+    """
+    Returns: a bool; the result of invest_BitCoin when BitCoin is priced at `bitcoins`.
+    """
+    if (portfolio.cash -(bitcoins*amount+portfolio.commission_fee  )>=0):
+        portfolio.coins=portfolio.coins+amount
+        portfolio.cash=portfolio.cash -(bitcoins*amount+portfolio.commission_fee)
         return True
     else:
         return False
+
 def sell_BitCoin(portfolio,amount):
     """
     Returns: a bool; True if the transaction was successful, False Otherwise.
@@ -88,7 +96,12 @@ def sell_BitCoin(portfolio,amount):
     """
     assert type(amount)==int and amount>0
     assert isinstance(portfolio,a3assets.Portfolio)
-    bitcoins=a3helpers.get_BTC_price()
+    return _sell_BitCoin_at(portfolio,amount,a3helpers.get_BTC_price())
+
+def _sell_BitCoin_at(portfolio,amount,bitcoins):
+    """
+    Returns: a bool; the result of sell_BitCoin when BitCoin is priced at `bitcoins`.
+    """
     am=min(amount,portfolio.coins  )
     if (portfolio.cash +bitcoins*am-portfolio.commission_fee >=0.0):
         portfolio.coins=portfolio.coins-am
@@ -124,11 +137,11 @@ def compute_interest(portfolio,rate,years,times_compounded):
     assert isinstance(portfolio,a3assets.Portfolio)
     if (times_compounded!=float("inf")):
         total=portfolio.cash  *math.pow(1+(rate/100)/times_compounded,times_compounded*years)
-        portfolio.cash(total)
+        portfolio.cash=total
         return total
     else:
         total=portfolio.cash  *math.exp((rate/100)*years)
-        portfolio.cash(total)
+        portfolio.cash=total
         return total
 def take_loan(portfolio,amount,length):
     """
@@ -176,6 +189,7 @@ def pay_loan(portfolio,loan):
     the balance of the loan increases by its late_fee, and the portfolio's cash remains the same.
 
     Once a loan is fully paid off, then the portfolio's loan_rate is decreased by 0.01.
+    To run many loans for many months at once, see a3loans.LoanBook.
 
     Parameter portfolio: the portfolio paying off its loan
     Precondition: portfolio is a Portfolio object
@@ -186,14 +200,14 @@ def pay_loan(portfolio,loan):
     assert isinstance(portfolio,a3assets.Portfolio)
     assert isinstance(loan,a3assets.Loan)
     if (portfolio.cash  <loan.balance  /loan.length  ):
-        loan.balance(loan.balance  +loan.late_fee  )
+        loan.balance=loan.balance  +loan.late_fee
         return False
     else:
         if (loan.length  ==1):
-            portfolio.loan_rate(portfolio.loan_rate  -0.01)
-        portfolio.cash(portfolio.cash  -loan.balance  /loan.length  )
-        loan.balance(loan.balance  -loan.balance  /loan.length  )
-        loan.length(loan.length  -1)
+            portfolio.loan_rate=portfolio.loan_rate  -0.01
+        portfolio.cash=portfolio.cash  -loan.balance  /loan.length
+        loan.balance=loan.balance  -loan.balance  /loan.length
+        loan.length=loan.length  -1
         return True
 
 
@@ -205,6 +219,7 @@ def calculate_taxes(profit,long_term):
 
     If profit is long-term, pays capital-gains taxes according to write-up
     If profit is not long-term, pays income intrest according to write-up
+    The brackets live in a3taxes; use a3taxes.after_tax_array to tax many profits at once.
 
     Parameter profit: a float representing total profit
     long_term: bool representing if long term or short term investment.
@@ -215,33 +230,7 @@ def calculate_taxes(profit,long_term):
     """
     assert type(long_term)==bool
     assert type(profit)==float
-    temp_tax=0
-    if (long_term!=True):
-        if (profit<=10000):
-            temp_tax=0.1*profit
-            return profit-temp_tax
-        elif (profit<=100000):
-            temp_tax=0.1*10000+0.2*(profit-10000)
-            return profit-temp_tax
-        elif (profit<=1000000):
-            temp_tax=0.1*10000+0.2*90000+0.3*(profit-100000)
-            return profit-temp_tax
-        elif (profit<=10000000):
-            temp_tax=0.1*10000+0.2*90000+0.3*900000+0.4*(profit-1000000)
-            return profit-temp_tax
-        else:
-            temp_tax=0.1*10000+0.2*90000+0.3*900000+0.4*9000000+0.7*(profit-10000000)
-            return profit-temp_tax
-    else:
-        if (profit<=38600):
-            temp_tax=0
-            return profit-temp_tax
-        elif (profit<=425800):
-            temp_tax=0.15*(profit-38600)
-            return profit-temp_tax
-        else:
-            temp_tax=0.15*(387200)+0.3*(profit-425800)
-            return profit-temp_tax
+    return a3taxes.after_tax(profit,long_term)
 
 
 def buy_stock(portfolio,stock,amount_shares,short,time):
@@ -271,12 +260,16 @@ def buy_stock(portfolio,stock,amount_shares,short,time):
     assert type(short)==bool
     assert isinstance(portfolio,a3assets.Portfolio)
 
-    sprice=a3helpers.get_stock_price(stock)
-    portfolio.commission_fee
+    return _buy_stock_at(portfolio,stock,amount_shares,short,time,a3helpers.get_stock_price(stock))
+
+def _buy_stock_at(portfolio,stock,amount_shares,short,time,sprice):
+    """
+    Returns: a Stock object or None; the result of buy_stock when the stock is priced at `sprice`.
+    """
     if(sprice*amount_shares+portfolio.commission_fee  <=portfolio.cash  ):
-        if(a3helpers.is_weekday(time) and time.hour>=10 and time.hour<16):
+        if(_in_trading_hours(time)):
             portfolio.cash=portfolio.cash  -sprice*amount_shares-portfolio.commission_fee
-            st=Stock(stock,sprice,amount_shares,short,time)
+            st=a3assets.Stock(stock,sprice,amount_shares,short,time)
             return st
     return None
 def pay_dividends(portfolio,stock,company,payments):
@@ -345,24 +338,113 @@ def sell_stock(portfolio,amount_shares,time,stock):
     assert isinstance(stock,a3assets.Stock)
     assert isinstance(time,datetime.datetime)
     assert type(amount_shares)==int and amount_shares>0
-    if(a3helpers.is_weekday(time) and time.hour>=10 and time.hour<16 and portfolio.cash  >=portfolio.commission_fee  ):
+    if(_can_sell(portfolio,time)):
+        return _sell_stock_at(portfolio,amount_shares,time,stock,a3helpers.get_stock_price(stock.company  ))
+    return False
+
+def _can_sell(portfolio,time):
+    """
+    Returns: True if a sale at `time` is within trading hours and the commission fee can be paid.
+    """
+    return _in_trading_hours(time) and portfolio.cash  >=portfolio.commission_fee
+
+def _in_trading_hours(time):
+    """
+    Returns: True if `time` falls in a session of the market calendar, a3calendar.calendar.
+    By default that is any weekday between 10 am and 4 pm.
+    """
+    return a3calendar.calendar.is_open(time)
+
+def _sale_proceeds(stock,sharestosell,time,sprice):
+    """
+    Returns: the post-tax profit of selling `sharestosell` shares of stock at `sprice` at `time`.
+    A sale with no profit returns 0.
+    """
+    return _taxed_profit(stock,sharestosell,sprice,a3helpers.one_year_ago(time)>stock.buy_date  )
+
+def _taxed_profit(stock,sharestosell,sprice,long_term):
+    """
+    Returns: the post-tax profit of selling `sharestosell` shares of stock at `sprice`,
+    taxed as long-term if long_term is True. A sale with no profit returns 0.
+    """
+    if (stock.short  ):
+        profit=sharestosell*2*(stock.buy_price  -sprice)
+    else:
+        profit=sharestosell*2*(sprice-stock.buy_price  )
+    if (profit<=0):
+        return 0
+    return calculate_taxes(profit,long_term)
+
+def _sell_stock_at(portfolio,amount_shares,time,stock,sprice):
+    """
+    Returns: a bool; the result of sell_stock when the stock is priced at `sprice`.
+    """
+    if(_can_sell(portfolio,time)):
         sharestosell=min(stock.shares,amount_shares)
-        if (stock.short  ):
-            profit=sharestosell*2*(stock.buy_price  -a3helpers.get_stock_price(stock.company  ))
-        else:
-            profit=sharestosell*2*(a3helpers.get_stock_price(stock.company  )-stock.buy_price  )
+        profitaftertax=_sale_proceeds(stock,sharestosell,time,sprice)
         stock.shares=stock.shares -sharestosell
-        if (profit<=0):
-            profitaftertax=0
-        else:
-            if(a3helpers.one_year_ago(time)>stock.buy_date  ):
-                profitaftertax=calculate_taxes(profit,True)
-            else:
-                profitaftertax=calculate_taxes(profit,False)
         portfolio.cash=portfolio.cash  -portfolio.commission_fee  +profitaftertax
         return True
     return False
 
+#-------------------------------------- Async --------------------------------------
+async def invest_BitCoin_async(portfolio,amount):
+    """
+    Returns: a bool; the awaitable version of invest_BitCoin.
+
+    The BitCoin quote is awaited through a3helpers.get_BTC_price_async, so many
+    orders can wait on the network at the same time.
+    """
+    assert type(amount)==int and amount>0
+    assert isinstance(portfolio,a3assets.Portfolio)
+    return _invest_BitCoin_at(portfolio,amount,await a3helpers.get_BTC_price_async())
+
+async def sell_BitCoin_async(portfolio,amount):
+    """
+    Returns: a bool; the awaitable version of sell_BitCoin.
+    """
+    assert type(amount)==int and amount>0
+    assert isinstance(portfolio,a3assets.Portfolio)
+    return _sell_BitCoin_at(portfolio,amount,await a3helpers.get_BTC_price_async())
+
+async def buy_stock_async(portfolio,stock,amount_shares,short,time):
+    """
+    Returns: a Stock object or None; the awaitable version of buy_stock.
+    """
+    assert type(stock)==str
+    assert type(amount_shares)==int and amount_shares>0
+    assert type(short)==bool
+    assert isinstance(portfolio,a3assets.Portfolio)
+    return _buy_stock_at(portfolio,stock,amount_shares,short,time,await a3helpers.get_stock_price_async(stock))
+
+async def sell_stock_async(portfolio,amount_shares,time,stock):
+    """
+    Returns: a bool; the awaitable version of sell_stock.
+
+    The cash and trading-hours checks are made again once the quote arrives, since
+    other orders on the same portfolio may have run while this one was waiting.
+    """
+    assert isinstance(portfolio,a3assets.Portfolio)
+    assert isinstance(stock,a3assets.Stock)
+    assert isinstance(time,datetime.datetime)
+    assert type(amount_shares)==int and amount_shares>0
+    if(_can_sell(portfolio,time)):
+        return _sell_stock_at(portfolio,amount_shares,time,stock,await a3helpers.get_stock_price_async(stock.company  ))
+    return False
+
+async def run_orders_async(orders):
+    """
+    Returns: a list with the result of each awaitable in orders, in the same order.
+
+    Runs many async trading calls at once so their quote requests overlap, e.g.
+    run_orders_async([buy_stock_async(p,"IBM",1,False,t) for p in portfolios])
+
+    Parameter orders: the coroutines to run
+    Precondition: orders is an iterable of coroutines from this module
+    """
+    import asyncio
+    return list(await asyncio.gather(*orders))
+
 def game() :
     start = float(input("How much money would you like to start with? "))
     portfolio = open_portfolio(start,1.0)
@@ -420,22 +502,20 @@ def game() :
             stock = buy_stock(portfolio,ticker,shares,short,date)
             if stock != None:
                 print("Transation successful!")
-                portfolio.stocks.append(stock)
+                portfolio.add_stock(stock)
             else:
                 print("I am sorry this transaction failed")
         elif move == 5:
             ticker = input("What stock would you like to sell?")
             print(ticker + " is currently worth " + str(a3helpers.get_stock_price(ticker)))
-            amount = -1
-            selling = None
-            for stock in portfolio.stocks:
-                if stock.company == ticker and stock.shares > amount:
-                    selling = stock
-            if amount == -1:
+            lots = portfolio.lots(ticker)
+            if len(lots) == 0:
+                print("You do not own any shares of " + ticker)
                 continue
-            shares = int(input("How many shares would you like to buy?"))
+            selling = max(lots,key=lambda stock: stock.shares)
+            shares = int(input("How many shares would you like to sell?"))
             date = datetime.datetime.now()
-            success = sell_stock(portfolio,shares,time,selling)
+            success = sell_stock(portfolio,shares,date,selling)
             if success:
                 print("Transation successful!")
                 print("You now have a balance of " + str(portfolio.cash))
@@ -448,4 +528,12 @@ def game() :
         else:
             print("Key Stroke not recognized")
 
-game()
+def main():
+    """
+    Runs the interactive game. This is the entry point of `python a3.py`;
+    importing a3 starts nothing and loads no network libraries.
+    """
+    game()
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,9 @@ Helper Functions + Classes for A3. (equivalent of introcs from old A3)
 """
 
 import math
+import heapq
+import array
+import bisect
 import datetime
 
 class Portfolio(object):
@@ -15,6 +18,12 @@ class Portfolio(object):
         stock - Any stock objects that the person will reside here.
         coins - a int representing how many BitCoins are owned; non-negative
 
+    The Portfolio also keeps an index from each ticker to a Position with the lots that
+    still hold shares of it and their total shares and cost basis, so looking up a
+    ticker does not scan every lot. Lots must be added with add_stock (not by
+    appending to stocks directly) for the index to see them; changes to an added
+    lot's shares, price, short flag or company update the index by themselves.
+
     The constructor can be called like this
     Portfolio(100.0)
     Which opens a new Portfolio with $100.0 in it.
@@ -68,16 +77,26 @@ class Portfolio(object):
     @property
     def stocks(self):
         """
-        The list of stocks that this Portfolio owns.
+        The list of stocks that this Portfolio owns. A LotStore can be used instead
+        of a list to keep large numbers of lots compactly.
 
-        **Invariant**: Value must be a List or None.
+        **Invariant**: Value must be a List, a LotStore or None.
         """
         return self._stocks
 
     @stocks.setter
     def stocks(self,value):
-        assert value is None or isinstance(value, list), f'{value} must be List or None'
+        assert value is None or isinstance(value, (list,LotStore)), f'{value} must be List, LotStore or None'
+        old = getattr(self,'_stocks',None)
+        if isinstance(old,list) and old is not value:
+            # Lots left behind stop telling this Portfolio about their changes.
+            for stock in old:
+                if stock._owner is self:
+                    stock._owner = None
+        elif isinstance(old,LotStore) and old is not value and old.owner is self:
+            old.owner = None
         self._stocks = value
+        self.reindex()
 
     @property
     def loans(self):
@@ -88,7 +107,7 @@ class Portfolio(object):
         """
         return self._loans
 
-    @stocks.setter
+    @loans.setter
     def loans(self,value):
         assert value is None or isinstance(value, list), f'{value} must be List or None'
         self._loans = value
@@ -120,6 +139,347 @@ class Portfolio(object):
         self.loans = []
         self.coins = 0
 
+    def add_stock(self,stock):
+        """
+        Returns: stock, after adding it to this Portfolio's stocks and ticker index.
+
+        If stocks is a LotStore, a copy of stock is added and the LotView of the copy is returned.
+
+        Parameter stock: the lot to add
+        Precondition: stock is a Stock object not held by another Portfolio
+        """
+        assert isinstance(stock,Stock), f'{stock} is not a Stock'
+        if isinstance(self._stocks,LotStore):
+            i = self._stocks.add(stock.company,stock.buy_price,stock.shares,stock.short,stock.buy_date)
+            return self._stocks[i]
+        assert stock._owner is None or stock._owner is self, f'{stock} belongs to another Portfolio'
+        self._stocks.append(stock)
+        stock._owner = self
+        self._index_lot(stock)
+        return stock
+
+    def position(self,ticker):
+        """
+        Returns: the Position of ticker, or None if no lot holds shares of it.
+        """
+        return self._positions.get(ticker)
+
+    def lots(self,ticker):
+        """
+        Returns: a list of the lots of ticker that still hold shares, in the order they were added.
+        """
+        position = self._positions.get(ticker)
+        return [] if position is None else list(position.lots)
+
+    def shares_of(self,ticker):
+        """
+        Returns: the total shares of ticker over every lot, as an int.
+        """
+        position = self._positions.get(ticker)
+        return 0 if position is None else position.shares
+
+    def cost_basis(self,ticker):
+        """
+        Returns: the sum of shares times buy_price over every lot of ticker, as a float.
+        """
+        position = self._positions.get(ticker)
+        return 0.0 if position is None else position.cost_basis
+
+    def tickers(self):
+        """
+        Returns: a list of the tickers this Portfolio holds shares of.
+        """
+        return list(self._positions)
+
+    # Objects told when this Portfolio starts or stops holding a ticker (opened/closed) and when the
+    # totals of a ticker's Position change (changed), e.g. an a3dividends.HolderIndex or a3nav.NavTracker.
+    _watchers = ()
+
+    def reindex(self):
+        """
+        Rebuilds the ticker index from stocks, e.g. after lots were appended to the list directly.
+        """
+        for ticker in list(getattr(self,'_positions',())):
+            self._drop_position(ticker)
+        self._positions = {}
+        if isinstance(self._stocks,LotStore):
+            self._stocks.owner = self
+        for stock in self._stocks or ():
+            if not isinstance(self._stocks,LotStore):
+                stock._owner = self
+            self._index_lot(stock)
+
+    def _index_lot(self,stock):
+        """
+        Adds stock to the Position of its ticker, unless it has no shares.
+        """
+        if stock.shares == 0:
+            return
+        position = self._positions.get(stock.company)
+        if position is None:
+            position = Position(stock.company)
+            self._positions[stock.company] = position
+            for watcher in self._watchers:
+                watcher.opened(self,stock.company)
+        position.add(stock)
+        self._changed(stock.company)
+
+    def _changed(self,ticker):
+        """
+        Tells the watchers that the totals of the Position of ticker changed.
+        """
+        for watcher in self._watchers:
+            watcher.changed(self,ticker)
+
+    def _drop_position(self,ticker):
+        """
+        Removes the Position of ticker from the index and tells the watchers.
+        """
+        del self._positions[ticker]
+        for watcher in self._watchers:
+            watcher.closed(self,ticker)
+
+    def _unindex_lot(self,stock):
+        """
+        Takes stock out of the Position of its ticker, if it is there.
+        """
+        position = self._positions.get(stock.company)
+        if position is not None and position.discard(stock):
+            if len(position.lots) == 0:
+                self._drop_position(stock.company)
+            else:
+                self._changed(stock.company)
+
+    def _reshare_lot(self,stock,old):
+        """
+        Updates the index after the shares of stock changed from old, keeping the lot's place in its Position.
+        """
+        position = self._positions.get(stock.company)
+        if position is None or stock not in position.lots:
+            self._index_lot(stock)
+        elif stock.shares == 0:
+            position.discard(stock,old)
+            if len(position.lots) == 0:
+                self._drop_position(stock.company)
+            else:
+                self._changed(stock.company)
+        else:
+            position.reshare(stock,old)
+            self._changed(stock.company)
+
+
+class Position(object):
+    """
+    The class Position is the total holding of one ticker in a Portfolio. It has 8 attributes.
+        ticker - A string representing the stock symbol
+        shares - A int representing the shares held over every lot, shorted or not
+        cost_basis - A float representing the sum of shares times buy_price over every lot
+        short_shares - A int representing the part of shares that is shorted
+        short_cost_basis - A float representing the part of cost_basis that is shorted
+        lots - A dict whose keys are the lots holding shares of ticker, in the order they were added
+        long_queue - A LotQueue of the lots that are not shorted, by buy date
+        short_queue - A LotQueue of the shorted lots, by buy date
+
+    Positions are kept by Portfolio and should not be changed directly.
+    """
+
+    def __init__(self,ticker):
+        """
+        :param ticker: the stock symbol
+        :type ticker:  ``str``
+        """
+        self.ticker = ticker
+        self.shares = 0
+        self.cost_basis = 0.0
+        self.short_shares = 0
+        self.short_cost_basis = 0.0
+        self.lots = {}
+        self.long_queue = LotQueue(self.lots)
+        self.short_queue = LotQueue(self.lots)
+
+    def queue(self,short):
+        """
+        Returns: the LotQueue of the shorted lots if short is True, else of the other lots.
+        """
+        return self.short_queue if short else self.long_queue
+
+    def add(self,stock):
+        """
+        Adds stock's shares and cost to the totals.
+        """
+        self.lots[stock] = self.queue(stock.short).push(stock)
+        cost = stock.shares*stock.buy_price
+        self.shares += stock.shares
+        self.cost_basis += cost
+        if stock.short:
+            self.short_shares += stock.shares
+            self.short_cost_basis += cost
+
+    def discard(self,stock,shares=None):
+        """
+        Returns: True if stock was in this Position and has been taken out of the totals.
+
+        shares is the number of shares stock was counted with, if not its shares now.
+        """
+        if stock not in self.lots:
+            return False
+        del self.lots[stock]
+        self.queue(stock.short).drop()
+        if shares is None:
+            shares = stock.shares
+        cost = shares*stock.buy_price
+        self.shares -= shares
+        self.cost_basis -= cost
+        if stock.short:
+            self.short_shares -= shares
+            self.short_cost_basis -= cost
+        if len(self.lots) == 0:
+            self.cost_basis = 0.0
+            self.short_cost_basis = 0.0
+        return True
+
+    def reshare(self,stock,old):
+        """
+        Moves the totals from old shares of stock to its shares now, leaving it in its place.
+        """
+        old_cost = old*stock.buy_price
+        cost = stock.shares*stock.buy_price
+        self.shares += stock.shares-old
+        self.cost_basis = self.cost_basis-old_cost+cost
+        if stock.short:
+            self.short_shares += stock.shares-old
+            self.short_cost_basis = self.short_cost_basis-old_cost+cost
+
+
+class LotQueue(object):
+    """
+    The class LotQueue keeps the lots of one side (shorted or not) of a Position
+    ordered by buy date. It has 2 attributes.
+        dates - A list of the buy dates of the entries, in increasing order
+        entries - A list of entries [lot, buy date], in the same order
+
+    An entry is live while the Position's lots dict maps its lot to it. Lots that
+    leave the Position are not searched for: their entries are dropped lazily, from
+    the front and back as they are passed and all at once when they outnumber the
+    live ones. So the oldest and newest live lots are found in amortized O(1), the
+    lots bought before a date are split off with one binary search, and the lot with
+    the highest buy price comes from a heap built the first time it is asked for.
+
+    LotQueues are kept by Position and should not be changed directly.
+    """
+
+    def __init__(self,lots):
+        """
+        :param lots: the lots dict of the Position, mapping each live lot to its entry
+        :type lots:  ``dict``
+        """
+        self.dates = []
+        self.entries = []
+        self._lots = lots
+        self._head = 0
+        self._live = 0
+        self._heap = None
+        self._pushed = 0
+
+    def __len__(self):
+        return self._live
+
+    def push(self,stock):
+        """
+        Returns: a new entry for stock, placed after every entry with the same or an earlier buy date.
+        """
+        date = stock.buy_date
+        entry = [stock,date]
+        if not self.dates or date >= self.dates[-1]:
+            self.dates.append(date)
+            self.entries.append(entry)
+        else:
+            i = bisect.bisect_right(self.dates,date)
+            self.dates.insert(i,date)
+            self.entries.insert(i,entry)
+            self._head = min(self._head,i)
+        self._live += 1
+        if self._heap is not None:
+            self._pushed += 1
+            heapq.heappush(self._heap,(-stock.buy_price,date,self._pushed,entry))
+        return entry
+
+    def drop(self):
+        """
+        Notes that one entry stopped being live, compacting when most entries are dead.
+        """
+        self._live -= 1
+        if len(self.entries) > 32 and 2*self._live < len(self.entries):
+            live = [entry for entry in self.entries if self._alive(entry)]
+            self.entries = live
+            self.dates = [entry[1] for entry in live]
+            self._head = 0
+            self._heap = None
+
+    def _alive(self,entry):
+        return self._lots.get(entry[0]) is entry
+
+    def oldest(self):
+        """
+        Yields: the live lots from the earliest buy date to the latest.
+        """
+        entries = self.entries
+        while self._head < len(entries) and not self._alive(entries[self._head]):
+            self._head += 1
+        for i in range(self._head,len(entries)):
+            if self._alive(entries[i]):
+                yield entries[i][0]
+
+    def newest(self):
+        """
+        Yields: the live lots from the latest buy date to the earliest.
+        """
+        entries = self.entries
+        while len(entries) > self._head and not self._alive(entries[-1]):
+            entries.pop()
+            self.dates.pop()
+        for i in range(len(entries)-1,self._head-1,-1):
+            if self._alive(entries[i]):
+                yield entries[i][0]
+
+    def highest_cost(self):
+        """
+        Yields: the live lots from the highest buy price to the lowest, the earliest first among equal prices.
+
+        Each lot yielded is taken off the heap and put back when the generator is
+        closed, so taking k lots costs O(k log n).
+        """
+        if self._heap is None:
+            self._heap = [(-entry[0].buy_price,entry[1],k,entry) for k, entry in enumerate(self.entries)
+                          if self._alive(entry)]
+            self._pushed = len(self.entries)
+            heapq.heapify(self._heap)
+        heap = self._heap
+        taken = []
+        try:
+            while heap:
+                item = heapq.heappop(heap)
+                if self._alive(item[3]):
+                    taken.append(item)
+                    yield item[3][0]
+        finally:
+            for item in taken:
+                heapq.heappush(heap,item)
+
+    def split(self,cutoff):
+        """
+        Returns: a tuple (before, after) of lists of the live lots bought before cutoff and
+        at or after it, each from the earliest buy date to the latest.
+
+        The line between the two is found with one binary search over the buy dates.
+        """
+        i = bisect.bisect_left(self.dates,cutoff)
+        entries = self.entries
+        lots = self._lots
+        before = [entry[0] for entry in entries[self._head:i] if lots.get(entry[0]) is entry]
+        after = [entry[0] for entry in entries[max(i,self._head):] if lots.get(entry[0]) is entry]
+        return before, after
+
 
 class Loan(object):
     """
@@ -217,7 +577,7 @@ class Stock(object):
     def company(self,value):
         assert type(value) == str, f'{value} is not a str'
         assert len(value) != 0, 'Company name must not be empty'
-        self._company = value
+        self._assign('_company',value)
 
     @property
     def shares(self):
@@ -232,7 +592,7 @@ class Stock(object):
     def shares(self,value):
         assert type(value) == int, f'{value} is not an int'
         assert value >= 0, f'{value} must not be negative'
-        self._shares = value
+        self._assign('_shares',value)
 
     @property
     def buy_price(self):
@@ -247,7 +607,7 @@ class Stock(object):
     def buy_price(self,value):
         assert type(value) == float, f'{value} is not a float'
         assert value >= 0, f'{value} must not be negative'
-        self._buy_price = value
+        self._assign('_buy_price',value)
 
     @property
     def buy_date(self):
@@ -261,7 +621,7 @@ class Stock(object):
     @buy_date.setter
     def buy_date(self,value):
         assert isinstance(value,datetime.datetime) , f'{value} is not a datetime object'
-        self._buy_date = value
+        self._assign('_buy_date',value)
 
     @property
     def short(self):
@@ -275,7 +635,7 @@ class Stock(object):
     @short.setter
     def short(self,value):
         assert type(value) == bool, f'{value} is not a bool'
-        self._short = value
+        self._assign('_short',value)
 
     def __init__(self,c,b,sa,so,t):
         """
@@ -299,3 +659,312 @@ class Stock(object):
         self.shares = sa
         self.short = so
         self.buy_date = t
+
+    # The Portfolio whose ticker index holds this lot, set by Portfolio.add_stock.
+    _owner = None
+
+    def _assign(self,name,value):
+        """
+        Sets the attribute `name` to value, keeping the owning Portfolio's index up to date.
+        """
+        owner = self._owner
+        if owner is None:
+            setattr(self,name,value)
+        elif name == '_shares':
+            old = self._shares
+            setattr(self,name,value)
+            owner._reshare_lot(self,old)
+        else:
+            owner._unindex_lot(self)
+            setattr(self,name,value)
+            owner._index_lot(self)
+
+
+# LotStore buy times count microseconds from here.
+_EPOCH = datetime.datetime(1970,1,1)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+class LotStore(object):
+    """
+    The class LotStore holds many stock lots in typed arrays instead of one Stock object each.
+
+    Each lot is one row across five columns
+        ticker id - an unsigned int indexing the table of company symbols
+        shares - a signed 64-bit int
+        buy price - a double
+        buy time - a signed 64-bit int, microseconds from 1970-01-01 to the (naive) buy date
+        short flag - a signed char, 1 if shorted
+
+    The buy time counts wall-clock microseconds, with no time zone, so every buy date
+    (even one in the hour repeated when clocks go back) reads back exactly as it was given.
+
+    A LotStore can be used wherever a list of Stock objects is used: append adds a lot,
+    iterating or indexing gives LotView objects, which are Stock objects whose attributes
+    read and write the arrays, and remove/compact drop lots.
+
+    Indexes (and the views holding them) stay valid until a lot is removed; compact()
+    drops every lot that has no shares left in one pass.
+
+    The constructor can be called like this
+    LotStore()
+    Which creates an empty store.
+    """
+
+    def __init__(self):
+        # The Portfolio using this store as its stocks, if any; it is told about every change.
+        self.owner = None
+        self._tickers = []
+        self._ticker_ids = {}
+        self._ticker = array.array('I')
+        self._shares = array.array('q')
+        self._buy_price = array.array('d')
+        self._buy_time = array.array('q')
+        self._short = array.array('b')
+
+    def __len__(self):
+        return len(self._shares)
+
+    def __getitem__(self,i):
+        """
+        Returns: a LotView of the lot at index i.
+        """
+        if i < 0:
+            i += len(self._shares)
+        if not 0 <= i < len(self._shares):
+            raise IndexError('lot index out of range')
+        return LotView(self,i)
+
+    def __iter__(self):
+        for i in range(len(self._shares)):
+            yield LotView(self,i)
+
+    def ticker_id(self,company):
+        """
+        Returns: the id of company in the ticker table, adding it if it is new.
+        """
+        tid = self._ticker_ids.get(company)
+        if tid is None:
+            assert type(company) == str, f'{company} is not a str'
+            assert len(company) != 0, 'Company name must not be empty'
+            tid = len(self._tickers)
+            self._tickers.append(company)
+            self._ticker_ids[company] = tid
+        return tid
+
+    def add(self,c,b,sa,so,t):
+        """
+        Returns: the index of a new lot, made from the same arguments as the Stock constructor.
+
+        :param c: company ticker
+        :type c:  str, len(c) > 0
+
+        :param b: buy_price
+        :type b:  ``float`` >=0
+
+        :param sa: shares
+        :type sa:  ``int`` >=0
+
+        :param so: short value
+        :type so:  ``bool``
+
+        :param t: buy date
+        :type t:  ``datetime``
+        """
+        assert type(b) == float, f'{b} is not a float'
+        assert b >= 0, f'{b} must not be negative'
+        assert type(sa) == int, f'{sa} is not an int'
+        assert sa >= 0, f'{sa} must not be negative'
+        assert type(so) == bool, f'{so} is not a bool'
+        assert isinstance(t,datetime.datetime), f'{t} is not a datetime object'
+        self._ticker.append(self.ticker_id(c))
+        self._shares.append(sa)
+        self._buy_price.append(b)
+        self._buy_time.append((t-_EPOCH)//_MICROSECOND)
+        self._short.append(1 if so else 0)
+        if self.owner is not None:
+            self.owner._index_lot(LotView(self,len(self._shares)-1))
+        return len(self._shares)-1
+
+    def append(self,stock):
+        """
+        Adds a copy of stock to the store, as list.append would add stock to a list.
+
+        Parameter stock: the lot to add
+        Precondition: stock is a Stock object
+        """
+        assert isinstance(stock,Stock), f'{stock} is not a Stock'
+        self.add(stock.company,stock.buy_price,stock.shares,stock.short,stock.buy_date)
+
+    def sell(self,i,shares):
+        """
+        Returns: the number of shares removed from lot i, which is at most the shares it holds.
+
+        Parameter i: the index of the lot
+        Precondition: i is a valid index
+
+        Parameter shares: the number of shares to sell
+        Precondition: shares is a non-negative int
+        """
+        assert type(shares) == int and shares >= 0
+        lot = LotView(self,i)
+        sold = min(lot.shares,shares)
+        lot.shares = lot.shares-sold
+        return sold
+
+    def remove(self,stock):
+        """
+        Removes the lot stock refers to, as list.remove would. Later indexes shift down by one.
+
+        Parameter stock: a lot in this store
+        Precondition: stock is a LotView of this store
+        """
+        assert isinstance(stock,LotView) and stock.store is self, f'{stock} is not in this store'
+        for column in self._columns():
+            del column[stock.index]
+        if self.owner is not None:
+            self.owner.reindex()
+
+    def compact(self):
+        """
+        Returns: the number of lots removed.
+
+        Removes every lot with no shares left, keeping the order of the others.
+        """
+        keep = [i for i, n in enumerate(self._shares) if n != 0]
+        removed = len(self._shares)-len(keep)
+        if removed:
+            for column in self._columns():
+                kept = array.array(column.typecode,(column[i] for i in keep))
+                del column[:]
+                column.extend(kept)
+            if self.owner is not None:
+                self.owner.reindex()
+        return removed
+
+    def tickers(self):
+        """
+        Returns: a list of the companies that have ever had a lot in this store.
+        """
+        return list(self._tickers)
+
+    def total_shares(self,company):
+        """
+        Returns: the total shares held over every lot of company, as an int.
+        """
+        tid = self._ticker_ids.get(company)
+        if tid is None:
+            return 0
+        return sum(n for t, n in zip(self._ticker,self._shares) if t == tid)
+
+    def nbytes(self):
+        """
+        Returns: the bytes used by the lot columns, not counting the ticker table.
+        """
+        return sum(column.itemsize*len(column) for column in self._columns())
+
+    def bytes_per_lot(self):
+        """
+        Returns: the bytes each lot takes in the columns, as an int.
+        """
+        return sum(column.itemsize for column in self._columns())
+
+    def _columns(self):
+        return (self._ticker,self._shares,self._buy_price,self._buy_time,self._short)
+
+
+class LotView(Stock):
+    """
+    The class LotView is a Stock whose attributes are one row of a LotStore.
+
+    It has the same attributes and invariants as Stock, plus
+        store - the LotStore the lot belongs to
+        index - the row of the lot in store
+
+    Reading an attribute reads the arrays and setting one writes them, so changing
+    `shares` on a view (as a3.sell_stock does) changes the store.
+    """
+    @property
+    def company(self):
+        return self.store._tickers[self.store._ticker[self.index]]
+
+    @company.setter
+    def company(self,value):
+        self._assign('_ticker',self.store.ticker_id(value))
+
+    @property
+    def shares(self):
+        return self.store._shares[self.index]
+
+    @shares.setter
+    def shares(self,value):
+        assert type(value) == int, f'{value} is not an int'
+        assert value >= 0, f'{value} must not be negative'
+        self._assign('_shares',value)
+
+    @property
+    def buy_price(self):
+        return self.store._buy_price[self.index]
+
+    @buy_price.setter
+    def buy_price(self,value):
+        assert type(value) == float, f'{value} is not a float'
+        assert value >= 0, f'{value} must not be negative'
+        self._assign('_buy_price',value)
+
+    @property
+    def buy_date(self):
+        return _EPOCH+datetime.timedelta(microseconds=self.store._buy_time[self.index])
+
+    @buy_date.setter
+    def buy_date(self,value):
+        assert isinstance(value,datetime.datetime) , f'{value} is not a datetime object'
+        self._assign('_buy_time',(value-_EPOCH)//_MICROSECOND)
+
+    @property
+    def short(self):
+        return self.store._short[self.index] == 1
+
+    @short.setter
+    def short(self,value):
+        assert type(value) == bool, f'{value} is not a bool'
+        self._assign('_short',1 if value else 0)
+
+    @property
+    def _owner(self):
+        return self.store.owner
+
+    def _assign(self,name,value):
+        """
+        Sets the store column `name` at this lot's row to value, keeping the owning
+        Portfolio's index up to date.
+        """
+        owner = self.store.owner
+        column = getattr(self.store,name)
+        if owner is None:
+            column[self.index] = value
+        elif name == '_shares':
+            old = column[self.index]
+            column[self.index] = value
+            owner._reshare_lot(self,old)
+        else:
+            owner._unindex_lot(self)
+            column[self.index] = value
+            owner._index_lot(self)
+
+    def __init__(self,store,index):
+        """
+        :param store: the store holding the lot
+        :type store:  ``LotStore``
+
+        :param index: the row of the lot
+        :type index:  ``int``
+        """
+        self.store = store
+        self.index = index
+
+    def __eq__(self,other):
+        return isinstance(other,LotView) and other.store is self.store and other.index == self.index
+
+    def __hash__(self):
+        return hash((id(self.store),self.index))
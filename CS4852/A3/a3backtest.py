@@ -0,0 +1,320 @@
+"""
+Backtesting for A3.
+
+run_backtest walks a portfolio through a span of history one event at a time. An
+event is a timestamp at which at least one symbol has a price (a daily close in an
+a3history.HistoryStore, a tick in an a3prices.ReplaySource). At every event
+
+    1. the prices of the symbols that tick at or before the time the strategy trades
+       at are updated,
+    2. dividends due by then are paid with a3dividends.distribute,
+    3. the strategy runs, trading through the ordinary a3 functions,
+    4. the rest of the event's ticks (and dividends) are applied,
+    5. the equity of the portfolio is added to the equity curve.
+
+With a trade time of day, steps 1 to 3 happen only at the first event of each day
+at or after that time; the other events only apply their ticks and add to the curve.
+A strategy trading at 15:59 on the date of a 4 pm close so trades at the previous
+close; the close of the day is only seen by the equity curve and the next event.
+
+Prices are served by a BacktestFeed installed with a3helpers.set_price_source, so
+buy_stock, sell_stock and the rest see the price as of the simulated time without
+any change. The feed merges the series of every symbol into one stream of ticks
+(heapq.merge over the columnar arrays) once, and keeps the current price of each
+symbol in a dict, so each tick is applied once and every price read is a dict
+lookup; nothing is searched or recomputed per event.
+
+Equity is what selling everything at the current prices would return under a3's
+own sale rules (a3._sale_proceeds, taxes included, commissions left out), plus cash
+and BitCoin at the BTC_SYMBOL price if the source has one.
+"""
+
+import heapq
+import array
+import bisect
+import itertools
+import time as timer
+import datetime
+import a3
+import a3dividends
+import a3helpers
+import a3prices
+
+
+class BacktestFeed(a3prices.PriceSource):
+    """
+    The class BacktestFeed serves prices as of the current event of a backtest.
+
+    It reads the (timestamps, prices) arrays of each symbol from a source with a
+    series(symbol) method, such as an a3history.HistoryStore or an a3prices.ReplaySource.
+    advance() moves it to the next event, and move_to() to any time before it. Before
+    the first event each symbol is priced at its last tick before start, if it has one.
+
+    The constructor can be called like this
+    BacktestFeed(store,["IBM","MSFT"],datetime.datetime(2015,1,1),datetime.datetime(2019,12,31))
+    """
+
+    def __init__(self,source,symbols,start,end):
+        """
+        :param source: where the price series come from
+        :type source:  object with a series(symbol) method
+
+        :param symbols: the symbols to serve
+        :type symbols:  iterable of ``str``
+
+        :param start: the first time an event can happen at
+        :type start:  ``datetime`` or seconds since the epoch
+
+        :param end: the last time an event can happen at
+        :type end:  ``datetime`` or seconds since the epoch
+        """
+        super().__init__()
+        self.source = source
+        self.stamp = None
+        self._prices = {}
+        first = a3prices.to_timestamp(start)
+        last = a3prices.to_timestamp(end)
+        streams = []
+        for symbol in symbols:
+            times, prices = source.series(symbol)
+            i = bisect.bisect_left(times,first)
+            j = bisect.bisect_right(times,last)
+            if i > 0:
+                self._prices[symbol] = prices[i-1]
+            streams.append(zip(times[i:j],itertools.repeat(symbol),prices[i:j]))
+        self._ticks = heapq.merge(*streams,key=lambda tick: tick[0])
+        self._next = next(self._ticks,None)
+
+    def upcoming(self):
+        """
+        Returns: the timestamp of the next event as an int, or None when there are no more.
+
+        Nothing is applied.
+        """
+        return None if self._next is None else self._next[0]
+
+    def move_to(self,stamp):
+        """
+        Applies every tick at or before stamp, which becomes the current time of the feed.
+
+        Parameter stamp: the time to move to, in seconds since the epoch
+        Precondition: stamp is an int, not before the current time of the feed
+        """
+        assert self.stamp is None or stamp >= self.stamp, f'{stamp} is before the current time'
+        tick = self._next
+        prices = self._prices
+        ticks = self._ticks
+        while tick is not None and tick[0] <= stamp:
+            prices[tick[1]] = tick[2]
+            tick = next(ticks,None)
+        self._next = tick
+        self.stamp = stamp
+
+    def advance(self):
+        """
+        Returns: the timestamp of the next event as an int, or None when there are no more.
+
+        Applies every tick at that timestamp.
+        """
+        stamp = self.upcoming()
+        if stamp is not None:
+            self.move_to(stamp)
+        return stamp
+
+    def prices(self):
+        """
+        Returns: a dict mapping every symbol priced so far to its current price. Do not modify it.
+        """
+        return self._prices
+
+    def price(self,symbol):
+        """
+        Returns: the current price of symbol as a float.
+
+        Raises KeyError if symbol has had no tick yet.
+        """
+        prices = self._prices
+        if symbol in prices:
+            return prices[symbol]
+        upper = symbol.upper()
+        if upper in prices:
+            return prices[upper]
+        raise KeyError(f'no price for {symbol} yet')
+
+    def price_at(self,symbol,time):
+        """
+        Returns: the price of symbol at time as a float; None means the current price.
+
+        Times after the current time of the feed are refused, so a strategy cannot look ahead.
+        """
+        if time is None:
+            return self.price(symbol)
+        stamp = a3prices.to_timestamp(time)
+        assert self.stamp is None or stamp <= self.stamp, f'{time} is after the current event'
+        if stamp == self.stamp:
+            return self.price(symbol)
+        return self.source.price_at(symbol,stamp)
+
+
+class BacktestResult(object):
+    """
+    The class BacktestResult is the outcome of run_backtest. It has 5 attributes.
+        times - An array('q') with the timestamp of every event
+        equity - An array('d') with the equity of the portfolio after every event
+        cash - An array('d') with the cash of the portfolio after every event
+        dividends - A int representing how many lots were paid a dividend
+        seconds - A float representing the wall-clock time of the run
+    """
+
+    def __init__(self,times,equity,cash,dividends,seconds):
+        self.times = times
+        self.equity = equity
+        self.cash = cash
+        self.dividends = dividends
+        self.seconds = seconds
+
+    def curve(self):
+        """
+        Returns: the equity curve as a list of (datetime, equity) pairs.
+        """
+        return [(a3prices.from_timestamp(stamp),value) for stamp, value in zip(self.times,self.equity)]
+
+    def summary(self):
+        """
+        Returns: a dict with the number of events, first and last equity, total return,
+        maximum drawdown (as a fraction of the peak) and events per second.
+        """
+        peak = None
+        drawdown = 0.0
+        for value in self.equity:
+            if peak is None or value > peak:
+                peak = value
+            elif peak > 0:
+                drawdown = max(drawdown,(peak-value)/peak)
+        first = self.equity[0] if self.equity else 0.0
+        last = self.equity[-1] if self.equity else 0.0
+        return {'events': len(self.times), 'start_equity': first, 'end_equity': last,
+                'total_return': last/first-1.0 if first else 0.0, 'max_drawdown': drawdown,
+                'dividends': self.dividends, 'seconds': self.seconds,
+                'events_per_second': len(self.times)/self.seconds if self.seconds else float('inf')}
+
+
+def equity(portfolio,time,prices):
+    """
+    Returns: the equity of portfolio at time as a float.
+
+    This is its cash, plus what selling every lot at its price in prices would return
+    under a3's sale rules (after tax, before commissions), plus its BitCoin at the
+    BTC_SYMBOL price. Lots and coins without a price are left out.
+
+    Parameter portfolio: the portfolio to value
+    Precondition: portfolio is a Portfolio object
+
+    Parameter time: when the portfolio is valued (decides long- or short-term tax)
+    Precondition: time is a datetime object
+
+    Parameter prices: the price of each symbol
+    Precondition: prices is a dict mapping symbol strs to floats
+    """
+    value = portfolio.cash
+    for ticker in portfolio.tickers():
+        price = prices.get(ticker)
+        if price is None:
+            continue
+        for lot in portfolio.lots(ticker):
+            value += a3._sale_proceeds(lot,lot.shares,time,price)
+    if portfolio.coins:
+        value += portfolio.coins*prices.get(a3helpers.BTC_SYMBOL,0.0)
+    return value
+
+
+def run_backtest(portfolio,source,strategy,start,end,symbols=None,dividends=None,trade_time=None):
+    """
+    Returns: a BacktestResult for portfolio run through strategy from start to end.
+
+    The portfolio is changed in place. While the backtest runs, a BacktestFeed is the
+    price source of a3helpers; the one installed before is put back at the end.
+
+    Parameter portfolio: the portfolio to trade
+    Precondition: portfolio is a Portfolio object
+
+    Parameter source: where the price series come from
+    Precondition: source has series(symbol) and symbols() methods, e.g. a HistoryStore or ReplaySource
+
+    Parameter strategy: called as strategy(portfolio, time) to trade through a3, once per event
+    or, with trade_time, once per day;
+    lots it buys must be added with portfolio.add_stock to be valued and paid dividends
+    Precondition: strategy is a function
+
+    Parameter start: the first time of the backtest
+    Precondition: start is a datetime object
+
+    Parameter end: the last time of the backtest
+    Precondition: end is a datetime object
+
+    Parameter symbols: the symbols to load; None loads every symbol of source
+    Precondition: symbols is an iterable of strs or None
+
+    Parameter dividends: the dividends paid during the backtest; each is paid on the first event
+    at or after its time, to every long lot of its symbol
+    Precondition: dividends is None or a dict mapping symbol strs to iterables of
+    (time, payment per share) pairs, with time a datetime object and payment a non-negative float
+
+    Parameter trade_time: the time of day strategy trades at; None means at the time of every event.
+    The strategy runs at the first event of each day at or after trade_time, at trade_time on
+    that date, and is served the last tick at or before trade_time; a day with no event from
+    trade_time on is not traded. Daily closes in a HistoryStore fall at 4 pm, when a3 no longer trades, so daily
+    backtests should pass e.g. datetime.time(15,59), and then trade at the previous close
+    Precondition: trade_time is a datetime.time object or None
+    """
+    assert isinstance(start,datetime.datetime) and isinstance(end,datetime.datetime)
+    assert trade_time is None or isinstance(trade_time,datetime.time)
+    symbols = list(source.symbols() if symbols is None else symbols)
+    first = a3prices.to_timestamp(start)
+    due = []
+    for symbol, payments in (dividends or {}).items():
+        for time, payment in payments:
+            stamp = a3prices.to_timestamp(time)
+            if stamp >= first:
+                due.append((stamp,symbol,payment))
+    due.sort(key=lambda item: item[0])
+    feed = BacktestFeed(source,symbols,start,end)
+    prices = feed.prices()
+    times = array.array('q')
+    curve = array.array('d')
+    cash = array.array('d')
+    paid = 0
+    next_due = 0
+    began = timer.perf_counter()
+
+    def move_to(until):
+        # Applies the ticks and pays the dividends up to until.
+        nonlocal paid, next_due
+        feed.move_to(until)
+        feed.time = a3prices.from_timestamp(until)
+        while next_due < len(due) and due[next_due][0] <= until:
+            _, symbol, payment = due[next_due]
+            paid += a3dividends.distribute(symbol,payment,[portfolio])[1]
+            next_due += 1
+
+    previous = a3helpers.set_price_source(feed)
+    try:
+        traded = None
+        stamp = feed.upcoming()
+        while stamp is not None:
+            now = a3prices.from_timestamp(stamp)
+            when = now if trade_time is None else datetime.datetime.combine(now.date(),trade_time)
+            if when <= now and (trade_time is None or traded != now.date()):
+                # The strategy only sees ticks at or before the time it trades at. Every earlier
+                # event is before trade_time on this date, so the feed never moves back.
+                move_to(a3prices.to_timestamp(when))
+                strategy(portfolio,when)
+                traded = now.date()
+            move_to(stamp)
+            times.append(stamp)
+            curve.append(equity(portfolio,now,prices))
+            cash.append(portfolio.cash)
+            stamp = feed.upcoming()
+    finally:
+        a3helpers.set_price_source(previous)
+    return BacktestResult(times,curve,cash,paid,timer.perf_counter()-began)
@@ -0,0 +1,520 @@
+"""
+Benchmarks for A3.
+
+Run from this folder with
+
+    python a3bench.py                        the targeted benchmarks below
+    python a3bench.py suite [results.json]   every public function, saved as JSON
+    python a3bench.py compare old.json new.json
+
+The suite times each public function of a3 and a3helpers call by call against
+portfolios of several sizes and reports ops/sec and latency percentiles. compare
+lists the functions whose median latency got worse between two saved runs, so
+regressions between versions can be caught.
+
+Every benchmark runs offline against the key == "TEST" stand-in prices.
+"""
+
+import os
+import sys
+import json
+import math
+import subprocess
+import time
+import random
+import asyncio
+import datetime
+import platform
+import tracemalloc
+import a3
+import a3assets
+import a3calendar
+import a3helpers
+import a3taxes
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def best_of(fn,repeat=3):
+    """
+    Returns: the fastest of `repeat` runs of fn() in seconds, as a float.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best,time.perf_counter()-start)
+    return best
+
+
+#-------------------------------------- Suite --------------------------------------
+SIZES = (10,1000,10000)
+CALLS = 2000
+PERCENTILES = (50,90,99)
+# A Monday during trading hours, and a lot bought more than a year before it.
+TRADE_TIME = datetime.datetime(2019,3,4,11)
+OLD_TIME = datetime.datetime(2017,3,6,11)
+
+
+def percentile(ordered,p):
+    """
+    Returns: the p-th percentile of the sorted list ordered, by the nearest-rank method.
+    """
+    k = max(0,min(len(ordered)-1,math.ceil(p/100*len(ordered))-1))
+    return ordered[k]
+
+
+def measure(call,calls=CALLS,setup=None):
+    """
+    Returns: a dict with ops/sec and latency percentiles (in microseconds) of call().
+
+    call is run `calls` times after a few warm-up calls; setup(), if given, runs
+    untimed before every call to put back any state the call used up.
+    """
+    for _ in range(min(calls,50)):
+        if setup is not None:
+            setup()
+        call()
+    latencies = []
+    clock = time.perf_counter_ns
+    for _ in range(calls):
+        if setup is not None:
+            setup()
+        start = clock()
+        call()
+        latencies.append(clock()-start)
+    latencies.sort()
+    total = sum(latencies)
+    result = {'calls': calls, 'ops_per_sec': calls*1e9/total if total else float('inf'),
+              'mean_us': total/calls/1000}
+    for p in PERCENTILES:
+        result['p'+str(p)+'_us'] = percentile(latencies,p)/1000
+    return result
+
+
+def make_portfolio(size):
+    """
+    Returns: a Portfolio with plenty of cash holding `size` lots over 10 tickers.
+    """
+    portfolio = a3assets.Portfolio(1e12)
+    for i in range(size):
+        portfolio.add_stock(a3assets.Stock("T"+str(i % 10),1.0,100,i % 7 == 0,OLD_TIME))
+    return portfolio
+
+
+def suite_cases(portfolio):
+    """
+    Returns: a list of (name, call, setup) for every public function, run against portfolio.
+    """
+    lot = portfolio.add_stock(a3assets.Stock("CORNELL",10.0,10**9,False,OLD_TIME))
+    loan = a3assets.Loan(1200.0,12)
+    loop = asyncio.new_event_loop()
+
+    def reset_rate():
+        portfolio.loan_rate = 0.1
+
+    def reset_loan():
+        loan.balance = 1200.0
+        loan.length = 12
+
+    return [
+        ('a3.open_portfolio',lambda: a3.open_portfolio(1000.0,1.0),None),
+        ('a3.invest_BitCoin',lambda: a3.invest_BitCoin(portfolio,1),None),
+        ('a3.sell_BitCoin',lambda: a3.sell_BitCoin(portfolio,1),None),
+        ('a3.compute_interest',lambda: a3.compute_interest(portfolio,0.0,1.0,12.0),None),
+        ('a3.take_loan',lambda: a3.take_loan(portfolio,100.0,1),reset_rate),
+        ('a3.pay_loan',lambda: a3.pay_loan(portfolio,loan),reset_loan),
+        ('a3.calculate_taxes',lambda: a3.calculate_taxes(123456.0,False),None),
+        ('a3.buy_stock',lambda: a3.buy_stock(portfolio,"CORNELL",5,False,TRADE_TIME),None),
+        ('a3.pay_dividends',lambda: a3.pay_dividends(portfolio,lot,"CORNELL",0.5),None),
+        ('a3.sell_stock',lambda: a3.sell_stock(portfolio,1,TRADE_TIME,lot),None),
+        ('a3.invest_BitCoin_async',lambda: loop.run_until_complete(a3.invest_BitCoin_async(portfolio,1)),None),
+        ('a3.sell_BitCoin_async',lambda: loop.run_until_complete(a3.sell_BitCoin_async(portfolio,1)),None),
+        ('a3.buy_stock_async',lambda: loop.run_until_complete(a3.buy_stock_async(portfolio,"CORNELL",5,False,TRADE_TIME)),None),
+        ('a3.sell_stock_async',lambda: loop.run_until_complete(a3.sell_stock_async(portfolio,1,TRADE_TIME,lot)),None),
+        ('a3helpers.is_weekday',lambda: a3helpers.is_weekday(TRADE_TIME),None),
+        ('a3helpers.one_year_ago',lambda: a3helpers.one_year_ago(TRADE_TIME),None),
+        ('a3helpers.get_stock_price',lambda: a3helpers.get_stock_price("CORNELL"),None),
+        ('a3helpers.get_BTC_price',lambda: a3helpers.get_BTC_price(),None),
+        ('a3helpers.get_stock_prices',lambda: a3helpers.get_stock_prices(portfolio.tickers()),None),
+        ('a3helpers.get_stock_price_async',lambda: loop.run_until_complete(a3helpers.get_stock_price_async("CORNELL")),None),
+        ('a3helpers.get_BTC_price_async',lambda: loop.run_until_complete(a3helpers.get_BTC_price_async()),None),
+        ('a3helpers.get_stock_prices_async',lambda: loop.run_until_complete(a3helpers.get_stock_prices_async(portfolio.tickers())),None),
+    ], loop
+
+
+def run_suite(sizes=SIZES,calls=CALLS,names=None):
+    """
+    Returns: a dict of results, ready to be saved with save_results.
+
+    results['functions'][name][str(size)] is the measure dict of function name run
+    against a portfolio holding `size` lots.
+
+    Parameter sizes: the portfolio sizes, in lots
+    Precondition: sizes is a sequence of non-negative ints
+
+    Parameter calls: timed calls per function and size
+    Precondition: calls is a positive int
+
+    Parameter names: only run the functions whose names are listed, or every function if None
+    Precondition: names is a collection of strs or None
+    """
+    key, source = a3helpers.key, a3helpers.set_price_source(None)
+    a3helpers.key = "TEST"
+    functions = {}
+    try:
+        for size in sizes:
+            cases, loop = suite_cases(make_portfolio(size))
+            try:
+                for name, call, setup in cases:
+                    if names is None or name in names:
+                        functions.setdefault(name,{})[str(size)] = measure(call,calls,setup)
+            finally:
+                loop.close()
+    finally:
+        a3helpers.key = key
+        a3helpers.set_price_source(source)
+    return {'meta': {'python': platform.python_version(), 'platform': platform.platform(),
+                     'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                     'sizes': list(sizes), 'calls': calls},
+            'functions': functions}
+
+
+def save_results(results,path):
+    """
+    Writes the results of run_suite to path as JSON.
+    """
+    with open(path,"w") as out:
+        json.dump(results,out,indent=2,sort_keys=True)
+
+
+def load_results(path):
+    """
+    Returns: the results saved at path by save_results.
+    """
+    with open(path) as source:
+        return json.load(source)
+
+
+def compare(old,new,threshold=0.10,metric='p50_us'):
+    """
+    Returns: a list of (name, size, old value, new value, change) for every function and
+    size whose metric grew by more than threshold (0.10 is 10%), worst first.
+
+    Parameter old, new: results from run_suite or load_results
+    Precondition: both are result dicts
+    """
+    regressions = []
+    for name, sizes in new['functions'].items():
+        for size, result in sizes.items():
+            before = old['functions'].get(name,{}).get(size)
+            if before is None or before[metric] == 0:
+                continue
+            change = result[metric]/before[metric]-1
+            if change > threshold:
+                regressions.append((name,size,before[metric],result[metric],change))
+    regressions.sort(key=lambda row: -row[4])
+    return regressions
+
+
+def print_results(results):
+    """
+    Prints a table of ops/sec and latency percentiles from run_suite.
+    """
+    print(f"{'function':36} {'lots':>6} {'ops/sec':>12} " + " ".join(f"{'p'+str(p)+' us':>9}" for p in PERCENTILES))
+    for name, sizes in results['functions'].items():
+        for size, result in sizes.items():
+            print(f"{name:36} {size:>6} {result['ops_per_sec']:>12.0f} " +
+                  " ".join(f"{result['p'+str(p)+'_us']:>9.2f}" for p in PERCENTILES))
+
+
+def bench_calculate_taxes(n=1000000,seed=4852):
+    """
+    Returns: a dict comparing a3.calculate_taxes called in a loop against
+    a3taxes.after_tax_array on the same n profits.
+
+    The profits are spread over every bracket and about half are long-term. The
+    two results are checked to be exactly equal before timing.
+    """
+    assert numpy is not None, 'NumPy is required for this benchmark'
+    rng = random.Random(seed)
+    profits = [rng.uniform(-1000.0,20000000.0) for _ in range(n)]
+    long_term = [rng.random() < 0.5 for _ in range(n)]
+    profit_array = numpy.array(profits)
+    mask = numpy.array(long_term)
+
+    def loop():
+        return [a3.calculate_taxes(p,l) for p, l in zip(profits,long_term)]
+
+    def vector():
+        return a3taxes.after_tax_array(profit_array,mask)
+
+    assert numpy.array_equal(numpy.array(loop()),vector()), 'vectorized taxes differ from calculate_taxes'
+    loop_time = best_of(loop)
+    vector_time = best_of(vector)
+    return {'n': n, 'loop_seconds': loop_time, 'vector_seconds': vector_time,
+            'speedup': loop_time/vector_time}
+
+
+def bench_calendar(n=1000000,seed=4852):
+    """
+    Returns: a dict comparing the old inline trading-hours check (is_weekday and the
+    hour) in a loop against a3calendar's table lookup in a loop and its array check,
+    on the same n times.
+
+    The three answers are checked to be equal before timing.
+    """
+    assert numpy is not None, 'NumPy is required for this benchmark'
+    rng = random.Random(seed)
+    start = datetime.datetime(2015,1,1)
+    times = [start+datetime.timedelta(seconds=rng.randrange(10*365*86400)) for _ in range(n)]
+    stamps = numpy.array(times,dtype='datetime64[s]')
+    calendar = a3calendar.MarketCalendar()
+
+    def inline():
+        return [a3helpers.is_weekday(t) and t.hour >= 10 and t.hour < 16 for t in times]
+
+    def table():
+        return [calendar.is_open(t) for t in times]
+
+    def vector():
+        return calendar.is_open_array(stamps)
+
+    assert inline() == table() == vector().tolist(), 'calendar differs from the inline check'
+    inline_time = best_of(inline)
+    table_time = best_of(table)
+    vector_time = best_of(vector)
+    return {'n': n, 'inline_seconds': inline_time, 'table_seconds': table_time,
+            'vector_seconds': vector_time, 'speedup': inline_time/vector_time}
+
+
+def allocated_by(fn):
+    """
+    Returns: a tuple (result of fn(), bytes still allocated by that call).
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = fn()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after-before
+
+
+def bench_lot_store(n=200000,seed=4852):
+    """
+    Returns: a dict comparing n lots kept as a list of a3assets.Stock objects
+    against the same lots in an a3assets.LotStore: bytes per lot and the time to
+    sum the shares of every lot.
+    """
+    rng = random.Random(seed)
+    start = datetime.datetime(2020,1,1)
+    rows = [("T"+str(rng.randrange(500)),rng.uniform(1.0,500.0),rng.randrange(1,1000),
+             rng.random() < 0.1,start+datetime.timedelta(minutes=rng.randrange(1000000)))
+            for _ in range(n)]
+
+    def make_list():
+        return [a3assets.Stock(*row) for row in rows]
+
+    def make_store():
+        store = a3assets.LotStore()
+        for row in rows:
+            store.add(*row)
+        return store
+
+    stocks, list_bytes = allocated_by(make_list)
+    store, store_bytes = allocated_by(make_store)
+    return {'n': n, 'list_bytes_per_lot': list_bytes/n, 'store_bytes_per_lot': store_bytes/n,
+            'store_column_bytes_per_lot': store.bytes_per_lot(),
+            'list_iterate_seconds': best_of(lambda: sum(s.shares for s in stocks)),
+            'store_iterate_seconds': best_of(lambda: sum(s.shares for s in store))}
+
+
+def bench_loan_book(n=100000,months=12,seed=4852):
+    """
+    Returns: a dict with the seconds a3loans.LoanBook takes to run one month-end,
+    and `months` month-ends with a recorded schedule, over n loans of n portfolios.
+    """
+    import a3loans
+    assert numpy is not None, 'NumPy is required for this benchmark'
+    rng = numpy.random.default_rng(seed)
+
+    def book():
+        return a3loans.LoanBook(rng.uniform(100.0,5000.0,n),rng.integers(1,60,n),numpy.full(n,100.0),
+                                numpy.arange(n),rng.uniform(0.0,5000.0,n),numpy.full(n,0.1))
+
+    return {'n': n, 'months': months,
+            'month_end_seconds': best_of(lambda: book().advance(1)),
+            'schedule_seconds': best_of(lambda: book().advance(months,record=True))}
+
+
+def bench_contention(threads=(1,2,4,8,16),rounds=40000):
+    """
+    Returns: a list with a dict for each thread count in threads: the trades per second
+    of `rounds` buy-then-sell rounds split over that many threads, all on one shared
+    portfolio through a3sync, each thread on its own portfolio through a3sync, and on one
+    shared portfolio through the unsynchronized a3 functions. For the unsynchronized run
+    it also gives how far its cash is off from the rounds that finished, in dollars, and
+    how many rounds raised because the portfolio's index was corrupted.
+
+    Every round buys one share at the TEST price of $1 and sells it at the same price,
+    so it costs exactly three commission fees and nothing is taxed; the synchronized runs
+    are checked to end with exactly the cash their rounds account for.
+    """
+    import threading
+    import a3sync
+
+    def unsafe(portfolio,count,tally):
+        for _ in range(count):
+            try:
+                stock = a3.buy_stock(portfolio,"T",1,False,TRADE_TIME)
+                portfolio.add_stock(stock)
+                a3.sell_stock(portfolio,1,TRADE_TIME,stock)
+                tally.append(True)
+            except Exception:
+                tally.append(False)
+
+    def safe(portfolio,count,tally):
+        for _ in range(count):
+            stock = a3sync.buy_stock(portfolio,"T",1,False,TRADE_TIME)
+            a3sync.sell_stock(portfolio,1,TRADE_TIME,stock)
+
+    def run(trade,portfolios,count,tally=None):
+        workers = [threading.Thread(target=trade,args=(portfolio,count,tally)) for portfolio in portfolios]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return time.perf_counter()-start
+
+    cash = 1e9
+    results = []
+    for n in threads:
+        count = rounds//n
+        trades = 2*count*n
+        shared = a3assets.Portfolio(cash)
+        shared_seconds = run(safe,[shared]*n,count)
+        assert shared.cash == cash-3.0*count*n, 'a synchronized run lost an update'
+        separate = [a3assets.Portfolio(cash) for _ in range(n)]
+        separate_seconds = run(safe,separate,count)
+        assert all(portfolio.cash == cash-3.0*count for portfolio in separate), 'a synchronized run lost an update'
+        unlocked = a3assets.Portfolio(cash)
+        tally = []
+        unlocked_seconds = run(unsafe,[unlocked]*n,count,tally)
+        results.append({'threads': n, 'trades': trades,
+                        'shared_per_second': trades/shared_seconds,
+                        'separate_per_second': trades/separate_seconds,
+                        'unsafe_per_second': trades/unlocked_seconds,
+                        'unsafe_cash_error': unlocked.cash-(cash-3.0*tally.count(True)),
+                        'unsafe_errors': tally.count(False)})
+    return results
+
+
+def bench_checkpoint(portfolios=1000,lots=200,seed=4852):
+    """
+    Returns: a dict comparing pickle against a3checkpoint, uncompressed and compressed,
+    on `portfolios` portfolios of `lots` lots and a loan each: the bytes written and
+    the seconds to write and to read them back.
+    """
+    import pickle
+    import a3checkpoint
+    rng = random.Random(seed)
+    book = []
+    for _ in range(portfolios):
+        portfolio = a3assets.Portfolio(rng.uniform(0.0,1e6))
+        for _ in range(lots):
+            portfolio.add_stock(a3assets.Stock("T"+str(rng.randrange(500)),rng.uniform(1.0,500.0),
+                                               rng.randrange(1,1000),rng.random() < 0.1,
+                                               OLD_TIME+datetime.timedelta(minutes=rng.randrange(1000000))))
+        portfolio.loans.append(a3assets.Loan(rng.uniform(100.0,5000.0),rng.randrange(1,60)))
+        book.append(portfolio)
+    result = {'portfolios': portfolios, 'lots': portfolios*lots}
+    for name, dump, load in (('pickle',lambda: pickle.dumps(book,pickle.HIGHEST_PROTOCOL),pickle.loads),
+                             ('checkpoint',lambda: a3checkpoint.dumps(book),a3checkpoint.loads),
+                             ('compressed',lambda: a3checkpoint.dumps(book,True),a3checkpoint.loads)):
+        data = dump()
+        result[name+'_bytes'] = len(data)
+        result[name+'_dump_seconds'] = best_of(dump)
+        result[name+'_load_seconds'] = best_of(lambda: load(data))
+    return result
+
+
+# Modules a library import should not pull in; they are loaded on first use.
+LAZY_MODULES = ('requests','numpy','asyncio','concurrent.futures')
+IMPORT_PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter()-start
+print(seconds, ",".join(m for m in {lazy!r} if m in sys.modules))
+"""
+
+
+def bench_import(modules=("a3","a3helpers","a3assets"),repeat=10):
+    """
+    Returns: a dict mapping each module to the fastest time in seconds it took to
+    import in a fresh interpreter, and the lazily loaded modules it pulled in anyway.
+
+    Each import runs in its own `python -c` process started in this folder, so
+    nothing is cached between runs.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for module in modules:
+        best = float("inf")
+        loaded = ""
+        for _ in range(repeat):
+            out = subprocess.run([sys.executable,"-c",IMPORT_PROBE.format(module=module,lazy=LAZY_MODULES)],
+                                 cwd=here,capture_output=True,text=True,check=True).stdout.split()
+            best = min(best,float(out[0]))
+            loaded = out[1] if len(out) > 1 else ""
+        results[module] = {'seconds': best, 'loaded': [m for m in loaded.split(",") if m]}
+    return results
+
+
+def run_targeted():
+    """
+    Runs the targeted benchmarks and prints their results.
+    """
+    result = bench_calculate_taxes()
+    print(f"calculate_taxes x{result['n']}: loop {result['loop_seconds']:.3f}s, "
+          f"vectorized {result['vector_seconds']:.4f}s ({result['speedup']:.0f}x)")
+    result = bench_calendar()
+    print(f"trading hours x{result['n']}: inline {result['inline_seconds']:.3f}s, "
+          f"table {result['table_seconds']:.3f}s, array {result['vector_seconds']:.4f}s ({result['speedup']:.0f}x)")
+    result = bench_lot_store()
+    print(f"lots x{result['n']}: Stock list {result['list_bytes_per_lot']:.0f} B/lot, "
+          f"LotStore {result['store_bytes_per_lot']:.0f} B/lot")
+    result = bench_loan_book()
+    print(f"loans x{result['n']}: month-end {result['month_end_seconds']:.3f}s, "
+          f"{result['months']}-month schedule {result['schedule_seconds']:.3f}s")
+    result = bench_checkpoint()
+    for name in ('pickle','checkpoint','compressed'):
+        print(f"{name} x{result['lots']} lots: {result[name+'_bytes']/result['lots']:.1f} B/lot, "
+              f"write {result[name+'_dump_seconds']:.3f}s, read {result[name+'_load_seconds']:.3f}s")
+    for result in bench_contention():
+        print(f"trading on {result['threads']:>2} threads: shared {result['shared_per_second']:.0f}/s, "
+              f"separate {result['separate_per_second']:.0f}/s, unsynchronized {result['unsafe_per_second']:.0f}/s "
+              f"(cash off by ${result['unsafe_cash_error']:.0f}, {result['unsafe_errors']} rounds raised)")
+    for module, result in bench_import().items():
+        print(f"import {module}: {result['seconds']*1000:.1f}ms, "
+              f"also loaded: {', '.join(result['loaded']) or 'nothing heavy'}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "suite":
+        results = run_suite()
+        print_results(results)
+        if len(sys.argv) > 2:
+            save_results(results,sys.argv[2])
+    elif len(sys.argv) > 1 and sys.argv[1] == "compare":
+        regressions = compare(load_results(sys.argv[2]),load_results(sys.argv[3]))
+        for name, size, before, after, change in regressions:
+            print(f"{name} at {size} lots: p50 {before:.2f}us -> {after:.2f}us (+{change:.0%})")
+        if len(regressions) == 0:
+            print("no regressions")
+    else:
+        run_targeted()
@@ -0,0 +1,224 @@
+"""
+Quote cache for A3.
+
+Keeps recently fetched prices in memory so that repeated reads of the same
+symbol (for example the menu price, the transaction price and the
+"they are worth" line in one trading action) reuse one quote instead of
+making a fresh request every time.
+
+Entries expire after a time-to-live (TTL) that can be set per symbol, and the
+cache holds at most `maxsize` symbols, evicting the least recently used one.
+"""
+
+import time
+import threading
+import collections
+
+
+class QuoteCache(object):
+    """
+    The class QuoteCache is a bounded, least-recently-used cache of prices. It has 3 attributes.
+        ttl - A float representing how many seconds a quote stays fresh by default; non-negative
+        maxsize - An int representing the most symbols the cache can hold; positive
+        clock - A function with no arguments returning the current time in seconds
+
+    It also keeps three counters, `hits`, `misses` and `evictions`, which can be
+    read at any time and cleared with `reset_stats`.
+
+    The constructor can be called like this
+    QuoteCache(30.0,500)
+    Which creates a cache that keeps up to 500 quotes for 30 seconds each.
+    """
+    @property
+    def ttl(self):
+        """
+        The default number of seconds a quote is considered fresh.
+
+        **Invariant**: Value must be a non-negative float.
+        """
+        return self._ttl
+
+    @ttl.setter
+    def ttl(self,value):
+        assert type(value) == float, f'{value} is not a float'
+        assert value >= 0, f'{value} must not be negative'
+        self._ttl = value
+
+    @property
+    def maxsize(self):
+        """
+        The most symbols the cache will hold before evicting.
+
+        **Invariant**: Value must be a positive int.
+        """
+        return self._maxsize
+
+    @maxsize.setter
+    def maxsize(self,value):
+        assert type(value) == int, f'{value} is not an int'
+        assert value > 0, f'{value} must be positive'
+        self._maxsize = value
+        with self._lock:
+            self._trim()
+
+    @property
+    def hits(self):
+        """
+        The number of lookups answered from the cache.
+        """
+        return self._hits
+
+    @property
+    def misses(self):
+        """
+        The number of lookups that found no fresh quote.
+        """
+        return self._misses
+
+    @property
+    def evictions(self):
+        """
+        The number of quotes dropped because the cache was full.
+        """
+        return self._evictions
+
+    def __init__(self,ttl=60.0,maxsize=1024,clock=time.monotonic):
+        """
+        :param ttl: default freshness of a quote in seconds
+        :type ttl:  ``float`` >=0
+
+        :param maxsize: most symbols held at once
+        :type maxsize:  ``int`` >0
+
+        :param clock: function returning the current time in seconds
+        :type clock:  callable
+        """
+        self._lock = threading.RLock()
+        self._entries = collections.OrderedDict()
+        self._ttls = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self.clock = clock
+        self.ttl = ttl
+        self.maxsize = maxsize
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self,symbol):
+        return self.get(symbol,count=False) is not None
+
+    def set_ttl(self,symbol,seconds):
+        """
+        Sets the time-to-live of one symbol. Passing None for seconds restores the default ttl.
+
+        Parameter symbol: the symbol to configure
+        Precondition: symbol is a non-empty str
+
+        Parameter seconds: how long quotes for symbol stay fresh
+        Precondition: seconds is a non-negative float or None
+        """
+        assert type(symbol) == str and len(symbol) > 0
+        assert seconds is None or (type(seconds) == float and seconds >= 0)
+        with self._lock:
+            if seconds is None:
+                self._ttls.pop(symbol,None)
+            else:
+                self._ttls[symbol] = seconds
+
+    def ttl_for(self,symbol):
+        """
+        Returns: the time-to-live in seconds used for symbol.
+        """
+        return self._ttls.get(symbol,self._ttl)
+
+    def get(self,symbol,count=True):
+        """
+        Returns: the cached price of symbol as a float, or None if there is no fresh quote.
+
+        A stale quote is dropped when it is found.
+
+        Parameter symbol: the symbol to look up
+        Precondition: symbol is a str
+
+        Parameter count: whether this lookup updates the hit/miss counters
+        Precondition: count is a bool
+        """
+        with self._lock:
+            entry = self._entries.get(symbol)
+            if entry is not None:
+                price, stamp = entry
+                if self.clock() - stamp < self.ttl_for(symbol):
+                    self._entries.move_to_end(symbol)
+                    if count:
+                        self._hits += 1
+                    return price
+                del self._entries[symbol]
+            if count:
+                self._misses += 1
+            return None
+
+    def put(self,symbol,price,age=0.0):
+        """
+        Stores price as the current quote for symbol, evicting the least recently used
+        symbol if the cache is full.
+
+        Parameter symbol: the symbol being quoted
+        Precondition: symbol is a non-empty str
+
+        Parameter price: the quoted price
+        Precondition: price is a float
+
+        Parameter age: how many seconds ago the quote was fetched, e.g. for a quote read from disk
+        Precondition: age is a non-negative float
+        """
+        assert type(symbol) == str and len(symbol) > 0
+        assert type(price) == float, f'{price} is not a float'
+        assert age >= 0, f'{age} must not be negative'
+        with self._lock:
+            self._entries[symbol] = (price,self.clock()-age)
+            self._entries.move_to_end(symbol)
+            self._trim()
+
+    def invalidate(self,symbol=None):
+        """
+        Drops the quote for symbol, or every quote if symbol is None.
+
+        Returns: the number of quotes dropped.
+
+        Parameter symbol: the symbol to drop
+        Precondition: symbol is a str or None
+        """
+        with self._lock:
+            if symbol is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+                return dropped
+            return 1 if self._entries.pop(symbol,None) is not None else 0
+
+    def reset_stats(self):
+        """
+        Sets the hit, miss and eviction counters back to zero.
+        """
+        with self._lock:
+            self._hits = 0
+            self._misses = 0
+            self._evictions = 0
+
+    def stats(self):
+        """
+        Returns: a dict with the current size, maxsize and hit/miss/eviction counters.
+        """
+        with self._lock:
+            return {'size': len(self._entries), 'maxsize': self._maxsize,
+                    'hits': self._hits, 'misses': self._misses,
+                    'evictions': self._evictions}
+
+    def _trim(self):
+        """
+        Evicts least recently used quotes until the cache fits in maxsize.
+        """
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+            self._evictions += 1
@@ -0,0 +1,364 @@
+"""
+Market calendar for A3.
+
+A MarketCalendar knows when the market is open: which days have a session
+(weekdays that are not holidays) and the opening and closing time of each one,
+with early closes. Its answers come from session tables, one entry per day
+holding the opening and closing second of the day (both 0 when closed) and the
+next day with a session, built a year at a time the first time a year is asked
+about. So
+    is_open(time) - one table lookup
+    next_open(time), next_close(time) - a lookup and a jump to the next session
+    is_open_array(times) - the same lookup for a whole NumPy array of times at once
+    is_open_many(times) - for a list of datetimes, answering each distinct time once
+
+a3 checks trading hours through the installed calendar, `calendar`. It starts as
+MarketCalendar(), i.e. every weekday from 10 am to 4 pm as the assignment says;
+install one with the NYSE holidays with
+
+    set_calendar(MarketCalendar(nyse_holidays(2000,2030),early_closes=nyse_early_closes(2000,2030)))
+
+Times are naive datetimes on the wall clock of the market. NumPy is only needed
+for is_open_array, and is imported the first time it is used with
+a3taxes.load_numpy.
+"""
+
+import array
+import datetime
+import threading
+import a3taxes
+
+# date(1970,1,1).toordinal(), to turn numpy day counts into ordinals.
+EPOCH_ORDINAL = 719163
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def _seconds(time):
+    """
+    Returns: the number of whole seconds from midnight to time (a datetime.time or datetime).
+    """
+    return time.hour*3600+time.minute*60+time.second
+
+
+def _at(ordinal,second):
+    """
+    Returns: the datetime `second` seconds into the day with this ordinal.
+    """
+    day = datetime.date.fromordinal(ordinal)
+    return datetime.datetime(day.year,day.month,day.day)+datetime.timedelta(seconds=second)
+
+
+class MarketCalendar(object):
+    """
+    The class MarketCalendar is a table of trading sessions. It has 4 attributes.
+        holidays - A frozenset of the dates (weekdays) the market is closed
+        open_time - A datetime.time of when every session opens
+        close_time - A datetime.time of when a session closes, unless it closes early
+        early_closes - A dict mapping dates to the datetime.time their session closes at
+
+    A time is in a session from its opening time up to, but not including, its closing time.
+
+    The constructor can be called like this
+    MarketCalendar([datetime.date(2019,12,25)])
+    Which opens every weekday but Christmas 2019 from 10 am to 4 pm.
+    """
+
+    def __init__(self,holidays=(),open_time=datetime.time(10),close_time=datetime.time(16),early_closes=None):
+        """
+        :param holidays: weekdays with no session
+        :type holidays:  iterable of ``date``
+
+        :param open_time: when sessions open, in whole seconds
+        :type open_time:  ``datetime.time``
+
+        :param close_time: when sessions close, in whole seconds, after open_time
+        :type close_time:  ``datetime.time``
+
+        :param early_closes: sessions that close before close_time
+        :type early_closes:  ``dict`` of ``date`` to ``datetime.time``, or None
+        """
+        assert isinstance(open_time,datetime.time) and isinstance(close_time,datetime.time)
+        assert open_time.microsecond == 0 and close_time.microsecond == 0, 'times must be whole seconds'
+        assert open_time < close_time, f'{open_time} is not before {close_time}'
+        self.holidays = frozenset(holidays)
+        self.open_time = open_time
+        self.close_time = close_time
+        self.early_closes = dict(early_closes or {})
+        for day, close in self.early_closes.items():
+            assert open_time < close <= close_time and close.microsecond == 0, f'bad early close {close} on {day}'
+        self._lock = threading.Lock()
+        # (ordinal of the first day, opens, closes, nexts), replaced as a whole so readers never mix tables.
+        self._tables = (0,array.array('i'),array.array('i'),array.array('i'))
+
+    def _build(self,first,last):
+        """
+        Builds the tables for the years first to last, replacing any tables built before.
+        """
+        start = datetime.date(first,1,1).toordinal()
+        stop = datetime.date(last+1,1,1).toordinal()
+        opens = array.array('i',bytes(4*(stop-start)))
+        closes = array.array('i',bytes(4*(stop-start)))
+        nexts = array.array('i',bytes(4*(stop-start)))
+        open_second = _seconds(self.open_time)
+        close_second = _seconds(self.close_time)
+        for i in range(stop-start):
+            day = datetime.date.fromordinal(start+i)
+            if day.weekday() < 5 and day not in self.holidays:
+                close = self.early_closes.get(day)
+                opens[i] = open_second
+                closes[i] = close_second if close is None else _seconds(close)
+        following = -1
+        for i in range(stop-start-1,-1,-1):
+            if closes[i]:
+                following = i
+            nexts[i] = following
+        self._tables = (start,opens,closes,nexts)
+
+    def _lookup(self,ordinal):
+        """
+        Returns: a tuple (index, tables) where tables reach the day with this ordinal and index
+        is its position in them, building the years needed first.
+        """
+        tables = self._tables
+        i = ordinal-tables[0]
+        if 0 <= i < len(tables[1]):
+            return i, tables
+        with self._lock:
+            start, opens = self._tables[0], self._tables[1]
+            if not 0 <= ordinal-start < len(opens):
+                year = datetime.date.fromordinal(ordinal).year
+                if len(opens) == 0:
+                    self._build(year,year)
+                else:
+                    first = datetime.date.fromordinal(start).year
+                    last = datetime.date.fromordinal(start+len(opens)-1).year
+                    self._build(min(first,year),max(last,year))
+            tables = self._tables
+        return ordinal-tables[0], tables
+
+    def is_open(self,time):
+        """
+        Returns: True if time falls in a trading session, False otherwise.
+
+        Parameter time: the time to check
+        Precondition: time is a datetime object
+        """
+        tables = self._tables
+        i = time.toordinal()-tables[0]
+        if i < 0 or i >= len(tables[1]):
+            i, tables = self._lookup(time.toordinal())
+        second = time.hour*3600+time.minute*60+time.second
+        return tables[1][i] <= second < tables[2][i]
+
+    def is_session(self,day):
+        """
+        Returns: True if the market has a session on day, False otherwise.
+
+        Parameter day: the day to check
+        Precondition: day is a date or datetime object
+        """
+        i, tables = self._lookup(day.toordinal())
+        return tables[2][i] != 0
+
+    def session(self,day):
+        """
+        Returns: a tuple (open, close) of datetimes for the session on day, or None if there is none.
+
+        Parameter day: the day to look up
+        Precondition: day is a date or datetime object
+        """
+        i, tables = self._lookup(day.toordinal())
+        if tables[2][i] == 0:
+            return None
+        return _at(tables[0]+i,tables[1][i]), _at(tables[0]+i,tables[2][i])
+
+    def _session_from(self,ordinal):
+        """
+        Returns: a tuple (ordinal, open second, close second) of the first day with a session
+        at or after the day with this ordinal.
+        """
+        i, tables = self._lookup(ordinal)
+        while tables[3][i] < 0:
+            # No session left in the tables: add the next year and look again.
+            self._lookup(tables[0]+len(tables[1]))
+            i, tables = self._lookup(ordinal)
+        j = tables[3][i]
+        return tables[0]+j, tables[1][j], tables[2][j]
+
+    def next_open(self,time):
+        """
+        Returns: the datetime of the first session opening after time (or at time, if a session
+        opens exactly then).
+
+        Parameter time: the time to start from
+        Precondition: time is a datetime object
+        """
+        ordinal = time.toordinal()
+        i, tables = self._lookup(ordinal)
+        second = time.hour*3600+time.minute*60+time.second+(time.microsecond > 0)
+        if tables[2][i] == 0 or second > tables[1][i]:
+            ordinal, opens, _ = self._session_from(ordinal+1)
+            return _at(ordinal,opens)
+        return _at(ordinal,tables[1][i])
+
+    def next_close(self,time):
+        """
+        Returns: the datetime the session in progress at time closes, or if none is in progress,
+        the datetime the next session closes.
+
+        Parameter time: the time to start from
+        Precondition: time is a datetime object
+        """
+        ordinal = time.toordinal()
+        i, tables = self._lookup(ordinal)
+        second = time.hour*3600+time.minute*60+time.second
+        if tables[2][i] == 0 or second >= tables[2][i]:
+            ordinal, _, closes = self._session_from(ordinal+1)
+            return _at(ordinal,closes)
+        return _at(ordinal,tables[2][i])
+
+    def is_open_many(self,times):
+        """
+        Returns: a list with is_open(time) for every time in times, in order.
+
+        Each distinct time is checked once, so a batch of orders sharing a few times costs a
+        few lookups.
+
+        Parameter times: the times to check
+        Precondition: times is an iterable of datetime objects
+        """
+        seen = {}
+        result = []
+        for time in times:
+            answer = seen.get(time)
+            if answer is None:
+                answer = self.is_open(time)
+                seen[time] = answer
+            result.append(answer)
+        return result
+
+    def is_open_array(self,times):
+        """
+        Returns: a NumPy bool array, True where times fall in a trading session.
+
+        Parameter times: the times to check, on the wall clock of the market
+        Precondition: times is a NumPy datetime64 array, or a sequence of datetime objects
+        """
+        numpy = a3taxes.load_numpy()
+        times = numpy.asarray(times).astype('datetime64[s]')
+        days = times.astype('datetime64[D]')
+        seconds = (times-days).astype(numpy.int64)
+        ordinals = days.astype(numpy.int64)+EPOCH_ORDINAL
+        if ordinals.size == 0:
+            return numpy.zeros(times.shape,dtype=bool)
+        self._lookup(int(ordinals.min()))
+        self._lookup(int(ordinals.max()))
+        start, opens, closes, _ = self._tables
+        index = ordinals-start
+        opens = numpy.frombuffer(opens,dtype=numpy.intc)
+        closes = numpy.frombuffer(closes,dtype=numpy.intc)
+        return (opens[index] <= seconds) & (seconds < closes[index])
+
+
+def _nth_weekday(year,month,weekday,n):
+    """
+    Returns: the date of the n-th (1-based; -1 for the last) weekday of month.
+    """
+    if n > 0:
+        first = datetime.date(year,month,1)
+        return first+datetime.timedelta(days=(weekday-first.weekday()) % 7+7*(n-1))
+    last = datetime.date(year+month//12,month % 12+1,1)-ONE_DAY
+    return last-datetime.timedelta(days=(last.weekday()-weekday) % 7)
+
+
+def _observed(day):
+    """
+    Returns: the weekday a holiday falling on day is observed on (Saturday moves to Friday, Sunday to Monday).
+    """
+    if day.weekday() == 5:
+        return day-ONE_DAY
+    if day.weekday() == 6:
+        return day+ONE_DAY
+    return day
+
+
+def _easter(year):
+    """
+    Returns: the date of Easter Sunday in year (Gregorian calendar).
+    """
+    a = year % 19
+    b, c = divmod(year,100)
+    d, e = divmod(b,4)
+    f = (b+8)//25
+    g = (b-f+1)//3
+    h = (19*a+b-d-g+15) % 30
+    i, k = divmod(c,4)
+    l = (32+2*e+2*i-h-k) % 7
+    m = (a+11*h+22*l)//451
+    month, day = divmod(h+l-7*m+114,31)
+    return datetime.date(year,month,day+1)
+
+
+def nyse_holidays(first_year,last_year):
+    """
+    Returns: a set of the dates the New York Stock Exchange is closed for holidays from
+    first_year to last_year, by its current rules (special closings are not included).
+
+    Parameter first_year: the first year
+    Precondition: first_year is an int
+
+    Parameter last_year: the last year
+    Precondition: last_year is an int >= first_year
+    """
+    days = set()
+    for year in range(first_year,last_year+1):
+        new_year = datetime.date(year,1,1)
+        # A New Year's Day on a Saturday is not made up on the Friday before.
+        if new_year.weekday() != 5:
+            days.add(_observed(new_year))
+        if year >= 1998:
+            days.add(_nth_weekday(year,1,0,3))
+        days.add(_nth_weekday(year,2,0,3))
+        days.add(_easter(year)-datetime.timedelta(days=2))
+        days.add(_nth_weekday(year,5,0,-1))
+        if year >= 2022:
+            days.add(_observed(datetime.date(year,6,19)))
+        days.add(_observed(datetime.date(year,7,4)))
+        days.add(_nth_weekday(year,9,0,1))
+        days.add(_nth_weekday(year,11,3,4))
+        days.add(_observed(datetime.date(year,12,25)))
+    return days
+
+
+def nyse_early_closes(first_year,last_year,close_time=datetime.time(13)):
+    """
+    Returns: a dict mapping the days the New York Stock Exchange closes early from first_year
+    to last_year (the day before Independence Day, the day after Thanksgiving and
+    Christmas Eve, when they are weekdays) to close_time.
+    """
+    days = {}
+    for year in range(first_year,last_year+1):
+        for day in (datetime.date(year,7,3),_nth_weekday(year,11,3,4)+ONE_DAY,datetime.date(year,12,24)):
+            if day.weekday() < 5:
+                days[day] = close_time
+    holidays = nyse_holidays(first_year,last_year)
+    return {day: close for day, close in days.items() if day not in holidays}
+
+
+# The calendar a3 checks trading hours against.
+calendar = MarketCalendar()
+
+
+def set_calendar(new):
+    """
+    Returns: the calendar that was installed before.
+
+    Makes a3 check trading hours against new.
+
+    new: a MarketCalendar
+    """
+    global calendar
+    assert isinstance(new,MarketCalendar), f'{new} is not a MarketCalendar'
+    previous = calendar
+    calendar = new
+    return previous
@@ -0,0 +1,346 @@
+"""
+Binary checkpoints of portfolios for A3.
+
+dumps writes any number of Portfolios, with their lots, loans and coins, as one
+compact block of bytes, and loads builds them back:
+
+    data = a3checkpoint.dumps(portfolios,compress=True)
+    portfolios = a3checkpoint.loads(data)
+
+save and load do the same with a file. Unlike pickle, nothing is written per
+object: every field is one typed array over all the portfolios (or all the lots,
+or all the loans), written with array.tobytes and read back with frombytes.
+Tickers are written once, in a table the lots point into. A portfolio whose
+stocks are an a3assets.LotStore has the columns of its store written as they are.
+
+Loading does not run the constructors or property setters again: the values were
+checked when the objects were first made, so the objects are rebuilt by filling in
+their attributes directly, and each Portfolio's ticker index is then rebuilt with
+reindex(), all with the garbage collector paused. Only the layout of the bytes, the
+ticker ids and the range of the buy dates are checked; a ValueError is raised for
+bytes that are not a checkpoint, or a corrupt one.
+
+Layout (little-endian): magic b"A3CK", version (u16), flags (u16; 1 = the body is
+zlib-compressed), body length (u64), then the body:
+    portfolio count (u64), then per portfolio the columns cash (d), commission fee (d),
+    loan rate (d), coins (q), kind (B; see below), lot count (q), loan count (q)
+    ticker table: count (u32), byte length of each (H), UTF-8 bytes of all
+    lots of list portfolios: ticker id (I), shares (q), buy price (d),
+    buy date in microseconds since 1970 (q), short (b)
+    per LotStore portfolio: its ticker table, then its five columns
+    loans: balance (d), length (q), late fee (d)
+Buy dates are naive datetimes, as everywhere in a3.
+"""
+
+import gc
+import os
+import sys
+import zlib
+import array
+import struct
+import datetime
+import a3assets
+
+MAGIC = b"A3CK"
+VERSION = 2
+COMPRESSED = 1
+
+# Kinds of portfolio: how its stocks and loans are kept.
+LIST = 0
+STORE = 1
+NO_STOCKS = 2
+NO_LOANS = 4
+
+_HEADER = struct.Struct("<4sHHQ")
+_COUNT = struct.Struct("<Q")
+_TICKERS = struct.Struct("<I")
+
+EPOCH = datetime.datetime(1970,1,1)
+MICROSECOND = datetime.timedelta(microseconds=1)
+# The buy dates a datetime can hold, in microseconds since EPOCH.
+_FIRST_DATE = (datetime.datetime.min-EPOCH)//MICROSECOND
+_LAST_DATE = (datetime.datetime.max-EPOCH)//MICROSECOND
+
+
+def _column(typecode,values):
+    """
+    Returns: the little-endian bytes of an array of typecode holding values.
+    """
+    column = array.array(typecode,values)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column.tobytes()
+
+
+class _Reader(object):
+    """
+    Reads the columns of a checkpoint body one after another.
+    """
+
+    def __init__(self,data):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    def take(self,n):
+        """
+        Returns: the next n bytes.
+        """
+        end = self.offset+n
+        if n < 0 or end > len(self.data):
+            raise ValueError('checkpoint is cut short')
+        view = self.data[self.offset:end]
+        self.offset = end
+        return view
+
+    def unpack(self,layout):
+        """
+        Returns: the next values laid out by the struct.Struct layout; one value on its own.
+        """
+        values = layout.unpack(self.take(layout.size))
+        return values if len(values) > 1 else values[0]
+
+    def column(self,typecode,n):
+        """
+        Returns: the next array of n items of typecode.
+        """
+        column = array.array(typecode)
+        column.frombytes(self.take(n*column.itemsize))
+        if sys.byteorder == "big":
+            column.byteswap()
+        return column
+
+
+def _pack_tickers(tickers):
+    data = [text.encode("utf-8") for text in tickers]
+    return _TICKERS.pack(len(data))+_column('H',map(len,data))+b"".join(data)
+
+
+def _unpack_tickers(reader):
+    lengths = reader.column('H',reader.unpack(_TICKERS))
+    blob = bytes(reader.take(sum(lengths)))
+    tickers = []
+    offset = 0
+    for n in lengths:
+        tickers.append(blob[offset:offset+n].decode("utf-8"))
+        offset += n
+    return tickers
+
+
+def dumps(portfolios,compress=False):
+    """
+    Returns: the bytes of a checkpoint of every portfolio in portfolios.
+
+    Parameter portfolios: the portfolios to write
+    Precondition: portfolios is an iterable of Portfolio objects
+
+    Parameter compress: whether to compress the body with zlib, or the zlib level to use
+    Precondition: compress is a bool or an int from 1 to 9
+    """
+    portfolios = list(portfolios)
+    for portfolio in portfolios:
+        assert isinstance(portfolio,a3assets.Portfolio), f'{portfolio} is not a Portfolio'
+    kinds = []
+    nlots = []
+    lots = []
+    stores = []
+    loans = []
+    for portfolio in portfolios:
+        stocks = portfolio._stocks
+        kind = LIST
+        if stocks is None:
+            kind |= NO_STOCKS
+            nlots.append(0)
+        elif isinstance(stocks,a3assets.LotStore):
+            kind |= STORE
+            nlots.append(len(stocks))
+            stores.append(stocks)
+        else:
+            nlots.append(len(stocks))
+            lots.extend(stocks)
+        if portfolio._loans is None:
+            kind |= NO_LOANS
+        else:
+            loans.extend(portfolio._loans)
+        kinds.append(kind)
+    ticker_ids = {}
+    for stock in lots:
+        ticker_ids.setdefault(stock._company,len(ticker_ids))
+    parts = [_COUNT.pack(len(portfolios)),
+             _column('d',[portfolio._cash for portfolio in portfolios]),
+             _column('d',[portfolio._commission_fee for portfolio in portfolios]),
+             _column('d',[portfolio._loan_rate for portfolio in portfolios]),
+             _column('q',[portfolio._coins for portfolio in portfolios]),
+             _column('B',kinds),
+             _column('q',nlots),
+             _column('q',[len(portfolio._loans or ()) for portfolio in portfolios]),
+             _pack_tickers(ticker_ids),
+             _column('I',[ticker_ids[stock._company] for stock in lots]),
+             _column('q',[stock._shares for stock in lots]),
+             _column('d',[stock._buy_price for stock in lots]),
+             _column('q',[(stock._buy_date-EPOCH)//MICROSECOND for stock in lots]),
+             _column('b',[stock._short for stock in lots])]
+    for store in stores:
+        parts.append(_pack_tickers(store._tickers))
+        for column in store._columns():
+            parts.append(_column(column.typecode,column))
+    parts.append(_column('d',[loan._balance for loan in loans]))
+    parts.append(_column('q',[loan._length for loan in loans]))
+    parts.append(_column('d',[loan._late_fee for loan in loans]))
+    body = b"".join(parts)
+    flags = 0
+    if compress:
+        body = zlib.compress(body,6 if compress is True else compress)
+        flags |= COMPRESSED
+    return _HEADER.pack(MAGIC,VERSION,flags,len(body))+body
+
+
+def loads(data):
+    """
+    Returns: a list of new Portfolios built from the bytes written by dumps, in the same order.
+
+    Raises ValueError if data is not a checkpoint this version can read.
+
+    Parameter data: the checkpoint
+    Precondition: data is a bytes-like object
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError('checkpoint is cut short')
+    magic, version, flags, length = _HEADER.unpack_from(data,0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('not an A3 checkpoint of version '+str(VERSION))
+    body = memoryview(data)[_HEADER.size:_HEADER.size+length]
+    if len(body) != length:
+        raise ValueError('checkpoint is cut short')
+    if flags & COMPRESSED:
+        try:
+            body = zlib.decompress(body)
+        except zlib.error as error:
+            raise ValueError('checkpoint body is corrupt') from error
+    # Rebuilding makes many objects at once; the cyclic garbage collector would scan
+    # them again and again while they are made, so it is paused until they are done.
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        return _build(_Reader(body))
+    except (IndexError,OverflowError,struct.error) as error:
+        # A ticker id past its table, or a buy date no datetime can hold.
+        raise ValueError('checkpoint body is corrupt') from error
+    finally:
+        if collecting:
+            gc.enable()
+
+
+def _build(reader):
+    """
+    Returns: the list of Portfolios in the checkpoint body read by reader.
+    """
+    n = reader.unpack(_COUNT)
+    cash = reader.column('d',n).tolist()
+    fees = reader.column('d',n).tolist()
+    rates = reader.column('d',n).tolist()
+    coins = reader.column('q',n).tolist()
+    kinds = reader.column('B',n).tolist()
+    nlots = reader.column('q',n).tolist()
+    nloans = reader.column('q',n).tolist()
+    tickers = _unpack_tickers(reader)
+    listed = sum(count for count, kind in zip(nlots,kinds) if not kind & (STORE|NO_STOCKS))
+    ids = reader.column('I',listed).tolist()
+    shares = reader.column('q',listed).tolist()
+    prices = reader.column('d',listed).tolist()
+    dates = reader.column('q',listed).tolist()
+    shorts = reader.column('b',listed).tolist()
+
+    new = object.__new__
+    Stock = a3assets.Stock
+    lots = []
+    for i in range(listed):
+        stock = new(Stock)
+        stock.__dict__ = {'_company': tickers[ids[i]], '_shares': shares[i], '_buy_price': prices[i],
+                          '_buy_date': EPOCH+datetime.timedelta(microseconds=dates[i]),
+                          '_short': shorts[i] == 1}
+        lots.append(stock)
+
+    stores = []
+    for count, kind in zip(nlots,kinds):
+        if kind & STORE:
+            store = new(a3assets.LotStore)
+            store.owner = None
+            store._tickers = _unpack_tickers(reader)
+            store._ticker_ids = {company: tid for tid, company in enumerate(store._tickers)}
+            store._ticker = reader.column('I',count)
+            store._shares = reader.column('q',count)
+            store._buy_price = reader.column('d',count)
+            store._buy_time = reader.column('q',count)
+            # A LotStore turns buy dates into datetimes only when they are read, so they are checked here.
+            if count and (min(store._buy_time) < _FIRST_DATE or max(store._buy_time) > _LAST_DATE):
+                raise OverflowError('a buy date is out of range')
+            store._short = reader.column('b',count)
+            stores.append(store)
+
+    total = sum(nloans)
+    balances = reader.column('d',total).tolist()
+    lengths = reader.column('q',total).tolist()
+    late_fees = reader.column('d',total).tolist()
+    loans = []
+    for i in range(total):
+        loan = new(a3assets.Loan)
+        loan.__dict__ = {'_balance': balances[i], '_length': lengths[i], '_late_fee': late_fees[i]}
+        loans.append(loan)
+
+    portfolios = []
+    next_lot = 0
+    next_store = 0
+    next_loan = 0
+    for i in range(n):
+        portfolio = new(a3assets.Portfolio)
+        portfolio.__dict__ = {'_cash': cash[i], '_commission_fee': fees[i], '_loan_rate': rates[i],
+                              '_coins': coins[i], '_loans': None, '_stocks': None}
+        kind = kinds[i]
+        if not kind & NO_LOANS:
+            portfolio._loans = loans[next_loan:next_loan+nloans[i]]
+            next_loan += nloans[i]
+        if kind & STORE:
+            portfolio._stocks = stores[next_store]
+            next_store += 1
+        elif not kind & NO_STOCKS:
+            portfolio._stocks = lots[next_lot:next_lot+nlots[i]]
+            next_lot += nlots[i]
+        portfolio.reindex()
+        portfolios.append(portfolio)
+    return portfolios
+
+
+def save(path,portfolios,compress=False):
+    """
+    Writes a checkpoint of portfolios to the file path, replacing it in one step.
+
+    The bytes are written to a temporary file next to path, flushed to disk, and the file
+    is then renamed over path, so a crash never leaves half a checkpoint at path. If the
+    write fails the temporary file is removed.
+
+    Parameter path, portfolios, compress: the file to write, and as for dumps
+    Precondition: path is a str
+    """
+    data = dumps(portfolios,compress)
+    temporary = path+".tmp"
+    try:
+        with open(temporary,"wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary,path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def load(path):
+    """
+    Returns: the list of Portfolios in the checkpoint file path.
+
+    Parameter path: the file to read
+    Precondition: path is a str naming a file written by save
+    """
+    with open(path,"rb") as file:
+        return loads(file.read())
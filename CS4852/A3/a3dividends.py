@@ -0,0 +1,219 @@
+"""
+Dividend distribution for A3.
+
+a3.pay_dividends pays one lot. distribute pays one company's dividend to every
+lot of it in many portfolios at once:
+
+    index = HolderIndex(portfolios)
+    distribute("IBM",0.5,index)
+
+A HolderIndex maps each ticker to the portfolios holding it and is kept up to
+date by the portfolios themselves (it watches their ticker index), so a dividend
+run only visits the holders of the company and, through each one's Position,
+only their lots of it; it never looks at other portfolios or other lots.
+
+The short-term tax of every payment is computed in one batched pass with
+a3taxes.after_tax_array (or, without NumPy, calculate_taxes in a loop), and each
+holder's cash is then set once. NumPy is imported the first time a large batch is taxed. Every lot is taxed and added to cash in the same
+order as calling pay_dividends on each lot would, so the results are identical.
+"""
+
+import a3
+import a3assets
+import a3taxes
+
+# Runs with fewer payments than this are taxed in a plain loop, where NumPy's overhead would not pay off.
+VECTOR_MIN = 64
+
+# Whether NumPy can be used; None until the first run of VECTOR_MIN payments or more.
+_vectorized = None
+
+
+# The holders of a ticker nobody holds.
+_NO_HOLDERS = {}
+
+
+class HolderIndex(object):
+    """
+    The class HolderIndex maps every ticker to the portfolios that hold shares of it.
+
+    Portfolios are added with add (or passed to the constructor) and taken out with
+    remove. While in the index a portfolio reports every ticker it starts or stops
+    holding, so the index never needs rebuilding.
+
+    The constructor can be called like this
+    HolderIndex([portfolio1,portfolio2])
+    """
+
+    def __init__(self,portfolios=()):
+        """
+        :param portfolios: the portfolios to index
+        :type portfolios:  iterable of ``Portfolio``
+        """
+        self._holders = {}
+        self._portfolios = {}
+        for portfolio in portfolios:
+            self.add(portfolio)
+
+    def __len__(self):
+        """
+        Returns: the number of portfolios in the index.
+        """
+        return len(self._portfolios)
+
+    def __contains__(self,portfolio):
+        return portfolio in self._portfolios
+
+    def add(self,portfolio):
+        """
+        Adds portfolio to the index. Adding a portfolio already in it does nothing.
+
+        Parameter portfolio: the portfolio to add
+        Precondition: portfolio is a Portfolio object
+        """
+        assert isinstance(portfolio,a3assets.Portfolio), f'{portfolio} is not a Portfolio'
+        if portfolio in self._portfolios:
+            return
+        self._portfolios[portfolio] = None
+        portfolio._watchers = portfolio._watchers+(self,)
+        for ticker in portfolio.tickers():
+            self.opened(portfolio,ticker)
+
+    def remove(self,portfolio):
+        """
+        Takes portfolio out of the index.
+
+        Parameter portfolio: the portfolio to remove
+        Precondition: portfolio is in the index
+        """
+        del self._portfolios[portfolio]
+        portfolio._watchers = tuple(watcher for watcher in portfolio._watchers if watcher is not self)
+        for ticker in portfolio.tickers():
+            self.closed(portfolio,ticker)
+
+    def holders(self,ticker):
+        """
+        Returns: a list of the portfolios holding shares of ticker, in the order they started holding it.
+        """
+        return list(self._holders.get(ticker,()))
+
+    def holding(self,ticker):
+        """
+        Returns: a read-only view of the portfolios holding shares of ticker, in the order they
+        started holding it.
+
+        Unlike holders no copy is made, so the view is meant to be read at once: it may miss
+        later changes to the index, and no portfolio should start or stop holding ticker
+        while it is iterated.
+        """
+        return self._holders.get(ticker,_NO_HOLDERS).keys()
+
+    def tickers(self):
+        """
+        Returns: a list of the tickers held by at least one portfolio in the index.
+        """
+        return list(self._holders)
+
+    def opened(self,portfolio,ticker):
+        """
+        Records that portfolio now holds ticker. Called by Portfolio.
+        """
+        holders = self._holders.get(ticker)
+        if holders is None:
+            holders = {}
+            self._holders[ticker] = holders
+        holders[portfolio] = None
+
+    def changed(self,portfolio,ticker):
+        """
+        Called by Portfolio when the totals of one of its Positions change; the index does not need them.
+        """
+
+    def closed(self,portfolio,ticker):
+        """
+        Records that portfolio no longer holds ticker. Called by Portfolio.
+        """
+        holders = self._holders.get(ticker)
+        if holders is not None:
+            holders.pop(portfolio,None)
+            if not holders:
+                del self._holders[ticker]
+
+
+def _after_tax(profits):
+    """
+    Returns: a list of every profit in profits after the short-term tax, as calculate_taxes gives it.
+    """
+    global _vectorized
+    if len(profits) >= VECTOR_MIN:
+        if _vectorized is None:
+            try:
+                a3taxes.load_numpy()
+                _vectorized = True
+            except ImportError:
+                _vectorized = False
+        if _vectorized:
+            return a3taxes.after_tax_array(profits,False).tolist()
+    return [a3.calculate_taxes(profit,False) for profit in profits]
+
+
+def distribute_many(dividends,portfolios,shorts=False):
+    """
+    Returns: a tuple (holders, lots, paid): how many portfolios and lots were paid and
+    the total paid out after tax, as a float.
+
+    Pays every dividend in dividends to the lots of its company in portfolios. All the
+    payments are taxed in one batched pass, then each portfolio's cash is set once.
+
+    Parameter dividends: the dividends to pay
+    Precondition: dividends is an iterable of (company, payment per share) pairs, where
+    company is a str and payment a non-negative float
+
+    Parameter portfolios: the portfolios to pay
+    Precondition: portfolios is a HolderIndex, or an iterable of Portfolio objects (which is
+    read once, and each looked at once per dividend)
+
+    Parameter shorts: whether shorted lots are paid too, as pay_dividends would pay them
+    Precondition: shorts is a bool
+    """
+    assert type(shorts) == bool
+    if not isinstance(portfolios,HolderIndex):
+        portfolios = list(portfolios)
+    owners = []
+    profits = []
+    for company, payment in dividends:
+        assert type(company) == str
+        assert type(payment) == float and payment >= 0.0
+        if isinstance(portfolios,HolderIndex):
+            holders = portfolios.holding(company)
+        else:
+            holders = [portfolio for portfolio in portfolios if portfolio.position(company) is not None]
+        for portfolio in holders:
+            for lot in portfolio.position(company).lots:
+                if shorts or not lot.short:
+                    owners.append(portfolio)
+                    profits.append(payment*lot.shares)
+    taxed = _after_tax(profits)
+    cash = {}
+    for portfolio, posttax in zip(owners,taxed):
+        cash[portfolio] = cash.get(portfolio,portfolio.cash)+posttax
+    for portfolio, total in cash.items():
+        portfolio.cash = total
+    return len(cash), len(taxed), float(sum(taxed))
+
+
+def distribute(company,payment,portfolios,shorts=False):
+    """
+    Returns: a tuple (holders, lots, paid) as for distribute_many.
+
+    Pays a dividend of payment per share of company to every lot of it in portfolios.
+
+    Parameter company: the trading symbol of the company paying
+    Precondition: company is a str
+
+    Parameter payment: the amount paid per share
+    Precondition: payment is a non-negative float
+
+    Parameter portfolios, shorts: as for distribute_many
+    """
+    return distribute_many([(company,payment)],portfolios,shorts)
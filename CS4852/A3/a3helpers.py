@@ -1,9 +1,34 @@
-import requests
 import datetime
 import random
+import threading
+import a3cache
+import a3metrics
+import a3scheduler
 
 key = "TEST"
 
+# When set (see set_price_source), every price is read from this source instead of
+# the TEST constants or the network.
+price_source = None
+
+# Live quotes are kept for a short while so one trading action reuses one price.
+quote_cache = a3cache.QuoteCache(60.0,1024)
+# When set (see set_quote_store), live quotes are also kept on disk and shared between processes.
+quote_store = None
+# When set (see set_scheduler), every network call goes through this a3scheduler.RequestScheduler.
+scheduler = None
+BTC_SYMBOL = "BTC/USD"
+
+QUOTE_URL = "https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol="
+BTC_URL = "https://www.alphavantage.co/query?function=CURRENCY_EXCHANGE_RATE&from_currency=BTC&to_currency=USD&apikey="
+
+# One pooled session is shared by every fetch so connections are reused.
+POOL_SIZE = 16
+_session = None
+_session_lock = threading.Lock()
+# The async fetchers run the pooled session on their own threads so the event loop never blocks.
+_async_executor = None
+
 def is_weekday(time):
     """
     Returns: True if it time lands on a weekday, False if it is a weekend
@@ -20,44 +45,373 @@ def one_year_ago(time):
     """
     return time.replace(time.year-1)
 
-def get_stock_price(stock):
+def set_price_source(source):
+    """
+    Returns: the price source that was installed before.
+
+    Makes every price function read from source, e.g. an a3prices.ReplaySource.
+    Passing None goes back to the TEST constants or the live endpoint.
+
+    source: an a3prices.PriceSource or None
+    """
+    global price_source
+    previous = price_source
+    price_source = source
+    return previous
+
+def set_quote_store(store):
+    """
+    Returns: the quote store that was installed before.
+
+    Makes every live fetch save its quote in store and every quote_cache miss look in
+    store before going to the network, and copies the fresh quotes of store into
+    quote_cache right away. Passing None stops using the disk.
+
+    store: an a3quotestore.QuoteStore or None
+    """
+    global quote_store
+    previous = quote_store
+    quote_store = store
+    if store is not None:
+        store.warm(quote_cache)
+    return previous
+
+def set_scheduler(new):
+    """
+    Returns: the scheduler that was installed before.
+
+    Makes every network call for a quote go through new, which keeps the calls within
+    the API quota, sends trade-time quotes first and makes one call per symbol however
+    many threads ask for it. Passing None sends the calls directly again.
+
+    new: an a3scheduler.RequestScheduler or None
+    """
+    global scheduler
+    previous = scheduler
+    scheduler = new
+    return previous
+
+def _scheduled(symbol,fetch,priority):
+    """
+    Returns: the result of fetch(), called through scheduler as a call for symbol if one is installed.
+    """
+    if scheduler is None:
+        return fetch()
+    return scheduler.call(symbol,fetch,priority)
+
+def _cached_price(symbol):
+    """
+    Returns: a fresh quote of symbol from quote_cache or quote_store as a float, or None.
+
+    A quote found only on disk is copied into quote_cache.
+    """
+    price = quote_cache.get(symbol)
+    if price is not None or quote_store is None:
+        return price
+    found = quote_store.get(symbol)
+    if found is None:
+        return None
+    quote_cache.put(symbol,found[0],found[1])
+    return found[0]
+
+def _remember(symbol,price):
+    """
+    Keeps a freshly fetched quote in quote_cache and, if one is installed, quote_store.
+    """
+    quote_cache.put(symbol,price)
+    if quote_store is not None:
+        quote_store.put(symbol,price)
+
+def get_session():
+    """
+    Returns: the shared requests.Session used for every price fetch.
+
+    The session is created on first use with a connection pool of POOL_SIZE
+    connections, so repeated fetches skip the TCP/TLS handshake. requests itself is
+    only imported here, so TEST runs and price-source runs never load it.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                import requests.adapters
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=POOL_SIZE,pool_maxsize=POOL_SIZE)
+                session.mount("https://",adapter)
+                session.mount("http://",adapter)
+                _session = session
+    return _session
+
+def _test_stock_price(stock):
+    """
+    Returns: the constant price used for stock when key == "TEST"
+    """
+    if stock == "CORNELL":
+        return 18.65
+    if stock == "HARVARD":
+        return 0.0
+    else:
+        return 1.0
+
+def _check_throttled(response):
+    """
+    Raises a3scheduler.Throttled if response is the note Alpha Vantage sends instead of
+    data when the key has gone over its quota.
+    """
+    if "call frequency" in response or "rate limit" in response:
+        raise a3scheduler.Throttled(response.strip())
+
+def _parse_stock_price(response):
+    """
+    Returns: the price in a GLOBAL_QUOTE response body as a float
+    """
+    price = response[(response).find("price")+len("price")+4:]
+    price = price[:price.find("\"")]
+    return float(price)
+
+def _parse_BTC_price(response):
+    """
+    Returns: the rate in a CURRENCY_EXCHANGE_RATE response body as a float
+    """
+    price = response[(response).find("5. Exchange Rate")+20:]
+    price = price[:price.find(",")-1]
+    return float(price)
+
+def _fetch_stock_price(stock):
+    """
+    Returns: the live price of stock as a float, which is also stored in quote_cache and quote_store.
+
+    Raises any network or parsing error instead of falling back to a random price, and
+    a3scheduler.Throttled if the call went over the quota.
+
+    stock: an upper-case stock trading symbol
+    """
+    response = get_session().get(QUOTE_URL + stock + "&apikey=" + key).text
+    _check_throttled(response)
+    price = _parse_stock_price(response)
+    _remember(stock,price)
+    return price
+
+def _fetch_BTC_price():
+    """
+    Returns: the live price of BitCoin as a float, which is also stored in quote_cache and quote_store.
+
+    Raises any network or parsing error instead of falling back to a random price, and
+    a3scheduler.Throttled if the call went over the quota.
+    """
+    response = get_session().get(BTC_URL + key).text
+    _check_throttled(response)
+    price = _parse_BTC_price(response)
+    _remember(BTC_SYMBOL,price)
+    return price
+
+def get_stock_price(stock,priority=a3scheduler.TRADE):
     """
     Returns: current price of stock as a float
 
+    IF a price source is installed it answers, and raises KeyError for prices it does not have
     IF Key == Test returns constant value used for testing 
+    Otherwise a fresh quote from quote_cache (or quote_store) is reused before asking the network,
+    through scheduler at the given priority if one is installed.
 
     stock: a string representing a company's stock tranding symbol 
+    priority: a3scheduler.TRADE, or a3scheduler.REFRESH for quotes no transaction is waiting on
     """
+    if price_source is not None:
+        return price_source.price(stock)
     if key == "TEST":
-        if stock == "CORNELL":
-            return 18.65
-        if stock == "HARVARD":
-            return 0.0
-        else:
-            return 1.0
+        return _test_stock_price(stock)
+    stock = stock.upper()
+    price = _cached_price(stock)
+    if price is not None:
+        return price
     try:
-        stock = stock.upper()
-        req = "https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol=" + stock + "&apikey=" + key
-        response = requests.get(req).text
-        price = response[(response).find("price")+len("price")+4:]
-        price = price[:price.find("\"")]
-        return float(price)
+        return _scheduled(stock,lambda: _fetch_stock_price(stock),priority)
     except:
+        a3metrics.count("a3helpers.price_fallback.stock")
         return random.random() * 100
 
-def get_BTC_price():
+def get_BTC_price(priority=a3scheduler.TRADE):
     """
     Returns: current price of BitCoin as a float
 
+    IF a price source is installed it answers for BTC_SYMBOL
     IF Key == Test returns constant value used for testing 
+    Otherwise a fresh quote from quote_cache (or quote_store) is reused before asking the network,
+    through scheduler at the given priority if one is installed.
+
+    priority: as for get_stock_price
     """
+    if price_source is not None:
+        return price_source.price(BTC_SYMBOL)
     if key == "TEST":
         return 18.65
+    price = _cached_price(BTC_SYMBOL)
+    if price is not None:
+        return price
     try:
-        req = "https://www.alphavantage.co/query?function=CURRENCY_EXCHANGE_RATE&from_currency=BTC&to_currency=USD&apikey=" + key
-        response = requests.get(req).text
-        price = response[(response).find("5. Exchange Rate")+20:]
-        price = price[:price.find(",")-1]
-        return float(price)
+        return _scheduled(BTC_SYMBOL,_fetch_BTC_price,priority)
     except:
-        return random.random() * 100
\ No newline at end of file
+        a3metrics.count("a3helpers.price_fallback.btc")
+        return random.random() * 100
+
+def invalidate_quotes(symbol=None):
+    """
+    Returns: the number of cached quotes dropped.
+
+    Forgets the cached quote for symbol (or every cached quote if symbol is None),
+    in quote_cache and in quote_store, so the next price request goes to the network.
+
+    symbol: a string representing a company's stock trading symbol, BTC_SYMBOL, or None
+    """
+    if symbol is not None and symbol != BTC_SYMBOL:
+        symbol = symbol.upper()
+    if quote_store is not None:
+        quote_store.invalidate(symbol)
+    return quote_cache.invalidate(symbol)
+
+def get_stock_prices(symbols,max_workers=8,priority=a3scheduler.TRADE):
+    """
+    Returns: a tuple (prices, failures) of two dicts.
+    prices maps each symbol that could be priced to its price as a float.
+    failures maps each symbol that could not be priced to the exception raised.
+
+    Fresh quotes come from quote_cache, then quote_store; the remaining symbols are fetched at the same
+    time over at most max_workers threads sharing the pooled session (or, if a scheduler is installed,
+    queued on it at the given priority). Unlike
+    get_stock_price, a failed symbol is reported instead of given a random price.
+
+    IF a price source is installed it answers, and symbols it cannot price are failures
+    IF Key == Test returns the constant values used for testing
+
+    symbols: an iterable of strings representing stock trading symbols; duplicates are fetched once
+    max_workers: a positive int, the most requests in flight at once
+    priority: as for get_stock_price
+    """
+    assert type(max_workers) == int and max_workers > 0
+    prices = {}
+    failures = {}
+    wanted = {}
+    for symbol in symbols:
+        assert type(symbol) == str and len(symbol) > 0, f'{symbol} is not a stock symbol'
+        if price_source is not None:
+            try:
+                prices[symbol] = price_source.price(symbol)
+            except KeyError as error:
+                failures[symbol] = error
+            continue
+        if key == "TEST":
+            prices[symbol] = _test_stock_price(symbol)
+            continue
+        upper = symbol.upper()
+        price = quote_cache.get(upper)
+        if price is not None:
+            prices[symbol] = price
+        else:
+            wanted.setdefault(upper,[]).append(symbol)
+    if len(wanted) != 0 and quote_store is not None:
+        for upper, (price, age) in quote_store.get_many(wanted).items():
+            quote_cache.put(upper,price,age)
+            for symbol in wanted.pop(upper):
+                prices[symbol] = price
+    if len(wanted) == 0:
+        return prices, failures
+    if scheduler is not None:
+        futures = {upper: scheduler.request(upper,lambda upper=upper: _fetch_stock_price(upper),priority)
+                   for upper in wanted}
+        for upper, future in futures.items():
+            for symbol in wanted[upper]:
+                try:
+                    prices[symbol] = future.result()
+                except Exception as error:
+                    failures[symbol] = error
+        return prices, failures
+    import concurrent.futures
+    workers = min(max_workers,len(wanted))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_fetch_stock_price,upper): upper for upper in wanted}
+        for future in concurrent.futures.as_completed(futures):
+            upper = futures[future]
+            for symbol in wanted[upper]:
+                try:
+                    prices[symbol] = future.result()
+                except Exception as error:
+                    failures[symbol] = error
+    return prices, failures
+
+def _get_async_executor():
+    """
+    Returns: the thread pool the async fetchers run blocking requests on.
+
+    It has POOL_SIZE threads, one per pooled connection, and is created on first use.
+    """
+    global _async_executor
+    if _async_executor is None:
+        import concurrent.futures
+        with _session_lock:
+            if _async_executor is None:
+                _async_executor = concurrent.futures.ThreadPoolExecutor(max_workers=POOL_SIZE,thread_name_prefix="a3-quote")
+    return _async_executor
+
+async def get_stock_price_async(stock):
+    """
+    Returns: current price of stock as a float; the awaitable version of get_stock_price.
+
+    While one request waits on the network the event loop is free to run other
+    coroutines, so many awaiting callers overlap their latency over the shared pool.
+
+    stock: a string representing a company's stock tranding symbol
+    """
+    if price_source is not None:
+        return price_source.price(stock)
+    if key == "TEST":
+        return _test_stock_price(stock)
+    stock = stock.upper()
+    price = _cached_price(stock)
+    if price is not None:
+        return price
+    import asyncio
+    loop = asyncio.get_running_loop()
+    try:
+        if scheduler is not None:
+            return await asyncio.wrap_future(scheduler.request(stock,lambda: _fetch_stock_price(stock)))
+        return await loop.run_in_executor(_get_async_executor(),_fetch_stock_price,stock)
+    except Exception:
+        a3metrics.count("a3helpers.price_fallback.stock")
+        return random.random() * 100
+
+async def get_BTC_price_async():
+    """
+    Returns: current price of BitCoin as a float; the awaitable version of get_BTC_price.
+    """
+    if price_source is not None:
+        return price_source.price(BTC_SYMBOL)
+    if key == "TEST":
+        return 18.65
+    price = _cached_price(BTC_SYMBOL)
+    if price is not None:
+        return price
+    import asyncio
+    loop = asyncio.get_running_loop()
+    try:
+        if scheduler is not None:
+            return await asyncio.wrap_future(scheduler.request(BTC_SYMBOL,_fetch_BTC_price))
+        return await loop.run_in_executor(_get_async_executor(),_fetch_BTC_price)
+    except Exception:
+        a3metrics.count("a3helpers.price_fallback.btc")
+        return random.random() * 100
+
+async def get_stock_prices_async(symbols):
+    """
+    Returns: a dict mapping each symbol to its current price as a float.
+
+    All symbols are awaited at the same time; like get_stock_price, a failed fetch
+    gets a random price.
+
+    symbols: an iterable of strings representing stock trading symbols
+    """
+    import asyncio
+    symbols = list(dict.fromkeys(symbols))
+    prices = await asyncio.gather(*[get_stock_price_async(symbol) for symbol in symbols])
+    return dict(zip(symbols,prices))
@@ -0,0 +1,418 @@
+"""
+Historical daily prices for A3.
+
+a3helpers only asks Alpha Vantage for GLOBAL_QUOTE, one current price per request.
+A HistoryStore instead keeps the whole daily series of every symbol on disk, pulled
+once with TIME_SERIES_DAILY (outputsize=full) or read from a CSV or JSON dump, so
+holding-period and valuation work is a memory-mapped read instead of an API call.
+
+Dumps and downloads are parsed as a stream: CSV line by line, and the JSON
+"Time Series (Daily)" object one day at a time, so a large dump is never held
+in memory as text or as a parsed document. Only the two compact arrays that
+are written out (array('q') and array('d')) are built.
+
+Each symbol gets its own file in the store's directory, named SYMBOL.a3hs:
+    header  - magic b"A3HS", version u32, count u64
+    data    - count int64 timestamps (sorted), then count float64 closing prices
+A daily close is stamped at CLOSE_HOUR on its date in the market's time zone
+(a3prices.MARKET_ZONE), so the price at a time during a trading day is the previous
+day's close, and from CLOSE_HOUR on it is that day's, whatever the machine's time zone.
+
+HistoryStore is an a3prices.PriceSource, so it can be installed with
+a3helpers.set_price_source to run a3 against history.
+"""
+
+import os
+import json
+import mmap
+import array
+import bisect
+import struct
+import datetime
+import urllib.parse
+import a3prices
+
+MAGIC = b"A3HS"
+VERSION = 1
+SUFFIX = ".a3hs"
+CLOSE_HOUR = 16
+_HEADER = struct.Struct("<4sIQ")
+
+HISTORY_URL = "https://www.alphavantage.co/query?function=TIME_SERIES_DAILY&outputsize=full&datatype=csv&symbol="
+# Column names that may hold the date and the closing price of a row in a CSV dump.
+DATE_COLUMNS = ("timestamp","date","time","day")
+# The plain close is preferred over the adjusted one, in CSV and JSON dumps alike, so one
+# symbol ingested from either format gives the same series.
+CLOSE_COLUMNS = ("close","4. close","adjusted_close","adj close","5. adjusted close","price")
+CHUNK = 65536
+
+
+def close_timestamp(day):
+    """
+    Returns: the timestamp (an int) given to the close of day: CLOSE_HOUR on the
+    wall clock of the market.
+
+    day: a str in the form YYYY-MM-DD (anything after the date is ignored), a date or a datetime object
+    """
+    if isinstance(day,str):
+        day = datetime.date(int(day[0:4]),int(day[5:7]),int(day[8:10]))
+    return a3prices.to_timestamp(datetime.datetime(day.year,day.month,day.day,CLOSE_HOUR))
+
+
+def iter_csv(lines):
+    """
+    Yields: a (timestamp, close) pair for every row of a CSV dump of daily prices.
+
+    The first line must be a header naming a date column (e.g. timestamp or date) and a
+    closing price column (e.g. close or price), as in Alpha Vantage's datatype=csv output.
+
+    Parameter lines: the lines of the dump
+    Precondition: lines is an iterable of strs, e.g. an open text file
+    """
+    lines = iter(lines)
+    header = next(lines,"")
+    names = [name.strip().strip('"').lower() for name in header.split(",")]
+    date = next((names.index(n) for n in DATE_COLUMNS if n in names),None)
+    close = next((names.index(n) for n in CLOSE_COLUMNS if n in names),None)
+    if date is None or close is None:
+        raise ValueError(f'not a daily price CSV: {header.strip()[:200]}')
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        fields = line.split(",")
+        yield close_timestamp(fields[date].strip().strip('"')), float(fields[close])
+
+
+def iter_json(stream):
+    """
+    Yields: a (timestamp, close) pair for every day of a JSON dump of daily prices.
+
+    The dump is in Alpha Vantage's TIME_SERIES_DAILY layout, i.e. an object with a
+    "Time Series (Daily)" object mapping dates to objects with a "4. close" (or
+    "5. adjusted close") price, chosen in the same order as CLOSE_COLUMNS for a CSV dump.
+    It is read in chunks and decoded one day at a time.
+
+    Parameter stream: the dump
+    Precondition: stream is a text file object
+    """
+    decoder = json.JSONDecoder()
+    text = ""
+    pos = 0
+    done = False
+
+    def more():
+        # Drops what has been decoded and reads the next chunk; pos moves to the start.
+        nonlocal text, pos, done
+        chunk = stream.read(CHUNK)
+        done = not chunk
+        text = text[pos:]+chunk
+        pos = 0
+
+    at = -1
+    while at < 0:
+        more()
+        at = text.find('"Time Series')
+        if done and at < 0:
+            raise ValueError(f'no "Time Series" object in JSON dump: {text.strip()[:200]}')
+    while text.find("{",at) < 0 and not done:
+        more()
+    pos = text.find("{",at)+1
+    while True:
+        # Each day is "date": {...}, and is only decoded once all of it has been read.
+        while pos < len(text) and text[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(text) and text[pos] == "}":
+            return
+        try:
+            if pos == len(text):
+                raise ValueError('the chunk ends between two days')
+            day, end = decoder.raw_decode(text,pos)
+            end = text.index(":",end)+1
+            while end < len(text) and text[end] in " \t\r\n":
+                end += 1
+            values, end = decoder.raw_decode(text,end)
+        except ValueError:
+            if done:
+                raise ValueError('the "Time Series" object is cut short') from None
+            more()
+            continue
+        close = next(values[key] for key in CLOSE_COLUMNS if key in values)
+        yield close_timestamp(day), float(close)
+        pos = end
+        if len(text)-pos < CHUNK and not done:
+            more()
+
+
+def iter_dump(path):
+    """
+    Yields: a (timestamp, close) pair for every day in the dump at path.
+
+    Files ending in .json are read with iter_json, anything else with iter_csv.
+    """
+    with open(path,"r",encoding="utf-8",newline="") as stream:
+        if path.lower().endswith(".json"):
+            yield from iter_json(stream)
+        else:
+            yield from iter_csv(stream)
+
+
+class HistoryStore(a3prices.PriceSource):
+    """
+    The class HistoryStore is a directory of daily price series, one memory-mapped file per symbol.
+
+    Series are added with ingest (from (timestamp, close) pairs), ingest_dump (from a CSV
+    or JSON file) or fetch (from Alpha Vantage), and read with price_at, window and
+    series. A series is mapped the first time it is read and stays mapped until close.
+
+    The constructor can be called like this
+    HistoryStore("history")
+    Which uses (and creates if needed) the directory history.
+    """
+
+    def __init__(self,root):
+        """
+        :param root: the directory holding the series files
+        :type root:  ``str``
+        """
+        super().__init__()
+        self.root = root
+        os.makedirs(root,exist_ok=True)
+        self._maps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+    def path(self,symbol):
+        """
+        Returns: the file holding the series of symbol.
+
+        The symbol is percent-encoded in the file name (BTC/USD is BTC%2FUSD.a3hs), so
+        any symbol maps to a file name and back.
+        """
+        return os.path.join(self.root,urllib.parse.quote(symbol.upper(),safe="")+SUFFIX)
+
+    def symbols(self):
+        """
+        Returns: a sorted list of the symbols with a series in the store.
+        """
+        return sorted(urllib.parse.unquote(name[:-len(SUFFIX)]) for name in os.listdir(self.root)
+                      if name.endswith(SUFFIX))
+
+    def __contains__(self,symbol):
+        return os.path.exists(self.path(symbol))
+
+    def _release(self,symbol):
+        """
+        Unmaps the series of symbol if it is mapped.
+        """
+        mapped = self._maps.pop(symbol,None)
+        if mapped is not None:
+            handle, region, views = mapped
+            for view in views:
+                view.release()
+            try:
+                region.close()
+            except BufferError:
+                # The caller still holds views from series or window; the map closes when they go.
+                pass
+            handle.close()
+
+    def close(self):
+        """
+        Unmaps every series.
+        """
+        for symbol in list(self._maps):
+            self._release(symbol)
+
+    def series(self,symbol):
+        """
+        Returns: a tuple (timestamps, prices) of read-only memoryviews over the series of
+        symbol, of int64 and float64 items.
+
+        Raises KeyError if the store has no series for symbol.
+
+        Parameter symbol: the symbol to read
+        Precondition: symbol is a non-empty str
+        """
+        symbol = symbol.upper()
+        mapped = self._maps.get(symbol)
+        if mapped is None:
+            try:
+                handle = open(self.path(symbol),"rb")
+            except FileNotFoundError:
+                raise KeyError(f'no history for {symbol}') from None
+            magic, version, count = _HEADER.unpack(handle.read(_HEADER.size))
+            assert magic == MAGIC, f'{self.path(symbol)} is not a history file'
+            assert version == VERSION, f'{self.path(symbol)} has unsupported version {version}'
+            if count == 0:
+                handle.close()
+                return memoryview(array.array("q")), memoryview(array.array("d"))
+            region = mmap.mmap(handle.fileno(),0,access=mmap.ACCESS_READ)
+            start = _HEADER.size
+            whole = memoryview(region)
+            raw_times = whole[start:start+8*count]
+            raw_prices = whole[start+8*count:start+16*count]
+            views = (raw_times.cast("q"),raw_prices.cast("d"),raw_times,raw_prices,whole)
+            mapped = (handle,region,views)
+            self._maps[symbol] = mapped
+        return mapped[2][0], mapped[2][1]
+
+    def price_at(self,symbol,time):
+        """
+        Returns: the closing price of symbol as of time, i.e. of the last close at or before time,
+        as a float. If time is None the last close is used.
+
+        Raises KeyError if symbol has no history or time is before its first close.
+
+        Parameter symbol: the symbol to price
+        Precondition: symbol is a str
+
+        Parameter time: the time to price symbol at
+        Precondition: time is a datetime object, a number of seconds since the epoch, or None
+        """
+        times, prices = self.series(symbol)
+        i = len(times) if time is None else bisect.bisect_right(times,a3prices.to_timestamp(time))
+        if i == 0:
+            raise KeyError(f'no close for {symbol} at or before {time}')
+        return prices[i-1]
+
+    def window(self,symbol,start,end):
+        """
+        Returns: a tuple (timestamps, prices) of memoryviews over the closes of symbol from
+        start to end inclusive.
+
+        Parameter symbol: the symbol to read
+        Precondition: symbol is a non-empty str
+
+        Parameter start: the first time included
+        Precondition: start is a datetime object or a number of seconds since the epoch
+
+        Parameter end: the last time included
+        Precondition: end is a datetime object or a number of seconds since the epoch
+        """
+        times, prices = self.series(symbol)
+        i = bisect.bisect_left(times,a3prices.to_timestamp(start))
+        j = bisect.bisect_right(times,a3prices.to_timestamp(end))
+        return times[i:j], prices[i:j]
+
+    def first_time(self,symbol):
+        """
+        Returns: the time of the first close of symbol as a datetime object.
+        """
+        return a3prices.from_timestamp(self.series(symbol)[0][0])
+
+    def last_time(self,symbol):
+        """
+        Returns: the time of the last close of symbol as a datetime object.
+        """
+        return a3prices.from_timestamp(self.series(symbol)[0][-1])
+
+    def ingest(self,symbol,pairs,merge=True):
+        """
+        Returns: the number of closes now stored for symbol.
+
+        Writes the series of symbol from pairs, replacing its file atomically.
+
+        Parameter symbol: the symbol the closes are for
+        Precondition: symbol is a non-empty str
+
+        Parameter pairs: the closes
+        Precondition: pairs is an iterable of (time, price) pairs, where time is a datetime object
+        or a number of seconds since the epoch and price is a non-negative number, in any order
+
+        Parameter merge: whether closes already stored are kept where pairs has no close at the
+        same time; when two closes share a time, the one from pairs (the later one) wins
+        Precondition: merge is a bool
+        """
+        assert type(symbol) == str and len(symbol) > 0, f'{symbol} is not a symbol'
+        symbol = symbol.upper()
+        times = array.array("q")
+        prices = array.array("d")
+        if merge and symbol in self:
+            old_times, old_prices = self.series(symbol)
+            times.frombytes(old_times.tobytes())
+            prices.frombytes(old_prices.tobytes())
+        ordered = True
+        for time, price in pairs:
+            assert price >= 0, f'{price} must not be negative'
+            stamp = a3prices.to_timestamp(time)
+            if times and stamp <= times[-1]:
+                ordered = False
+            times.append(stamp)
+            prices.append(float(price))
+        if not ordered:
+            # Dumps are usually newest first; a stable sort keeps the last close of a repeated time last.
+            order = sorted(range(len(times)),key=times.__getitem__)
+            times = array.array("q",(times[i] for i in order))
+            prices = array.array("d",(prices[i] for i in order))
+            keep = [i for i in range(len(times)) if i+1 == len(times) or times[i] != times[i+1]]
+            if len(keep) < len(times):
+                times = array.array("q",(times[i] for i in keep))
+                prices = array.array("d",(prices[i] for i in keep))
+        self._write(symbol,times,prices)
+        return len(times)
+
+    def _write(self,symbol,times,prices):
+        """
+        Writes the file of symbol from two arrays, through a temporary file.
+        """
+        path = self.path(symbol)
+        temp = f'{path}.{os.getpid()}.tmp'
+        if struct.pack("=H",1) != struct.pack("<H",1):
+            times.byteswap()
+            prices.byteswap()
+        with open(temp,"wb") as out:
+            out.write(_HEADER.pack(MAGIC,VERSION,len(times)))
+            times.tofile(out)
+            prices.tofile(out)
+        self._release(symbol)
+        os.replace(temp,path)
+
+    def ingest_dump(self,path,symbol=None,merge=True):
+        """
+        Returns: the number of closes now stored for the symbol of the dump.
+
+        Parameter path: a CSV or JSON dump of daily prices (see iter_csv and iter_json)
+        Precondition: path is a str
+
+        Parameter symbol: the symbol the dump is for; None means the file name without its extension
+        Precondition: symbol is a non-empty str or None
+        """
+        if symbol is None:
+            symbol = os.path.splitext(os.path.basename(path))[0]
+        return self.ingest(symbol,iter_dump(path),merge)
+
+    def fetch(self,symbol,merge=True):
+        """
+        Returns: the number of closes now stored for symbol.
+
+        Downloads the full daily series of symbol from Alpha Vantage as CSV, with the key
+        and pooled session of a3helpers, and streams it into the store.
+
+        Parameter symbol: the stock to download
+        Precondition: symbol is a non-empty str
+        """
+        import a3helpers
+        url = HISTORY_URL+symbol.upper()+"&apikey="+a3helpers.key
+        with a3helpers.get_session().get(url,stream=True) as response:
+            response.raise_for_status()
+            lines = response.iter_lines(decode_unicode=True)
+            return self.ingest(symbol,iter_csv(line for line in lines if line is not None),merge)
+
+
+if __name__ == "__main__":
+    import sys
+    # python a3history.py ROOT SYMBOL_OR_DUMP ...
+    # Each argument that names a file is ingested as a dump; the others are fetched.
+    store = HistoryStore(sys.argv[1])
+    for name in sys.argv[2:]:
+        if os.path.isfile(name):
+            count = store.ingest_dump(name)
+        else:
+            count = store.fetch(name)
+        print(f'{name}: {count} closes')
+    store.close()
@@ -0,0 +1,430 @@
+"""
+Transaction journal for A3.
+
+A Journal is bound to one Portfolio. It has the same transactions as a3 (buying
+and selling stock and BitCoin, loans and loan payments, dividends and interest);
+each one calls the a3 function and, if it changed the portfolio, appends one small
+binary record of what changed to an append-only file.
+
+Records hold the state after the change (cash after, shares left in the lot, ...)
+rather than the prices used, so replaying them rebuilds the portfolio exactly
+without fetching any price. Every `snapshot_every` records the whole state is
+written as a snapshot record, and its offset is added to a small index file next
+to the journal (path + ".snap"). Restoring reads the last snapshot and replays only
+the records after it, so a journal with millions of events is rebuilt in time
+proportional to the tail.
+
+Record layout: type (u8), payload length (u32), payload. Strings are a u16 length
+and UTF-8 bytes. A record cut short by a crash is ignored and overwritten.
+"""
+
+import os
+import struct
+import datetime
+import a3
+import a3assets
+
+SNAPSHOT = 1
+BUY = 2
+SELL = 3
+BTC = 4
+LOAN = 5
+PAYMENT = 6
+DIVIDEND = 7
+INTEREST = 8
+
+_HEADER = struct.Struct("<BI")
+_OFFSET = struct.Struct("<Q")
+_STATE = struct.Struct("<dddqII")
+_LOT = struct.Struct("<dqq?")
+_LOAN = struct.Struct("<dqd")
+_BUY = struct.Struct("<dqd?q")
+_SELL = struct.Struct("<dqq")
+_BTC = struct.Struct("<dq")
+_LOAN_NEW = struct.Struct("<dddqd")
+_PAYMENT = struct.Struct("<ddqdq")
+_CASH = struct.Struct("<d")
+_BACKING = struct.Struct("<?")
+
+
+EPOCH = datetime.datetime(1970,1,1)
+MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def _micros(time):
+    """
+    Returns: the naive datetime time as an exact int count of microseconds since 1970-01-01.
+    """
+    return (time-EPOCH)//MICROSECOND
+
+
+def _from_micros(micros):
+    """
+    Returns: the naive datetime micros microseconds after 1970-01-01.
+    """
+    return EPOCH+datetime.timedelta(microseconds=micros)
+
+
+def _pack_str(text):
+    data = text.encode("utf-8")
+    return struct.pack("<H",len(data))+data
+
+
+def _unpack_str(data,offset):
+    (n,) = struct.unpack_from("<H",data,offset)
+    return data[offset+2:offset+2+n].decode("utf-8"), offset+2+n
+
+
+def encode_state(portfolio):
+    """
+    Returns: the bytes of a snapshot of portfolio: its cash, fees, rates, coins,
+    every lot and every loan, and whether its lots are kept in a LotStore.
+    """
+    stocks = list(portfolio.stocks or ())
+    loans = list(portfolio.loans or ())
+    parts = [_STATE.pack(portfolio.cash,portfolio.commission_fee,portfolio.loan_rate,portfolio.coins,
+                         len(stocks),len(loans))]
+    for stock in stocks:
+        parts.append(_LOT.pack(stock.buy_price,stock.shares,_micros(stock.buy_date),stock.short))
+        parts.append(_pack_str(stock.company))
+    for loan in loans:
+        parts.append(_LOAN.pack(loan.balance,loan.length,loan.late_fee))
+    parts.append(_BACKING.pack(isinstance(portfolio.stocks,a3assets.LotStore)))
+    return b"".join(parts)
+
+
+def decode_state(data):
+    """
+    Returns: a new Portfolio built from the bytes written by encode_state.
+
+    The lots are kept in a LotStore if they were when the snapshot was taken; snapshots
+    written before that was recorded end after the loans and get a list.
+    """
+    cash, fee, rate, coins, nstocks, nloans = _STATE.unpack_from(data,0)
+    offset = _STATE.size
+    portfolio = a3assets.Portfolio(cash)
+    portfolio.commission_fee = fee
+    portfolio.loan_rate = rate
+    portfolio.coins = coins
+    lots = []
+    for _ in range(nstocks):
+        price, shares, stamp, short = _LOT.unpack_from(data,offset)
+        company, offset = _unpack_str(data,offset+_LOT.size)
+        lots.append((company,price,shares,short,_from_micros(stamp)))
+    for _ in range(nloans):
+        balance, length, late_fee = _LOAN.unpack_from(data,offset)
+        offset += _LOAN.size
+        loan = a3assets.Loan(balance,length)
+        loan.late_fee = late_fee
+        portfolio.loans.append(loan)
+    if offset < len(data) and _BACKING.unpack_from(data,offset)[0]:
+        portfolio.stocks = a3assets.LotStore()
+    for lot in lots:
+        portfolio.add_stock(a3assets.Stock(*lot))
+    return portfolio
+
+
+class Journal(object):
+    """
+    The class Journal records every transaction on one Portfolio. It has 4 attributes.
+        path - A string representing the journal file
+        portfolio - The Portfolio being recorded
+        snapshot_every - A int representing how many records are written between snapshots
+        records - A int representing how many records were written, or replayed since the last snapshot
+
+    Make a journal with Journal.create (for a new file) or Journal.restore (to rebuild
+    the portfolio of an existing file and keep appending to it), and close it when done.
+
+    The portfolio should only be changed through the journal's methods, which take the
+    same arguments as the a3 functions of the same name minus the portfolio. Lots bought
+    through the journal are added to the portfolio with add_stock, and loans taken
+    through it are appended to portfolio.loans.
+    """
+
+    def __init__(self,path,portfolio,snapshot_every,offset,records,since_snapshot=0):
+        """
+        Use Journal.create or Journal.restore instead.
+
+        since_snapshot is the number of records already in the file after its last snapshot.
+        """
+        assert type(snapshot_every) == int and snapshot_every > 0
+        self.path = path
+        self.portfolio = portfolio
+        self.snapshot_every = snapshot_every
+        self.records = records
+        self._since_snapshot = since_snapshot
+        self._file = open(path,"r+b" if os.path.exists(path) else "w+b")
+        self._file.seek(offset)
+        self._file.truncate()
+        self._index = open(path+".snap","ab")
+        self._number()
+
+    def _number(self):
+        """
+        Numbers the portfolio's lots and loans in the order a snapshot of it lists them.
+
+        Records name a lot or loan by this number, which restore gives to the lot or loan
+        it rebuilds in the same place; later lots and loans are numbered in the order the
+        journal records them, however portfolio.loans changes in between.
+        """
+        self._lots = {stock: i for i, stock in enumerate(self.portfolio.stocks or ())}
+        self._loans = {loan: i for i, loan in enumerate(self.portfolio.loans or ())}
+
+    @classmethod
+    def create(cls,path,portfolio,snapshot_every=10000):
+        """
+        Returns: a new Journal at path for portfolio, starting with a snapshot of it.
+
+        Any journal already at path is replaced.
+
+        Parameter path: the journal file
+        Precondition: path is a str
+
+        Parameter portfolio: the portfolio to record
+        Precondition: portfolio is a Portfolio object
+
+        Parameter snapshot_every: records between snapshots
+        Precondition: snapshot_every is a positive int
+        """
+        assert isinstance(portfolio,a3assets.Portfolio)
+        for name in (path,path+".snap"):
+            if os.path.exists(name):
+                os.remove(name)
+        journal = cls(path,portfolio,snapshot_every,0,0)
+        journal.snapshot()
+        return journal
+
+    @classmethod
+    def restore(cls,path,snapshot_every=10000):
+        """
+        Returns: a Journal whose portfolio is rebuilt from the journal at path.
+
+        The last snapshot is loaded and only the records after it are replayed.
+
+        Parameter path: the journal file
+        Precondition: path is a str naming a journal made by Journal.create
+        """
+        length = os.path.getsize(path)
+        start = _last_snapshot(path,length)
+        with open(path,"rb") as source:
+            source.seek(start)
+            data = source.read()
+        portfolio = None
+        offset = 0
+        records = 0
+        tail = 0
+        lots = []
+        loans = []
+        while offset+_HEADER.size <= len(data):
+            kind, size = _HEADER.unpack_from(data,offset)
+            end = offset+_HEADER.size+size
+            if end > len(data):
+                break
+            payload = data[offset+_HEADER.size:end]
+            if kind == SNAPSHOT:
+                portfolio = decode_state(payload)
+                lots = list(portfolio.stocks)
+                loans = list(portfolio.loans)
+                tail = 0
+            else:
+                assert portfolio is not None, f'{path} does not start with a snapshot'
+                _apply(portfolio,lots,loans,kind,payload)
+                tail += 1
+            records += 1
+            offset = end
+        assert portfolio is not None, f'{path} has no snapshot'
+        journal = cls(path,portfolio,snapshot_every,start+offset,records,tail)
+        if tail >= snapshot_every:
+            journal.snapshot()
+        return journal
+
+    def _write(self,kind,payload):
+        """
+        Appends one record, then a snapshot if snapshot_every records have passed.
+        """
+        self._file.write(_HEADER.pack(kind,len(payload)))
+        self._file.write(payload)
+        self.records += 1
+        self._since_snapshot += 1
+        if self._since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    def snapshot(self):
+        """
+        Writes a snapshot of the whole portfolio and adds it to the snapshot index.
+        """
+        offset = self._file.tell()
+        payload = encode_state(self.portfolio)
+        self._number()
+        self._file.write(_HEADER.pack(SNAPSHOT,len(payload)))
+        self._file.write(payload)
+        self._file.flush()
+        self._index.write(_OFFSET.pack(offset))
+        self._index.flush()
+        self.records += 1
+        self._since_snapshot = 0
+
+    def flush(self):
+        """
+        Pushes buffered records to the operating system.
+        """
+        self._file.flush()
+
+    def close(self):
+        """
+        Flushes and closes the journal files.
+        """
+        self._file.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+    def invest_BitCoin(self,amount):
+        """
+        Returns: the result of a3.invest_BitCoin on the journal's portfolio, recording it if it succeeded.
+        """
+        result = a3.invest_BitCoin(self.portfolio,amount)
+        if result:
+            self._write(BTC,_BTC.pack(self.portfolio.cash,self.portfolio.coins))
+        return result
+
+    def sell_BitCoin(self,amount):
+        """
+        Returns: the result of a3.sell_BitCoin on the journal's portfolio, recording it if it succeeded.
+        """
+        result = a3.sell_BitCoin(self.portfolio,amount)
+        if result:
+            self._write(BTC,_BTC.pack(self.portfolio.cash,self.portfolio.coins))
+        return result
+
+    def compute_interest(self,rate,years,times_compounded):
+        """
+        Returns: the result of a3.compute_interest on the journal's portfolio, recording it.
+        """
+        result = a3.compute_interest(self.portfolio,rate,years,times_compounded)
+        self._write(INTEREST,_CASH.pack(self.portfolio.cash))
+        return result
+
+    def take_loan(self,amount,length):
+        """
+        Returns: the Loan from a3.take_loan on the journal's portfolio, or None.
+
+        A granted loan is appended to portfolio.loans and recorded.
+        """
+        loan = a3.take_loan(self.portfolio,amount,length)
+        if loan is not None:
+            self._loans[loan] = len(self._loans)
+            self.portfolio.loans.append(loan)
+            self._write(LOAN,_LOAN_NEW.pack(self.portfolio.cash,self.portfolio.loan_rate,
+                                            loan.balance,loan.length,loan.late_fee))
+        return loan
+
+    def pay_loan(self,loan):
+        """
+        Returns: the result of a3.pay_loan on the journal's portfolio, recording the change.
+
+        Parameter loan: the loan to pay
+        Precondition: loan is a Loan in the journal's portfolio.loans
+        """
+        index = self._loans[loan]
+        result = a3.pay_loan(self.portfolio,loan)
+        self._write(PAYMENT,_PAYMENT.pack(self.portfolio.cash,self.portfolio.loan_rate,index,
+                                          loan.balance,loan.length))
+        return result
+
+    def buy_stock(self,stock,amount_shares,short,time):
+        """
+        Returns: the lot bought by a3.buy_stock for the journal's portfolio, or None.
+
+        A bought lot is added with add_stock and recorded.
+        """
+        bought = a3.buy_stock(self.portfolio,stock,amount_shares,short,time)
+        if bought is None:
+            return None
+        bought = self.portfolio.add_stock(bought)
+        self._lots[bought] = len(self._lots)
+        self._write(BUY,_BUY.pack(self.portfolio.cash,bought.shares,bought.buy_price,bought.short,
+                                  _micros(bought.buy_date))+_pack_str(bought.company))
+        return bought
+
+    def sell_stock(self,amount_shares,time,stock):
+        """
+        Returns: the result of a3.sell_stock on the journal's portfolio, recording it if it succeeded.
+
+        Parameter stock: the lot to sell from
+        Precondition: stock is a lot of the journal's portfolio
+        """
+        index = self._lots[stock]
+        result = a3.sell_stock(self.portfolio,amount_shares,time,stock)
+        if result:
+            self._write(SELL,_SELL.pack(self.portfolio.cash,index,stock.shares))
+        return result
+
+    def pay_dividends(self,stock,company,payments):
+        """
+        Returns: the result of a3.pay_dividends on the journal's portfolio, recording it if it succeeded.
+        """
+        result = a3.pay_dividends(self.portfolio,stock,company,payments)
+        if result:
+            self._write(DIVIDEND,_CASH.pack(self.portfolio.cash)+_pack_str(company))
+        return result
+
+
+def _last_snapshot(path,length):
+    """
+    Returns: the offset of the last snapshot in the journal at path that lies
+    within its first `length` bytes, or 0 if there is no index.
+    """
+    try:
+        with open(path+".snap","rb") as index:
+            data = index.read()
+    except FileNotFoundError:
+        return 0
+    for i in range(len(data)//_OFFSET.size-1,-1,-1):
+        (offset,) = _OFFSET.unpack_from(data,i*_OFFSET.size)
+        if offset < length:
+            return offset
+    return 0
+
+
+def _apply(portfolio,lots,loans,kind,payload):
+    """
+    Applies one record to portfolio; lots and loans list the portfolio's lots and loans
+    in the order the journal numbered them.
+    """
+    if kind == BUY:
+        cash, shares, price, short, stamp = _BUY.unpack_from(payload,0)
+        company, _ = _unpack_str(payload,_BUY.size)
+        portfolio.cash = cash
+        lots.append(portfolio.add_stock(a3assets.Stock(company,price,shares,short,_from_micros(stamp))))
+    elif kind == SELL:
+        cash, index, shares = _SELL.unpack_from(payload,0)
+        portfolio.cash = cash
+        lots[index].shares = shares
+    elif kind == BTC:
+        cash, coins = _BTC.unpack_from(payload,0)
+        portfolio.cash = cash
+        portfolio.coins = coins
+    elif kind == LOAN:
+        cash, rate, balance, length, late_fee = _LOAN_NEW.unpack_from(payload,0)
+        portfolio.cash = cash
+        portfolio.loan_rate = rate
+        loan = a3assets.Loan(balance,length)
+        loan.late_fee = late_fee
+        portfolio.loans.append(loan)
+        loans.append(loan)
+    elif kind == PAYMENT:
+        cash, rate, index, balance, length = _PAYMENT.unpack_from(payload,0)
+        portfolio.cash = cash
+        portfolio.loan_rate = rate
+        loans[index].balance = balance
+        loans[index].length = length
+    elif kind in (DIVIDEND,INTEREST):
+        (cash,) = _CASH.unpack_from(payload,0)
+        portfolio.cash = cash
+    else:
+        raise ValueError(f'unknown journal record type {kind}')
@@ -0,0 +1,202 @@
+"""
+Loan amortization for A3.
+
+a3.pay_loan makes one monthly payment on one Loan. A LoanBook holds many loans,
+and the portfolios that owe them, in NumPy arrays and makes the monthly payment on
+all of them at once, following the same rules:
+    1. If the portfolio's cash is less than balance/length, the balance increases by
+       the late_fee and the cash stays the same.
+    2. Otherwise balance/length is paid from the cash, the balance decreases by it and
+       the length decreases by one; when the last payment is made the portfolio's
+       loan_rate decreases by 0.01.
+
+Loans with no months left are skipped. When one portfolio owes several loans they
+are paid in the order of its loans list, each seeing the cash left by the ones
+before it, exactly as calling pay_loan on them in that order would. To keep this
+exact and still vectorized, a month is processed in rounds: round k pays the k-th
+loan of every portfolio at once.
+
+NumPy is required.
+"""
+
+import numpy
+import a3assets
+
+
+class Schedule(object):
+    """
+    The class Schedule is the payment history of a LoanBook over some months. It has 3 attributes.
+        payments - A months x loans float array of the amount paid on each loan each month
+        late - A months x loans bool array; True where the payment could not be made
+        balance - A months x loans float array of each loan's balance after each month
+
+    Loans that were already paid off have a payment of 0.0 and are not late.
+    """
+
+    def __init__(self,payments,late,balance):
+        self.payments = payments
+        self.late = late
+        self.balance = balance
+
+    def total_paid(self):
+        """
+        Returns: a float array with the total paid on each loan over the schedule.
+        """
+        return self.payments.sum(axis=0)
+
+
+class LoanBook(object):
+    """
+    The class LoanBook is a set of loans kept in arrays. Per loan it has
+        balance - A float array of the balance still owed
+        length - An int array of the months left
+        late_fee - A float array of the fee added when a payment is missed
+        owner - An int array giving the index of the portfolio owing each loan
+    and per portfolio
+        cash - A float array of cash on hand
+        loan_rate - A float array of loan rates
+
+    A book is usually made from Portfolio objects with LoanBook.from_portfolios, run
+    with advance, and copied back into the objects with write_back.
+    """
+
+    def __init__(self,balance,length,late_fee,owner,cash,loan_rate):
+        """
+        :param balance: balance owed per loan
+        :type balance:  array of ``float`` >=0
+
+        :param length: months left per loan
+        :type length:  array of ``int`` >=0
+
+        :param late_fee: late fee per loan
+        :type late_fee:  array of ``float`` >=0
+
+        :param owner: index into cash and loan_rate of the portfolio owing each loan;
+        loans of the same portfolio are paid in the order they appear here
+        :type owner:  array of ``int``
+
+        :param cash: cash per portfolio
+        :type cash:  array of ``float`` >=0
+
+        :param loan_rate: loan rate per portfolio
+        :type loan_rate:  array of ``float`` >=0
+        """
+        self.balance = numpy.array(balance,dtype=numpy.float64)
+        self.length = numpy.array(length,dtype=numpy.int64)
+        self.late_fee = numpy.array(late_fee,dtype=numpy.float64)
+        self.owner = numpy.array(owner,dtype=numpy.int64)
+        self.cash = numpy.array(cash,dtype=numpy.float64)
+        self.loan_rate = numpy.array(loan_rate,dtype=numpy.float64)
+        n = len(self.balance)
+        assert len(self.length) == n and len(self.late_fee) == n and len(self.owner) == n, 'loan arrays must have the same length'
+        assert len(self.cash) == len(self.loan_rate), 'portfolio arrays must have the same length'
+        assert n == 0 or (self.owner.min() >= 0 and self.owner.max() < len(self.cash)), 'owner out of range'
+        assert (self.balance >= 0).all() and (self.length >= 0).all() and (self.late_fee >= 0).all()
+        self.portfolios = None
+        self.loans = None
+        self._rounds = _rounds(self.owner)
+
+    def __len__(self):
+        return len(self.balance)
+
+    @classmethod
+    def from_portfolios(cls,portfolios):
+        """
+        Returns: a LoanBook of every loan in the loans list of each portfolio.
+
+        Parameter portfolios: the portfolios owing the loans
+        Precondition: portfolios is a list of Portfolio objects, each listed once
+        """
+        balance = []
+        length = []
+        late_fee = []
+        owner = []
+        loans = []
+        for i, portfolio in enumerate(portfolios):
+            assert isinstance(portfolio,a3assets.Portfolio), f'{portfolio} is not a Portfolio'
+            for loan in portfolio.loans:
+                balance.append(loan.balance)
+                length.append(loan.length)
+                late_fee.append(loan.late_fee)
+                owner.append(i)
+                loans.append(loan)
+        book = cls(balance,length,late_fee,owner,[p.cash for p in portfolios],[p.loan_rate for p in portfolios])
+        book.portfolios = list(portfolios)
+        book.loans = loans
+        return book
+
+    def advance(self,months=1,record=False):
+        """
+        Returns: a Schedule of the months run if record is True, otherwise None.
+
+        Makes the monthly payment on every loan, `months` times.
+
+        Parameter months: how many months to run
+        Precondition: months is a non-negative int
+
+        Parameter record: whether to keep the payment schedule
+        Precondition: record is a bool
+        """
+        assert type(months) == int and months >= 0
+        n = len(self.balance)
+        if record:
+            payments = numpy.zeros((months,n))
+            late = numpy.zeros((months,n),dtype=bool)
+            balance = numpy.empty((months,n))
+        for month in range(months):
+            for loans in self._rounds:
+                active = loans[self.length[loans] > 0]
+                if len(active) == 0:
+                    continue
+                owners = self.owner[active]
+                due = self.balance[active]/self.length[active]
+                missed = self.cash[owners] < due
+                missed_loans = active[missed]
+                self.balance[missed_loans] += self.late_fee[missed_loans]
+                paid = active[~missed]
+                paid_owners = owners[~missed]
+                paid_due = due[~missed]
+                finished = self.length[paid] == 1
+                self.loan_rate[paid_owners[finished]] -= 0.01
+                self.cash[paid_owners] -= paid_due
+                self.balance[paid] -= self.balance[paid]/self.length[paid]
+                self.length[paid] -= 1
+                if record:
+                    payments[month,paid] = paid_due
+                    late[month,missed_loans] = True
+            if record:
+                balance[month] = self.balance
+        if record:
+            return Schedule(payments,late,balance)
+        return None
+
+    def write_back(self):
+        """
+        Copies balances, lengths, cash and loan rates back into the Loan and Portfolio
+        objects the book was made from.
+        """
+        assert self.portfolios is not None, 'this LoanBook was not made from portfolios'
+        for i, loan in enumerate(self.loans):
+            loan.balance = float(self.balance[i])
+            loan.length = int(self.length[i])
+        for i, portfolio in enumerate(self.portfolios):
+            portfolio.cash = float(self.cash[i])
+            portfolio.loan_rate = float(self.loan_rate[i])
+
+
+def _rounds(owner):
+    """
+    Returns: a list of int arrays; array k holds the k-th loan of every portfolio.
+
+    Within a round each portfolio appears at most once, so the round can be updated
+    with plain fancy indexing.
+    """
+    if len(owner) == 0:
+        return []
+    order = numpy.argsort(owner,kind='stable')
+    sorted_owner = owner[order]
+    starts = numpy.r_[0,numpy.flatnonzero(numpy.diff(sorted_owner))+1]
+    group_start = numpy.repeat(starts,numpy.diff(numpy.r_[starts,len(owner)]))
+    rank = numpy.empty(len(owner),dtype=numpy.int64)
+    rank[order] = numpy.arange(len(owner))-group_start
+    return [numpy.flatnonzero(rank == k) for k in range(rank.max()+1)]
@@ -0,0 +1,157 @@
+"""
+Tax-lot relief for A3.
+
+a3.sell_stock sells from the one lot it is given. sell_lots sells shares of a
+ticker across all of its lots, choosing which lots give up their shares with one
+of four relief methods:
+    FIFO - the earliest bought lots first
+    LIFO - the latest bought lots first
+    HIGHEST_COST - the lots with the highest buy price first (the smallest taxable profit)
+    SPECIFIC - the lots the caller names, in the order named
+
+The lots of each ticker are kept by the Portfolio's index in LotQueues ordered by
+buy date (see a3assets.Position), so a sale only visits the lots it takes shares
+from: the first lots for FIFO, the last for LIFO, and the top of a heap for
+HIGHEST_COST. The one-year line between long-term and short-term lots is found
+with one binary search per sale instead of calling one_year_ago for every lot.
+
+Each lot is taxed on its own profit exactly as sell_stock would tax it; one
+commission fee is charged per call.
+"""
+
+import datetime
+import a3
+import a3assets
+import a3helpers
+
+FIFO = 'fifo'
+LIFO = 'lifo'
+HIGHEST_COST = 'highest_cost'
+SPECIFIC = 'specific'
+METHODS = (FIFO,LIFO,HIGHEST_COST,SPECIFIC)
+
+
+def _queue(portfolio,ticker,short):
+    """
+    Returns: the LotQueue of ticker's lots on the side given by short, or None if there are none.
+    """
+    position = portfolio.position(ticker)
+    return None if position is None else position.queue(short)
+
+
+def select(portfolio,ticker,amount_shares,method=FIFO,short=False,lots=None):
+    """
+    Returns: a list of (lot, shares) pairs saying how many shares to take from each lot
+    to relieve amount_shares shares of ticker by method, in the order they are taken.
+    It holds fewer shares in total if the lots hold fewer. Nothing is changed.
+
+    Parameter portfolio: the portfolio holding the lots
+    Precondition: portfolio is a Portfolio object whose lots were added with add_stock
+
+    Parameter ticker: the stock symbol
+    Precondition: ticker is a str
+
+    Parameter amount_shares: how many shares to relieve
+    Precondition: amount_shares is a positive int
+
+    Parameter method: the relief method
+    Precondition: method is one of FIFO, LIFO, HIGHEST_COST and SPECIFIC
+
+    Parameter short: whether to relieve the shorted lots instead of the others
+    Precondition: short is a bool
+
+    Parameter lots: for SPECIFIC, the lots to take shares from, in order
+    Precondition: lots is a list of lots of ticker on the side given by short for SPECIFIC, None otherwise
+    """
+    assert type(amount_shares) == int and amount_shares > 0
+    assert method in METHODS, f'{method} is not a relief method'
+    assert type(short) == bool
+    assert (lots is not None) == (method == SPECIFIC), 'lots are given exactly when method is SPECIFIC'
+    queue = _queue(portfolio,ticker,short)
+    if queue is None:
+        return []
+    if method == SPECIFIC:
+        position = portfolio.position(ticker)
+        for lot in lots:
+            assert lot in position.lots and lot.short == short, f'{lot} is not a {ticker} lot of this portfolio'
+        order = iter(lots)
+    elif method == FIFO:
+        order = queue.oldest()
+    elif method == LIFO:
+        order = queue.newest()
+    else:
+        order = queue.highest_cost()
+    plan = []
+    remaining = amount_shares
+    try:
+        for lot in order:
+            taken = min(lot.shares,remaining)
+            if taken:
+                plan.append((lot,taken))
+                remaining -= taken
+            if remaining == 0:
+                break
+    finally:
+        if hasattr(order,'close'):
+            order.close()
+    return plan
+
+
+def split(portfolio,ticker,time,short=False):
+    """
+    Returns: a tuple (long_term, short_term) of lists of ticker's lots on the side given
+    by short; long_term holds the lots bought more than a year before time, both oldest first.
+
+    The line between the two is found with one binary search over the buy dates.
+
+    Parameter time: the time a sale would happen at
+    Precondition: time is a datetime object
+    """
+    queue = _queue(portfolio,ticker,short)
+    if queue is None:
+        return [], []
+    return queue.split(a3helpers.one_year_ago(time))
+
+
+def sell_lots(portfolio,ticker,amount_shares,time,method=FIFO,short=False,lots=None):
+    """
+    Returns: the number of shares sold as an int; 0 if the sale failed.
+
+    Sells up to amount_shares shares of ticker from its lots, chosen by method (see select).
+    Every lot is taxed on its own profit as sell_stock would tax it, long-term if it was
+    bought more than a year before time, and one commission fee is paid for the whole sale.
+
+    The sale fails, like sell_stock, outside trading hours or if the commission fee cannot
+    be paid, and also if there are no shares to sell.
+
+    Parameter portfolio: the portfolio selling
+    Precondition: portfolio is a Portfolio object whose lots were added with add_stock
+
+    Parameter ticker: the stock symbol
+    Precondition: ticker is a str
+
+    Parameter amount_shares: how many shares to sell
+    Precondition: amount_shares is a positive int
+
+    Parameter time: the time of the sale
+    Precondition: time is a datetime object
+
+    Parameter method, short, lots: as for select
+    """
+    assert isinstance(portfolio,a3assets.Portfolio)
+    assert isinstance(time,datetime.datetime)
+    if not a3._can_sell(portfolio,time):
+        return 0
+    plan = select(portfolio,ticker,amount_shares,method,short,lots)
+    if not plan:
+        return 0
+    sprice = a3helpers.get_stock_price(ticker)
+    cutoff = a3helpers.one_year_ago(time)
+    proceeds = 0.0
+    sold = 0
+    for lot, shares in plan:
+        proceeds += a3._taxed_profit(lot,shares,sprice,cutoff > lot.buy_date)
+        lot.shares = lot.shares-shares
+        sold += shares
+    portfolio.cash = portfolio.cash-portfolio.commission_fee+proceeds
+    return sold
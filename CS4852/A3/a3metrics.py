@@ -0,0 +1,251 @@
+"""
+Instrumentation for A3.
+
+Once enable() is called, every price fetch, every transaction function and every
+attribute setter of the a3assets classes records
+    calls - how many times it ran
+    failures - how many times it raised, or for a transaction returned False or None
+    latency - a histogram of how long each call took, in seconds
+and events such as the random-price fallback in a3helpers are counted.
+
+enable() works by replacing the functions in their modules (and the property
+setters on their classes) with timed wrappers, and disable() puts the originals
+back, so when instrumentation is off the hot paths run exactly the original code.
+Since modules such as a3sync and a3orders trade through the price-taking helpers
+of a3 (_buy_stock_at and the like) rather than its public functions, those helpers
+are timed too; a trade made through a3.buy_stock is then counted under both names.
+Only count() stays in the code, on rare paths, and is a single flag check when off.
+
+The data can be read with snapshot() as a dict, or with exposition() in the
+Prometheus text format.
+"""
+
+import time
+import bisect
+import datetime
+import importlib
+import threading
+import functools
+
+# Upper bounds in seconds of the latency histogram buckets; the last bucket is unbounded.
+BUCKETS = (1e-6,2.5e-6,5e-6,1e-5,2.5e-5,5e-5,1e-4,2.5e-4,5e-4,1e-3,2.5e-3,5e-3,
+           1e-2,2.5e-2,5e-2,0.1,0.25,0.5,1.0,2.5,5.0,10.0)
+
+# Functions timed by enable(), by module; a name Class.method times a method of a class.
+FUNCTIONS = {
+    'a3helpers': ('_fetch_stock_price','_fetch_BTC_price','get_stock_price','get_BTC_price',
+                  'get_stock_prices','get_stock_price_async','get_BTC_price_async','get_stock_prices_async'),
+    'a3': ('open_portfolio','invest_BitCoin','sell_BitCoin','compute_interest','take_loan','pay_loan',
+           'calculate_taxes','buy_stock','pay_dividends','sell_stock','invest_BitCoin_async',
+           'sell_BitCoin_async','buy_stock_async','sell_stock_async','_invest_BitCoin_at',
+           '_sell_BitCoin_at','_buy_stock_at','_sell_stock_at'),
+    'a3sync': ('invest_BitCoin','sell_BitCoin','compute_interest','take_loan','pay_loan','buy_stock',
+               'pay_dividends','sell_stock','sell_lots','execute_orders'),
+    'a3orders': ('execute_orders',),
+    'a3lots': ('sell_lots',),
+    'a3dividends': ('distribute','distribute_many'),
+    'a3journal': ('Journal._write','Journal.snapshot','Journal.flush'),
+}
+# Modules whose timed functions fail when they return False or None.
+JUDGED = ('a3','a3sync')
+# Classes whose property setters are timed by enable().
+CLASSES = {'a3assets': ('Portfolio','Loan','Stock','LotView')}
+
+enabled = False
+_lock = threading.Lock()
+_stats = {}
+_events = {}
+_originals = []
+
+
+class Stat(object):
+    """
+    The class Stat holds the measurements of one instrumented function. It has 5 attributes.
+        calls - A int representing how many calls finished
+        failures - A int representing how many of those calls failed
+        total - A float representing the seconds spent in all calls
+        buckets - A list of ints; buckets[i] counts calls no slower than BUCKETS[i],
+                  and the last entry counts the slower ones
+        max - A float representing the slowest call in seconds
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.total = 0.0
+        self.buckets = [0]*(len(BUCKETS)+1)
+        self.max = 0.0
+
+    def record(self,seconds,failed):
+        """
+        Adds one call that took `seconds` and failed if failed is True.
+        """
+        self.calls += 1
+        if failed:
+            self.failures += 1
+        self.total += seconds
+        self.buckets[bisect.bisect_left(BUCKETS,seconds)] += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def as_dict(self):
+        """
+        Returns: the measurements as a dict, with the histogram as cumulative counts per bucket bound.
+        """
+        cumulative = {}
+        running = 0
+        for bound, n in zip(BUCKETS+(float('inf'),),self.buckets):
+            running += n
+            cumulative[bound] = running
+        return {'calls': self.calls, 'failures': self.failures, 'seconds': self.total,
+                'mean_seconds': self.total/self.calls if self.calls else 0.0,
+                'max_seconds': self.max, 'histogram': cumulative}
+
+
+def _record(name,seconds,failed):
+    with _lock:
+        stat = _stats.get(name)
+        if stat is None:
+            stat = Stat()
+            _stats[name] = stat
+        stat.record(seconds,failed)
+
+
+def count(event,n=1):
+    """
+    Adds n to the counter of event, if instrumentation is on.
+
+    Parameter event: the event name, e.g. 'a3helpers.price_fallback.stock'
+    Precondition: event is a str
+    """
+    if enabled:
+        with _lock:
+            _events[event] = _events.get(event,0)+n
+
+
+def _failed(result):
+    return result is False or result is None
+
+
+def _timed(name,fn,judge):
+    """
+    Returns: a wrapper of fn recording every call under name.
+
+    A call fails if it raises, or if judge is True and it returns False or None.
+    """
+    import inspect
+    clock = time.perf_counter
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args,**kwargs):
+            start = clock()
+            try:
+                result = await fn(*args,**kwargs)
+            except BaseException:
+                _record(name,clock()-start,True)
+                raise
+            _record(name,clock()-start,judge and _failed(result))
+            return result
+    else:
+        @functools.wraps(fn)
+        def wrapper(*args,**kwargs):
+            start = clock()
+            try:
+                result = fn(*args,**kwargs)
+            except BaseException:
+                _record(name,clock()-start,True)
+                raise
+            _record(name,clock()-start,judge and _failed(result))
+            return result
+    return wrapper
+
+
+def enable():
+    """
+    Turns instrumentation on. Calling it while it is on does nothing.
+    """
+    global enabled
+    with _lock:
+        if enabled:
+            return
+        for module_name, names in FUNCTIONS.items():
+            module = importlib.import_module(module_name)
+            judge = module_name in JUDGED
+            for name in names:
+                owner = module
+                *path, attribute = name.split('.')
+                for part in path:
+                    owner = getattr(owner,part)
+                fn = vars(owner)[attribute]
+                _originals.append((owner,attribute,fn))
+                setattr(owner,attribute,_timed(module_name+'.'+name,fn,judge))
+        for module_name, class_names in CLASSES.items():
+            module = importlib.import_module(module_name)
+            for class_name in class_names:
+                cls = getattr(module,class_name)
+                for name, prop in list(vars(cls).items()):
+                    if isinstance(prop,property) and prop.fset is not None:
+                        setter = _timed(f'{module_name}.{class_name}.{name}.set',prop.fset,False)
+                        _originals.append((cls,name,prop))
+                        setattr(cls,name,property(prop.fget,setter,prop.fdel,prop.__doc__))
+        enabled = True
+
+
+def disable():
+    """
+    Turns instrumentation off and puts back the original functions. The data recorded is kept.
+    """
+    global enabled
+    with _lock:
+        while _originals:
+            owner, name, original = _originals.pop()
+            setattr(owner,name,original)
+        enabled = False
+
+
+def reset():
+    """
+    Clears every measurement and counter.
+    """
+    with _lock:
+        _stats.clear()
+        _events.clear()
+
+
+def snapshot():
+    """
+    Returns: a dict with 'enabled', 'taken' (an ISO time), 'functions' mapping each
+    instrumented name to its Stat.as_dict(), and 'events' mapping each event to its count.
+    """
+    with _lock:
+        return {'enabled': enabled, 'taken': datetime.datetime.now().isoformat(),
+                'functions': {name: stat.as_dict() for name, stat in sorted(_stats.items())},
+                'events': dict(sorted(_events.items()))}
+
+
+def exposition():
+    """
+    Returns: the measurements as a str in the Prometheus text exposition format.
+    """
+    data = snapshot()
+    lines = ['# HELP a3_calls_total Calls of each instrumented function.',
+             '# TYPE a3_calls_total counter']
+    for name, stat in data['functions'].items():
+        lines.append(f'a3_calls_total{{function="{name}"}} {stat["calls"]}')
+    lines += ['# HELP a3_failures_total Failed calls of each instrumented function.',
+              '# TYPE a3_failures_total counter']
+    for name, stat in data['functions'].items():
+        lines.append(f'a3_failures_total{{function="{name}"}} {stat["failures"]}')
+    lines += ['# HELP a3_latency_seconds Latency of each instrumented function.',
+              '# TYPE a3_latency_seconds histogram']
+    for name, stat in data['functions'].items():
+        for bound, n in stat['histogram'].items():
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'a3_latency_seconds_bucket{{function="{name}",le="{le}"}} {n}')
+        lines.append(f'a3_latency_seconds_sum{{function="{name}"}} {stat["seconds"]!r}')
+        lines.append(f'a3_latency_seconds_count{{function="{name}"}} {stat["calls"]}')
+    lines += ['# HELP a3_events_total Counted events such as random price fallbacks.',
+              '# TYPE a3_events_total counter']
+    for event, n in data['events'].items():
+        lines.append(f'a3_events_total{{event="{event}"}} {n}')
+    return '\n'.join(lines)+'\n'
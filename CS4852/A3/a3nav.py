@@ -0,0 +1,339 @@
+"""
+Live net asset value (NAV) for A3.
+
+A NavTracker values one Portfolio and keeps the value up to date as prices tick
+and trades land, without revaluing the whole book. It reads the per-ticker totals
+the Portfolio already keeps (shares, cost basis, and their shorted parts, in each
+Position) and stores what each ticker adds to four running totals:
+    long_value - shares not shorted times the price
+    short_exposure - shorted shares times the price
+    cost_basis - what was paid for every lot
+    unrealized - the gain of every lot at the current price: price minus buy price per
+                 share for lots not shorted, buy price minus price for shorted ones
+A change to one of a ticker's lots (the Portfolio tells its watchers) recomputes
+that ticker's part from its totals; a price tick reprices the part from the shares
+it already holds. Either way the running totals move by the difference: O(1)
+however many lots and tickers the portfolio has.
+Cash and coins are read when the NAV is asked for.
+
+The market value is cash, plus coins at the BTC_SYMBOL price, plus what was paid
+for the lots and their unrealized gain. A ticker with no price yet is valued at cost.
+
+This is a mark-to-market figure, and it is not what a3 would pay for the lots: a3's
+sale rule (a3._sale_proceeds) returns no principal, only twice the gain, after tax,
+and nothing for a lot at a loss. That rule taxes each lot on its own profit and by
+its own holding period, so it cannot be kept up to date per tick from per-ticker
+totals. equity(time) gives it on demand, by the same rule as a3backtest.equity,
+in time proportional to the number of lots.
+
+A NavBoard keeps trackers for many portfolios that share one price table, and
+sends each tick only to the portfolios holding the ticker (through an
+a3dividends.HolderIndex), for dashboards polling thousands of portfolios.
+"""
+
+import a3assets
+import a3backtest
+import a3helpers
+import a3dividends
+import a3scheduler
+
+# The running totals are summed again from the per-ticker parts after this many
+# updates, so rounding errors from adding and taking away cannot build up.
+RESUM_EVERY = 10000
+
+
+def _price_BTC(prices):
+    """
+    Adds the BitCoin price, fetched at REFRESH priority, to the dict prices.
+
+    A price source installed with a3helpers.set_price_source may have no BTC_SYMBOL
+    price (a KeyError); prices is then left as it is.
+    """
+    try:
+        prices[a3helpers.BTC_SYMBOL] = a3helpers.get_BTC_price(a3scheduler.REFRESH)
+    except KeyError:
+        pass
+
+
+class NavTracker(object):
+    """
+    The class NavTracker keeps the value of one Portfolio up to date. It has 6 attributes.
+        portfolio - The Portfolio valued
+        prices - A dict mapping tickers (and BTC_SYMBOL) to their latest price
+        long_value - A float representing the value of the shares not shorted
+        short_exposure - A float representing the value of the shorted shares
+        cost_basis - A float representing what was paid for every lot
+        unrealized - A float representing the gain of every lot at the latest prices
+
+    The tracker watches its portfolio until close() is called. Lots must be added to the
+    portfolio with add_stock for the tracker to see them.
+
+    The constructor can be called like this
+    NavTracker(portfolio,{"IBM": 130.0})
+    Which values portfolio with IBM at $130.
+    """
+
+    def __init__(self,portfolio,prices=None):
+        """
+        :param portfolio: the portfolio to value
+        :type portfolio:  ``Portfolio``
+
+        :param prices: the price table to read and update; it may be shared with other trackers
+        :type prices:  ``dict`` or None
+        """
+        assert isinstance(portfolio,a3assets.Portfolio), f'{portfolio} is not a Portfolio'
+        self.portfolio = portfolio
+        self.prices = {} if prices is None else prices
+        self._parts = {}
+        self._updates = 0
+        self.resum()
+        portfolio._watchers = portfolio._watchers+(self,)
+
+    def close(self):
+        """
+        Stops watching the portfolio.
+        """
+        portfolio = self.portfolio
+        portfolio._watchers = tuple(watcher for watcher in portfolio._watchers if watcher is not self)
+
+    def _part(self,ticker):
+        """
+        Returns: a list [long shares, short shares, long cost, short cost, long value, short exposure,
+        unrealized] of ticker from its Position's totals and price, or None if the portfolio
+        does not hold it.
+        """
+        position = self.portfolio.position(ticker)
+        if position is None:
+            return None
+        long_shares = position.shares-position.short_shares
+        long_cost = position.cost_basis-position.short_cost_basis
+        part = [long_shares,position.short_shares,long_cost,position.short_cost_basis,long_cost,
+                position.short_cost_basis,0.0]
+        price = self.prices.get(ticker)
+        if price is not None:
+            part[4] = long_shares*price
+            part[5] = position.short_shares*price
+            part[6] = (part[4]-long_cost)+(position.short_cost_basis-part[5])
+        return part
+
+    def _update(self,ticker):
+        """
+        Replaces the part of ticker in the running totals, after its Position changed.
+        """
+        old = self._parts.pop(ticker,None)
+        new = self._part(ticker)
+        if new is not None:
+            self._parts[ticker] = new
+        if old is not None:
+            self.long_value -= old[4]
+            self.short_exposure -= old[5]
+            self.cost_basis -= old[2]+old[3]
+            self.unrealized -= old[6]
+        if new is not None:
+            self.long_value += new[4]
+            self.short_exposure += new[5]
+            self.cost_basis += new[2]+new[3]
+            self.unrealized += new[6]
+        self._updates += 1
+        if self._updates >= RESUM_EVERY:
+            self._resum_parts()
+
+    def _reprice(self,ticker,price):
+        """
+        Moves the part of ticker in the running totals to price, from the shares and cost it
+        already holds; the Position is not looked at.
+        """
+        part = self._parts.get(ticker)
+        if part is None:
+            return
+        long_value = part[0]*price
+        short_exposure = part[1]*price
+        unrealized = (long_value-part[2])+(part[3]-short_exposure)
+        self.long_value += long_value-part[4]
+        self.short_exposure += short_exposure-part[5]
+        self.unrealized += unrealized-part[6]
+        part[4] = long_value
+        part[5] = short_exposure
+        part[6] = unrealized
+        self._updates += 1
+        if self._updates >= RESUM_EVERY:
+            self._resum_parts()
+
+    def _resum_parts(self):
+        """
+        Sums the running totals again from the per-ticker parts.
+        """
+        parts = self._parts.values()
+        self.long_value = sum(part[4] for part in parts)
+        self.short_exposure = sum(part[5] for part in parts)
+        self.cost_basis = sum(part[2]+part[3] for part in parts)
+        self.unrealized = sum(part[6] for part in parts)
+        self._updates = 0
+
+    def resum(self):
+        """
+        Recomputes every ticker's part from the portfolio's positions and sums them again.
+        """
+        self._parts = {}
+        for ticker in self.portfolio.tickers():
+            self._parts[ticker] = self._part(ticker)
+        self._resum_parts()
+
+    def tick(self,ticker,price):
+        """
+        Records a new price of ticker (or of BitCoin, for BTC_SYMBOL) and updates the totals.
+
+        Parameter ticker: the symbol that ticked
+        Precondition: ticker is a str
+
+        Parameter price: its new price
+        Precondition: price is a non-negative float
+        """
+        self.prices[ticker] = price
+        self._reprice(ticker,price)
+
+    def opened(self,portfolio,ticker):
+        """
+        Called by Portfolio when it starts holding ticker; changed() follows.
+        """
+
+    def changed(self,portfolio,ticker):
+        """
+        Called by Portfolio when the totals of ticker change.
+        """
+        self._update(ticker)
+
+    def closed(self,portfolio,ticker):
+        """
+        Called by Portfolio when it stops holding ticker.
+        """
+        self._update(ticker)
+
+    def coin_value(self):
+        """
+        Returns: the value of the portfolio's BitCoin at the latest BTC_SYMBOL price, 0.0 with no price.
+        """
+        return self.portfolio.coins*self.prices.get(a3helpers.BTC_SYMBOL,0.0)
+
+    def market_value(self):
+        """
+        Returns: cash plus the BitCoin, plus the cost of every lot and its unrealized gain, as a float.
+        """
+        return self.portfolio.cash+self.coin_value()+self.cost_basis+self.unrealized
+
+    def equity(self,time):
+        """
+        Returns: the equity of the portfolio at time under a3's sale rules, as a3backtest.equity
+        gives it at the latest prices. Lots of a ticker with no price are left out.
+
+        Parameter time: when the portfolio is valued (decides long- or short-term tax)
+        Precondition: time is a datetime object
+        """
+        return a3backtest.equity(self.portfolio,time,self.prices)
+
+    def snapshot(self):
+        """
+        Returns: a dict with the market value, cash, coin value, long value, short exposure,
+        cost basis and unrealized gain.
+        """
+        return {'market_value': self.market_value(), 'cash': self.portfolio.cash, 'coin_value': self.coin_value(),
+                'long_value': self.long_value, 'short_exposure': self.short_exposure,
+                'cost_basis': self.cost_basis, 'unrealized': self.unrealized}
+
+    def prime(self):
+        """
+        Returns: the number of prices fetched.
+
+        Fetches the price of every ticker held, and of BitCoin if any is held, with one
+        a3helpers.get_stock_prices batch at REFRESH priority, and records them. BitCoin is
+        left out if the installed price source has no BTC_SYMBOL price.
+        """
+        prices, failures = a3helpers.get_stock_prices(self.portfolio.tickers(),priority=a3scheduler.REFRESH)
+        if self.portfolio.coins:
+            _price_BTC(prices)
+        for ticker, price in prices.items():
+            self.tick(ticker,price)
+        return len(prices)
+
+
+class NavBoard(object):
+    """
+    The class NavBoard keeps a NavTracker for each of many portfolios. It has 1 attribute.
+        prices - A dict mapping tickers to their latest price, shared by every tracker
+
+    The constructor can be called like this
+    NavBoard(portfolios)
+    """
+
+    def __init__(self,portfolios=()):
+        """
+        :param portfolios: the portfolios to value
+        :type portfolios:  iterable of ``Portfolio``
+        """
+        self.prices = {}
+        self._trackers = {}
+        self._holders = a3dividends.HolderIndex()
+        for portfolio in portfolios:
+            self.add(portfolio)
+
+    def __len__(self):
+        return len(self._trackers)
+
+    def add(self,portfolio):
+        """
+        Returns: the NavTracker of portfolio, made if the board does not have one yet.
+        """
+        tracker = self._trackers.get(portfolio)
+        if tracker is None:
+            tracker = NavTracker(portfolio,self.prices)
+            self._trackers[portfolio] = tracker
+            self._holders.add(portfolio)
+        return tracker
+
+    def remove(self,portfolio):
+        """
+        Stops valuing portfolio.
+        """
+        self._trackers.pop(portfolio).close()
+        self._holders.remove(portfolio)
+
+    def tracker(self,portfolio):
+        """
+        Returns: the NavTracker of portfolio.
+        """
+        return self._trackers[portfolio]
+
+    def tick(self,ticker,price):
+        """
+        Returns: the number of portfolios updated.
+
+        Records a new price of ticker and updates the portfolios holding it. A BitCoin price
+        is only recorded, since coins are valued when the NAV is read.
+        """
+        self.prices[ticker] = price
+        holders = self._holders.holding(ticker)
+        trackers = self._trackers
+        for portfolio in holders:
+            trackers[portfolio]._reprice(ticker,price)
+        return len(holders)
+
+    def market_values(self):
+        """
+        Returns: a list of the market value of every portfolio, in the order they were added.
+        """
+        return [tracker.market_value() for tracker in self._trackers.values()]
+
+    def prime(self):
+        """
+        Returns: the number of prices fetched.
+
+        Fetches the price of every ticker held on the board, and of BitCoin if any portfolio
+        holds some, with one a3helpers.get_stock_prices batch at REFRESH priority, and records
+        them. BitCoin is left out if the installed price source has no BTC_SYMBOL price.
+        """
+        prices, failures = a3helpers.get_stock_prices(self._holders.tickers(),priority=a3scheduler.REFRESH)
+        if any(portfolio.coins for portfolio in self._trackers):
+            _price_BTC(prices)
+        for ticker, price in prices.items():
+            self.tick(ticker,price)
+        return len(prices)
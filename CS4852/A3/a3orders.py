@@ -0,0 +1,204 @@
+"""
+Batch order execution for A3.
+
+execute_orders runs many buy, short and sell orders against one Portfolio as a
+single batch. Compared with calling buy_stock and sell_stock once per order it
+    1. checks every order before anything is fetched or changed,
+    2. takes one price snapshot for all the tickers involved, with one fetch per
+       symbol through a3helpers.get_stock_prices, and
+    3. applies the orders in one pass, keeping the running cash in a local
+       variable and writing Portfolio.cash once at the end.
+
+Each order follows the same rules as the single-order function it stands for
+(trading hours, enough cash for the cost and commission fee, taxes on profitable
+sales), and the batch returns one OrderResult per order, in order.
+"""
+
+import datetime
+import a3
+import a3assets
+import a3calendar
+import a3helpers
+
+BUY = "buy"
+SHORT = "short"
+SELL = "sell"
+KINDS = (BUY,SHORT,SELL)
+
+
+class Order(object):
+    """
+    The class Order is one order in a batch. It has 5 attributes.
+        kind - BUY, SHORT or SELL
+        ticker - A string representing the stock symbol traded
+        shares - A int representing how many shares to trade; positive
+        lot - For SELL, the Stock lot to sell from, or None to sell from the
+              ticker's lots that are not shorted, in the order they were added
+        time - A datetime object for the time of the order, or None to use the batch time
+
+    The constructor can be called like this
+    Order(BUY,"IBM",10)
+    Order(SELL,"IBM",5,lot=stock)
+    """
+
+    def __init__(self,kind,ticker,shares,lot=None,time=None):
+        """
+        :param kind: the kind of order
+        :type kind:  BUY, SHORT or SELL
+
+        :param ticker: the stock symbol; for SELL with a lot it must be the lot's company
+        :type ticker:  ``str``, len(ticker) > 0
+
+        :param shares: the number of shares
+        :type shares:  ``int`` >0
+
+        :param lot: the lot to sell from
+        :type lot:  ``Stock`` or None; only for SELL
+
+        :param time: the time of the order
+        :type time:  ``datetime`` or None
+        """
+        assert kind in KINDS, f'{kind} is not one of {KINDS}'
+        assert type(ticker) == str and len(ticker) > 0, f'{ticker} is not a stock symbol'
+        assert type(shares) == int and shares > 0, f'{shares} must be a positive int'
+        assert lot is None or kind == SELL, 'only SELL orders take a lot'
+        assert lot is None or (isinstance(lot,a3assets.Stock) and lot.company == ticker), f'{lot} is not a lot of {ticker}'
+        assert time is None or isinstance(time,datetime.datetime), f'{time} is not a datetime object'
+        self.kind = kind
+        self.ticker = ticker
+        self.shares = shares
+        self.lot = lot
+        self.time = time
+
+    def __repr__(self):
+        return f'Order({self.kind!r},{self.ticker!r},{self.shares})'
+
+
+class OrderResult(object):
+    """
+    The class OrderResult is the outcome of one Order. It has 6 attributes.
+        order - The Order
+        success - A bool; True if the order was carried out
+        stock - For BUY and SHORT, the new Stock lot added to the portfolio; otherwise None
+        shares - A int representing the shares actually traded
+        cash_change - A float representing how much the order changed cash by
+        reason - A str explaining why the order failed, or None
+    """
+
+    def __init__(self,order,success,stock=None,shares=0,cash_change=0.0,reason=None):
+        self.order = order
+        self.success = success
+        self.stock = stock
+        self.shares = shares
+        self.cash_change = cash_change
+        self.reason = reason
+
+    def __repr__(self):
+        if self.success:
+            return f'OrderResult({self.order!r}, shares={self.shares}, cash_change={self.cash_change:.2f})'
+        return f'OrderResult({self.order!r}, failed: {self.reason})'
+
+
+def execute_orders(portfolio,orders,time=None):
+    """
+    Returns: a list of OrderResult, one for each order in orders, in the same order.
+
+    Carries out orders one after another against portfolio, with every price taken
+    from one snapshot fetched before the first order runs. An order that fails leaves
+    the portfolio as it was and the batch goes on with the next one. If an order raises,
+    the cash is still written for every lot added or sold before the error, so the
+    portfolio never holds lots it has not paid for.
+
+    BUY and SHORT orders work like buy_stock: they fail outside trading hours or if
+    the cost plus the commission fee is more than the cash left. The new lot is
+    added with Portfolio.add_stock.
+
+    SELL orders work like sell_stock: they fail outside trading hours, if the
+    commission fee cannot be paid, or if there are no shares to sell. The lot of a
+    SELL order must belong to portfolio. Without a lot they sell from the ticker's
+    lots that are not shorted, in the order the lots were added, until the shares
+    are sold or the lots run out; shorted lots are only sold when named. One
+    commission fee is charged per order.
+
+    Parameter portfolio: the portfolio trading
+    Precondition: portfolio is a Portfolio object
+
+    Parameter orders: the orders to carry out
+    Precondition: orders is an iterable of Order objects
+
+    Parameter time: the time used for orders that have none
+    Precondition: time is a datetime object or None; if None every order must have a time
+    """
+    assert isinstance(portfolio,a3assets.Portfolio)
+    assert time is None or isinstance(time,datetime.datetime), f'{time} is not a datetime object'
+    orders = list(orders)
+    for order in orders:
+        assert isinstance(order,Order), f'{order} is not an Order'
+        assert order.time is not None or time is not None, f'{order} has no time'
+    prices, failures = a3helpers.get_stock_prices({order.ticker for order in orders})
+
+    whens = [order.time if order.time is not None else time for order in orders]
+    # Each distinct order time is checked against the market calendar once for the whole batch.
+    opened = a3calendar.calendar.is_open_many(whens)
+
+    fee = portfolio.commission_fee
+    cash = portfolio.cash
+    results = []
+    # If an order raises, the cash of the orders already carried out is still written, so every
+    # lot added or sold so far is paid for.
+    try:
+        for order, when, is_open in zip(orders,whens,opened):
+            price = prices.get(order.ticker)
+            if price is None:
+                results.append(OrderResult(order,False,reason=f'no price for {order.ticker}: {failures.get(order.ticker)}'))
+            elif not is_open:
+                results.append(OrderResult(order,False,reason='outside trading hours'))
+            elif order.kind == SELL:
+                result = _sell(portfolio,order,when,price,cash,fee)
+                cash += result.cash_change
+                results.append(result)
+            else:
+                cost = price*order.shares+fee
+                if cost > cash:
+                    results.append(OrderResult(order,False,reason='not enough cash'))
+                else:
+                    stock = a3assets.Stock(order.ticker,price,order.shares,order.kind == SHORT,when)
+                    cash -= cost
+                    stock = portfolio.add_stock(stock)
+                    results.append(OrderResult(order,True,stock,order.shares,-cost))
+    finally:
+        portfolio.cash = float(cash)
+    return results
+
+
+def _sell(portfolio,order,when,price,cash,fee):
+    """
+    Returns: the OrderResult of SELL order; portfolio.cash is left for the caller to update.
+    """
+    if cash < fee:
+        return OrderResult(order,False,reason='not enough cash for the commission fee')
+    held = portfolio.lots(order.ticker)
+    if order.lot is not None:
+        # A lot emptied by an earlier order is no longer listed; the order then finds no shares.
+        assert order.lot.shares == 0 or order.lot in held, f'{order.lot} is not a lot of this portfolio'
+        lots = [order.lot]
+    else:
+        lots = [lot for lot in held if not lot.short]
+    remaining = order.shares
+    proceeds = 0.0
+    # Every lot's share of the sale is worked out before any lot is changed.
+    plan = []
+    for lot in lots:
+        if remaining == 0:
+            break
+        sold = min(lot.shares,remaining)
+        if sold == 0:
+            continue
+        proceeds += a3._sale_proceeds(lot,sold,when,price)
+        plan.append((lot,sold))
+        remaining -= sold
+    if remaining == order.shares:
+        return OrderResult(order,False,reason=f'no shares of {order.ticker} to sell')
+    for lot, sold in plan:
+        lot.shares = lot.shares-sold
+    return OrderResult(order,True,shares=order.shares-remaining,cash_change=proceeds-fee)
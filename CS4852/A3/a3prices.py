@@ -0,0 +1,267 @@
+"""
+Price sources for A3.
+
+A price source answers "what is the price of X" without going to the live
+Alpha Vantage endpoint. Installing one with a3helpers.set_price_source makes
+get_stock_price, get_BTC_price and their batch and async versions read from it,
+so a whole simulation can run deterministically with no network.
+
+ReplaySource reads historical ticks from a compact memory-mapped file written
+by write_replay_file. The file holds, for every symbol, a sorted array of
+timestamps and a matching array of prices, so the price of X at time t is
+found with a binary search in O(log n) and nothing is loaded up front.
+
+File layout (all integers little-endian):
+    header  - magic b"A3TK", version u32, symbol count u32, reserved u32
+    index   - per symbol: name (16 bytes, NUL padded), offset u64, count u64
+    data    - per symbol: count int64 timestamps, then count float64 prices
+
+Timestamps are seconds since the epoch. A naive datetime is a time on the wall
+clock of the market (MARKET_ZONE, New York), as everywhere else in A3, so files
+written on one machine give the same prices on any other whatever its time zone.
+"""
+
+import mmap
+import bisect
+import struct
+import datetime
+import zoneinfo
+
+MAGIC = b"A3TK"
+VERSION = 1
+NAME_SIZE = 16
+_HEADER = struct.Struct("<4sIII")
+_ENTRY = struct.Struct(f"<{NAME_SIZE}sQQ")
+
+
+MARKET_ZONE = "America/New_York"
+_zone = None
+
+
+def market_zone():
+    """
+    Returns: the zoneinfo.ZoneInfo of MARKET_ZONE, loaded on first use.
+
+    Raises zoneinfo.ZoneInfoNotFoundError where the system has no time zone database
+    (on Windows, pip install tzdata).
+    """
+    global _zone
+    if _zone is None:
+        _zone = zoneinfo.ZoneInfo(MARKET_ZONE)
+    return _zone
+
+
+def to_timestamp(time):
+    """
+    Returns: time as whole seconds since the epoch, as an int.
+
+    A naive datetime is read on the wall clock of the market, not the machine's.
+
+    time: a datetime object, or an int or float number of seconds since the epoch
+    """
+    if isinstance(time,datetime.datetime):
+        if time.tzinfo is None:
+            time = time.replace(tzinfo=market_zone())
+        return int(time.timestamp())
+    assert type(time) in (int,float), f'{time} is not a datetime or a number'
+    return int(time)
+
+
+def from_timestamp(stamp):
+    """
+    Returns: the naive datetime on the wall clock of the market at stamp seconds since
+    the epoch; to_timestamp turns it back into stamp.
+    """
+    return datetime.datetime.fromtimestamp(stamp,market_zone()).replace(tzinfo=None)
+
+
+class PriceSource(object):
+    """
+    The class PriceSource is the interface every price source provides.
+
+    A price source has a current time, `time`, used when no time is given, and
+    answers price(symbol) and price_at(symbol,time). Unknown symbols and times
+    before the first known price raise KeyError.
+    """
+    @property
+    def time(self):
+        """
+        The time prices are read at when none is given; None means the latest price.
+
+        **Invariant**: Value must be a datetime object or None.
+        """
+        return self._time
+
+    @time.setter
+    def time(self,value):
+        assert value is None or isinstance(value,datetime.datetime), f'{value} is not a datetime object'
+        self._time = value
+
+    def __init__(self):
+        self.time = None
+
+    def price(self,symbol):
+        """
+        Returns: the price of symbol at the current time as a float.
+
+        Parameter symbol: the symbol to price
+        Precondition: symbol is a non-empty str
+        """
+        return self.price_at(symbol,self.time)
+
+    def price_at(self,symbol,time):
+        """
+        Returns: the price of symbol at time as a float; None for time means the latest price.
+        """
+        raise NotImplementedError
+
+    def symbols(self):
+        """
+        Returns: a list of the symbols this source can price.
+        """
+        raise NotImplementedError
+
+
+class ReplaySource(PriceSource):
+    """
+    The class ReplaySource is a PriceSource backed by a memory-mapped tick file.
+
+    The price of a symbol at time t is the last tick at or before t.
+
+    The constructor can be called like this
+    ReplaySource("ticks.a3tk")
+    and the source should be closed with close(), or used in a with statement.
+    """
+
+    def __init__(self,path):
+        """
+        :param path: the tick file written by write_replay_file
+        :type path:  ``str``
+        """
+        super().__init__()
+        self.path = path
+        self._file = open(path,"rb")
+        self._map = mmap.mmap(self._file.fileno(),0,access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        magic, version, count, _ = _HEADER.unpack_from(self._map,0)
+        assert magic == MAGIC, f'{path} is not a tick file'
+        assert version == VERSION, f'{path} has unsupported version {version}'
+        self._series = {}
+        for i in range(count):
+            name, offset, n = _ENTRY.unpack_from(self._map,_HEADER.size+i*_ENTRY.size)
+            name = name.rstrip(b"\0").decode("ascii")
+            times = self._view[offset:offset+8*n].cast("q")
+            prices = self._view[offset+8*n:offset+16*n].cast("d")
+            self._series[name] = (times,prices)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+    def close(self):
+        """
+        Releases the memory map and the file.
+        """
+        if self._map is None:
+            return
+        for times, prices in self._series.values():
+            times.release()
+            prices.release()
+        self._series = {}
+        self._view.release()
+        self._map.close()
+        self._file.close()
+        self._map = None
+
+    def symbols(self):
+        return list(self._series)
+
+    def __len__(self):
+        """
+        Returns: the total number of ticks in the file.
+        """
+        return sum(len(times) for times, prices in self._series.values())
+
+    def price_at(self,symbol,time):
+        """
+        Returns: the price of symbol at time as a float, i.e. the last tick at or before time.
+        If time is None the last tick is used.
+
+        Raises KeyError if symbol is not in the file or time is before its first tick.
+
+        Parameter symbol: the symbol to price
+        Precondition: symbol is a str
+
+        Parameter time: the time to price symbol at
+        Precondition: time is a datetime object, a number of seconds since the epoch, or None
+        """
+        times, prices = self.series(symbol)
+        if time is None:
+            i = len(times)
+        else:
+            i = bisect.bisect_right(times,to_timestamp(time))
+        if i == 0:
+            raise KeyError(f'no tick for {symbol} at or before {time}')
+        return prices[i-1]
+
+    def series(self,symbol):
+        """
+        Returns: a tuple (timestamps, prices) of read-only memoryviews over the ticks of
+        symbol, of int64 and float64 items.
+
+        Raises KeyError if symbol is not in the file.
+        """
+        series = self._series.get(symbol)
+        if series is None:
+            series = self._series.get(symbol.upper())
+        if series is None:
+            raise KeyError(f'no ticks for {symbol}')
+        return series
+
+    def first_time(self,symbol):
+        """
+        Returns: the time of the first tick of symbol as a datetime object.
+        """
+        return from_timestamp(self._series[symbol][0][0])
+
+    def last_time(self,symbol):
+        """
+        Returns: the time of the last tick of symbol as a datetime object.
+        """
+        return from_timestamp(self._series[symbol][0][-1])
+
+
+def write_replay_file(path,ticks):
+    """
+    Writes a tick file that ReplaySource can read.
+
+    Parameter path: where to write the file
+    Precondition: path is a str
+
+    Parameter ticks: the ticks of every symbol
+    Precondition: ticks is a dict mapping symbol strs (at most 16 ASCII characters)
+    to iterables of (time, price) pairs, where time is a datetime object or a number
+    of seconds since the epoch and price is a non-negative number. Ticks do not need to
+    be sorted; if two ticks of a symbol share a timestamp the later one in the iterable wins.
+    """
+    series = []
+    for symbol, pairs in ticks.items():
+        name = symbol.encode("ascii")
+        assert 0 < len(name) <= NAME_SIZE, f'{symbol} must be 1 to {NAME_SIZE} characters'
+        latest = {}
+        for time, price in pairs:
+            assert price >= 0, f'{price} must not be negative'
+            latest[to_timestamp(time)] = float(price)
+        stamps = sorted(latest)
+        series.append((name,stamps,[latest[t] for t in stamps]))
+    offset = _HEADER.size + _ENTRY.size*len(series)
+    with open(path,"wb") as out:
+        out.write(_HEADER.pack(MAGIC,VERSION,len(series),0))
+        for name, stamps, prices in series:
+            out.write(_ENTRY.pack(name,offset,len(stamps)))
+            offset += 16*len(stamps)
+        for name, stamps, prices in series:
+            out.write(struct.pack(f"<{len(stamps)}q",*stamps))
+            out.write(struct.pack(f"<{len(prices)}d",*prices))
@@ -0,0 +1,241 @@
+"""
+Persistent quote store for A3.
+
+A QuoteStore keeps the last quote fetched for each symbol in a SQLite file, with
+the wall-clock time it was fetched. Several processes (and threads) can open the
+same file: the database runs in write-ahead-log mode, so readers never block the
+writer, and each write keeps whichever quote of a symbol is newer.
+
+Installing a store with a3helpers.set_quote_store makes every live fetch save its
+quote to disk and every cache miss look on disk before going to the network, and
+fills the in-memory quote_cache from disk straight away. A restarted or newly
+forked worker therefore starts warm, and the API quota is shared by all workers
+instead of being spent again by each one.
+
+A quote is fresh while it is younger than the max age of its symbol; older quotes
+are never returned, but stay on disk until purge() removes them.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quotes (
+    symbol TEXT PRIMARY KEY,
+    price REAL NOT NULL,
+    fetched_at REAL NOT NULL
+)
+"""
+UPSERT = """
+INSERT INTO quotes (symbol, price, fetched_at) VALUES (?, ?, ?)
+ON CONFLICT(symbol) DO UPDATE SET price = excluded.price, fetched_at = excluded.fetched_at
+WHERE excluded.fetched_at >= quotes.fetched_at
+"""
+
+
+class QuoteStore(object):
+    """
+    The class QuoteStore is a quote cache on disk shared between processes. It has 3 attributes.
+        path - A string representing the SQLite file
+        max_age - A float representing how many seconds a quote stays fresh by default; non-negative
+        clock - A function with no arguments returning the wall-clock time in seconds since the epoch
+
+    Each thread of each process gets its own connection, opened on first use; a
+    process forked from one that used the store opens fresh connections too.
+
+    The constructor can be called like this
+    QuoteStore("quotes.db",300.0)
+    Which opens (or creates) quotes.db, whose quotes are fresh for five minutes.
+    """
+    @property
+    def max_age(self):
+        """
+        The default number of seconds a quote is considered fresh.
+
+        **Invariant**: Value must be a non-negative float.
+        """
+        return self._max_age
+
+    @max_age.setter
+    def max_age(self,value):
+        assert type(value) == float, f'{value} is not a float'
+        assert value >= 0, f'{value} must not be negative'
+        self._max_age = value
+
+    def __init__(self,path,max_age=300.0,clock=time.time):
+        """
+        :param path: the SQLite file, created if it does not exist
+        :type path:  ``str``
+
+        :param max_age: default freshness of a quote in seconds
+        :type max_age:  ``float`` >=0
+
+        :param clock: function returning the wall-clock time
+        :type clock:  callable
+        """
+        self.path = path
+        self.max_age = max_age
+        self.clock = clock
+        self._max_ages = {}
+        self._local = threading.local()
+        with self._connection() as db:
+            db.execute(SCHEMA)
+
+    def _connection(self):
+        """
+        Returns: the SQLite connection of this thread in this process.
+        """
+        local = self._local
+        if getattr(local,'pid',None) != os.getpid():
+            db = sqlite3.connect(self.path,timeout=30.0)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            local.db = db
+            local.pid = os.getpid()
+        return local.db
+
+    def close(self):
+        """
+        Closes the connection of the calling thread.
+        """
+        local = self._local
+        if getattr(local,'pid',None) == os.getpid():
+            local.db.close()
+        local.pid = None
+
+    def set_max_age(self,symbol,seconds):
+        """
+        Sets how long quotes of one symbol stay fresh. Passing None for seconds restores max_age.
+
+        Parameter symbol: the symbol to configure
+        Precondition: symbol is a non-empty str
+
+        Parameter seconds: how long quotes for symbol stay fresh
+        Precondition: seconds is a non-negative float or None
+        """
+        assert type(symbol) == str and len(symbol) > 0
+        assert seconds is None or (type(seconds) == float and seconds >= 0)
+        if seconds is None:
+            self._max_ages.pop(symbol,None)
+        else:
+            self._max_ages[symbol] = seconds
+
+    def max_age_for(self,symbol):
+        """
+        Returns: the number of seconds quotes of symbol stay fresh.
+        """
+        return self._max_ages.get(symbol,self._max_age)
+
+    def get(self,symbol):
+        """
+        Returns: a tuple (price, age in seconds) of the fresh quote of symbol, or None
+        if there is no quote younger than its max age.
+
+        Parameter symbol: the symbol to look up
+        Precondition: symbol is a str
+        """
+        row = self._connection().execute("SELECT price, fetched_at FROM quotes WHERE symbol = ?",(symbol,)).fetchone()
+        if row is None:
+            return None
+        age = max(self.clock()-row[1],0.0)
+        if age >= self.max_age_for(symbol):
+            return None
+        return row[0], age
+
+    def get_many(self,symbols):
+        """
+        Returns: a dict mapping each symbol in symbols that has a fresh quote to (price, age).
+        """
+        symbols = list(symbols)
+        found = {}
+        now = self.clock()
+        db = self._connection()
+        for i in range(0,len(symbols),500):
+            chunk = symbols[i:i+500]
+            marks = ",".join("?"*len(chunk))
+            for symbol, price, fetched_at in db.execute(
+                    f"SELECT symbol, price, fetched_at FROM quotes WHERE symbol IN ({marks})",chunk):
+                age = max(now-fetched_at,0.0)
+                if age < self.max_age_for(symbol):
+                    found[symbol] = (price,age)
+        return found
+
+    def put(self,symbol,price,fetched_at=None):
+        """
+        Saves price as the quote of symbol, unless a newer quote is already saved.
+
+        Parameter symbol: the symbol quoted
+        Precondition: symbol is a non-empty str
+
+        Parameter price: the quoted price
+        Precondition: price is a float
+
+        Parameter fetched_at: when the quote was fetched, in seconds since the epoch; None means now
+        Precondition: fetched_at is a float or None
+        """
+        self.put_many([(symbol,price,fetched_at)])
+
+    def put_many(self,quotes):
+        """
+        Saves many quotes in one transaction.
+
+        Parameter quotes: the quotes to save
+        Precondition: quotes is an iterable of (symbol, price, fetched_at) tuples, as for put
+        """
+        now = self.clock()
+        rows = []
+        for symbol, price, fetched_at in quotes:
+            assert type(symbol) == str and len(symbol) > 0, f'{symbol} is not a symbol'
+            assert type(price) == float, f'{price} is not a float'
+            rows.append((symbol,price,now if fetched_at is None else fetched_at))
+        with self._connection() as db:
+            db.executemany(UPSERT,rows)
+
+    def fresh(self):
+        """
+        Returns: a dict mapping every symbol with a fresh quote to (price, age).
+        """
+        now = self.clock()
+        found = {}
+        for symbol, price, fetched_at in self._connection().execute("SELECT symbol, price, fetched_at FROM quotes"):
+            age = max(now-fetched_at,0.0)
+            if age < self.max_age_for(symbol):
+                found[symbol] = (price,age)
+        return found
+
+    def warm(self,cache):
+        """
+        Returns: the number of quotes copied.
+
+        Copies every fresh quote into cache, an a3cache.QuoteCache, keeping each quote's age.
+        """
+        quotes = self.fresh()
+        for symbol, (price, age) in quotes.items():
+            cache.put(symbol,price,age)
+        return len(quotes)
+
+    def invalidate(self,symbol=None):
+        """
+        Returns: the number of quotes deleted.
+
+        Deletes the quote of symbol, or every quote if symbol is None.
+        """
+        with self._connection() as db:
+            if symbol is None:
+                return db.execute("DELETE FROM quotes").rowcount
+            return db.execute("DELETE FROM quotes WHERE symbol = ?",(symbol,)).rowcount
+
+    def purge(self,older_than=None):
+        """
+        Returns: the number of quotes deleted.
+
+        Deletes quotes fetched more than older_than seconds ago (default: max_age).
+        """
+        cutoff = self.clock()-(self._max_age if older_than is None else older_than)
+        with self._connection() as db:
+            return db.execute("DELETE FROM quotes WHERE fetched_at < ?",(cutoff,)).rowcount
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM quotes").fetchone()[0]
@@ -0,0 +1,157 @@
+"""
+Interest scenarios for A3.
+
+a3.compute_interest grows one portfolio's cash at one fixed rate. This module uses
+the same formulas,
+
+    cash * (1 + (rate/100)/times_compounded) ** (times_compounded*years)
+    cash * exp((rate/100)*years)                      if times_compounded is inf
+
+on NumPy arrays, so millions of paths with random rates and horizons are computed
+at once instead of one math.pow call per path. Paths are generated in fixed-size
+chunks, each with its own random stream, so the chunks can be spread over a
+process pool and the result is the same whatever the number of workers.
+
+NumPy is required.
+"""
+
+import concurrent.futures
+import numpy
+
+PERCENTILES = (1,5,25,50,75,95,99)
+
+
+def compound(cash,rate,years,times_compounded):
+    """
+    Returns: a NumPy array of cash after compounding, element by element.
+
+    The arguments broadcast against each other like NumPy arrays; entries where
+    times_compounded is inf use continuous compounding.
+
+    Parameter cash: the starting cash
+    Precondition: cash is a non-negative float or array of them
+
+    Parameter rate: the % of interest gained per year
+    Precondition: rate is a non-negative float or array of them
+
+    Parameter years: the number of years
+    Precondition: years is a positive float or array of them
+
+    Parameter times_compounded: times compounded per year
+    Precondition: times_compounded is a float > 1.0 (or inf), or array of them
+    """
+    cash = numpy.asarray(cash,dtype=numpy.float64)
+    rate = numpy.asarray(rate,dtype=numpy.float64)/100
+    years = numpy.asarray(years,dtype=numpy.float64)
+    n = numpy.asarray(times_compounded,dtype=numpy.float64)
+    continuous = numpy.isinf(n)
+    if not continuous.any():
+        return cash*numpy.power(1+rate/n,n*years)
+    if continuous.all():
+        return cash*numpy.exp(rate*years)
+    finite_n = numpy.where(continuous,1.0,n)
+    discrete = numpy.power(1+rate/finite_n,finite_n*years)
+    return cash*numpy.where(continuous,numpy.exp(rate*years),discrete)
+
+
+def _simulate_chunk(cash,paths,rate_mean,rate_sd,years_min,years_max,times_compounded,seed):
+    """
+    Returns: a NumPy array of the final cash of `paths` paths drawn from seed.
+
+    Rates are normal with mean rate_mean and deviation rate_sd, cut off at 0;
+    horizons are uniform between years_min and years_max.
+    """
+    rng = numpy.random.default_rng(seed)
+    rates = numpy.maximum(rng.normal(rate_mean,rate_sd,paths),0.0)
+    if years_min == years_max:
+        years = numpy.full(paths,years_min)
+    else:
+        years = rng.uniform(years_min,years_max,paths)
+    return compound(cash,rates,years,times_compounded)
+
+
+def simulate_interest(cash,paths,rate_mean,rate_sd,years_min,years_max,times_compounded=12.0,
+                      seed=None,workers=1,chunk_size=1000000):
+    """
+    Returns: a NumPy array with the final cash of every simulated path.
+
+    Each path draws a rate (normal, cut off at 0) and a horizon (uniform), then
+    compounds cash the way compute_interest does. Paths are made in chunks of
+    chunk_size; with workers > 1 the chunks run in a process pool.
+
+    Parameter cash: the starting cash
+    Precondition: cash is a non-negative float
+
+    Parameter paths: how many paths to simulate
+    Precondition: paths is a positive int
+
+    Parameter rate_mean, rate_sd: the mean and standard deviation of the % rate
+    Precondition: both are non-negative floats
+
+    Parameter years_min, years_max: the range of horizons in years
+    Precondition: 0 < years_min <= years_max, both floats
+
+    Parameter times_compounded: times compounded per year
+    Precondition: times_compounded is a float > 1.0 (or inf)
+
+    Parameter seed: the seed of the random streams
+    Precondition: seed is an int or None
+
+    Parameter workers: how many processes to use
+    Precondition: workers is a positive int
+
+    Parameter chunk_size: how many paths each chunk holds
+    Precondition: chunk_size is a positive int
+    """
+    assert type(cash) == float and cash >= 0.0
+    assert type(paths) == int and paths > 0
+    assert type(rate_mean) == float and rate_mean >= 0.0
+    assert type(rate_sd) == float and rate_sd >= 0.0
+    assert type(years_min) == float and type(years_max) == float and 0.0 < years_min <= years_max
+    assert type(times_compounded) == float and times_compounded > 1.0
+    assert type(workers) == int and workers > 0
+    assert type(chunk_size) == int and chunk_size > 0
+    sizes = [chunk_size]*(paths//chunk_size)
+    if paths % chunk_size:
+        sizes.append(paths % chunk_size)
+    seeds = numpy.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(cash,size,rate_mean,rate_sd,years_min,years_max,times_compounded,s) for size, s in zip(sizes,seeds)]
+    if workers == 1 or len(jobs) == 1:
+        parts = [_simulate_chunk(*job) for job in jobs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers,len(jobs))) as pool:
+            parts = list(pool.map(_simulate_chunk,*zip(*jobs)))
+    return numpy.concatenate(parts)
+
+
+def summarize(values,percentiles=PERCENTILES):
+    """
+    Returns: a dict with the count, mean, standard deviation, min, max and the
+    given percentiles (keyed like 'p50') of values.
+
+    Parameter values: the simulated results
+    Precondition: values is a non-empty NumPy array
+    """
+    values = numpy.asarray(values)
+    summary = {'paths': int(values.size), 'mean': float(values.mean()), 'std': float(values.std()),
+               'min': float(values.min()), 'max': float(values.max())}
+    for p, v in zip(percentiles,numpy.percentile(values,percentiles)):
+        summary['p'+str(p)] = float(v)
+    return summary
+
+
+def interest_scenarios(portfolio,paths,rate_mean,rate_sd,years_min,years_max,times_compounded=12.0,
+                       seed=None,workers=1):
+    """
+    Returns: the summarize dict of simulate_interest run on portfolio's cash.
+
+    Unlike compute_interest, the portfolio is not changed.
+
+    Parameter portfolio: a portfolio object
+    Precondition: portfolio is an existing portfolio object
+
+    The other parameters are as in simulate_interest.
+    """
+    values = simulate_interest(portfolio.cash,paths,rate_mean,rate_sd,years_min,years_max,
+                               times_compounded,seed,workers)
+    return summarize(values)
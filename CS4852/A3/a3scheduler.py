@@ -0,0 +1,314 @@
+"""
+Request scheduling for the Alpha Vantage calls of A3.
+
+Alpha Vantage allows a fixed number of calls per minute (and per day); calls over
+the quota are answered with a note instead of a quote. A RequestScheduler sits in
+front of the network calls of a3helpers, once installed with
+a3helpers.set_scheduler, and
+
+    1. sends a call only when a token bucket for every quota window has a token,
+       so the quota is never exceeded,
+    2. sends waiting calls by priority: a TRADE quote (needed by a transaction that
+       is running) goes before a REFRESH (a dashboard or cache warm-up), and calls of
+       the same priority go in the order they were asked for,
+    3. coalesces requests: while a call for a symbol is waiting or in flight, every
+       other request for that symbol gets the same Future instead of a new call, and
+       a waiting REFRESH is moved up if a TRADE request for its symbol arrives,
+    4. when a call comes back throttled anyway (raising Throttled, e.g. because the
+       key is shared with another program), empties the buckets and puts the call
+       back in the queue, up to `retries` times, instead of failing it.
+
+One dispatcher thread hands the calls to a small pool of worker threads, so a slow
+response never holds back the calls behind it.
+"""
+
+import time
+import heapq
+import itertools
+import threading
+import a3metrics
+
+# Priorities; a lower number is sent first.
+TRADE = 0
+REFRESH = 1
+
+# The quota of the free Alpha Vantage key: (calls, seconds) for each window.
+QUOTA = ((5,60.0),)
+
+
+class Throttled(Exception):
+    """
+    Raised by a fetch whose call was refused for going over the quota.
+    """
+
+
+class TokenBucket(object):
+    """
+    The class TokenBucket allows `capacity` calls in any `period` seconds. It has 3 attributes.
+        capacity - A int representing the most tokens the bucket holds
+        period - A float representing the seconds it takes to refill the bucket from empty
+        clock - A function with no arguments returning the current time in seconds
+
+    The bucket starts full and refills at capacity/period tokens a second; each call takes
+    one token. It is not thread-safe on its own; RequestScheduler uses it under its lock.
+
+    The constructor can be called like this
+    TokenBucket(5,60.0)
+    Which allows 5 calls a minute.
+    """
+
+    def __init__(self,capacity,period,clock=time.monotonic):
+        """
+        :param capacity: the most calls in a row
+        :type capacity:  ``int`` >0
+
+        :param period: the seconds to earn capacity calls back
+        :type period:  ``float`` >0
+
+        :param clock: function returning the current time in seconds
+        :type clock:  callable
+        """
+        assert type(capacity) == int and capacity > 0, f'{capacity} is not a positive int'
+        assert type(period) == float and period > 0, f'{period} is not a positive float'
+        self.capacity = capacity
+        self.period = period
+        self.clock = clock
+        self._rate = capacity/period
+        self._tokens = float(capacity)
+        self._stamp = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(float(self.capacity),self._tokens+(now-self._stamp)*self._rate)
+        self._stamp = now
+
+    def tokens(self):
+        """
+        Returns: the tokens in the bucket now, as a float.
+        """
+        self._refill()
+        return self._tokens
+
+    def wait_time(self):
+        """
+        Returns: the seconds until the bucket has a token; 0.0 if it has one now.
+        """
+        self._refill()
+        return 0.0 if self._tokens >= 1.0 else (1.0-self._tokens)/self._rate
+
+    def take(self):
+        """
+        Returns: True if a token was taken, False if the bucket had none.
+        """
+        self._refill()
+        if self._tokens < 1.0:
+            return False
+        self._tokens -= 1.0
+        return True
+
+    def drain(self):
+        """
+        Empties the bucket, e.g. after the server said the quota was used up.
+        """
+        self._refill()
+        self._tokens = 0.0
+
+
+class _Job(object):
+    """
+    One call waiting or in flight, shared by every request for its key.
+    """
+
+    def __init__(self,key,fetch,priority,future):
+        self.key = key
+        self.fetch = fetch
+        self.priority = priority
+        self.future = future
+        self.sent = False
+        self.tries = 0
+
+
+class RequestScheduler(object):
+    """
+    The class RequestScheduler sends calls within a quota, by priority, one per key at a time.
+    It has 6 attributes.
+        buckets - A list of TokenBuckets, one for each quota window
+        retries - A int representing how many times a throttled call is put back in the queue
+        requests - A int representing how many requests were made
+        coalesced - A int representing how many of them shared a call already waiting or in flight
+        sent - A int representing how many calls were sent, retries included
+        throttled - A int representing how many calls came back throttled
+
+    The constructor can be called like this
+    RequestScheduler(((75,60.0),),8)
+    Which sends at most 75 calls a minute over 8 worker threads.
+    """
+
+    def __init__(self,limits=QUOTA,workers=4,retries=3,clock=time.monotonic):
+        """
+        :param limits: the quota, as (calls, seconds) for each window
+        :type limits:  iterable of (``int`` >0, ``float`` >0)
+
+        :param workers: the most calls in flight at once
+        :type workers:  ``int`` >0
+
+        :param retries: how many times a throttled call is tried again
+        :type retries:  ``int`` >=0
+
+        :param clock: function returning the current time in seconds
+        :type clock:  callable
+        """
+        import concurrent.futures
+        assert type(workers) == int and workers > 0, f'{workers} is not a positive int'
+        assert type(retries) == int and retries >= 0, f'{retries} is not a non-negative int'
+        self.buckets = [TokenBucket(calls,seconds,clock) for calls, seconds in limits]
+        self.retries = retries
+        self.requests = 0
+        self.coalesced = 0
+        self.sent = 0
+        self.throttled = 0
+        self._Future = concurrent.futures.Future
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers,thread_name_prefix="a3-scheduled")
+        self._cond = threading.Condition()
+        self._queue = []
+        self._order = itertools.count()
+        self._jobs = {}
+        self._thread = None
+        self._closed = False
+
+    def __len__(self):
+        """
+        Returns: the number of calls waiting or in flight.
+        """
+        return len(self._jobs)
+
+    def request(self,key,fetch,priority=TRADE):
+        """
+        Returns: a concurrent.futures.Future of the result of fetch().
+
+        If a call for key is already waiting or in flight its Future is returned and
+        fetch is not called; otherwise fetch() is queued and called on a worker thread
+        once the quota allows.
+
+        Parameter key: what the call is for, e.g. the symbol quoted
+        Precondition: key is a hashable value
+
+        Parameter fetch: makes the call; raises Throttled if the call went over the quota
+        Precondition: fetch is a function with no arguments
+
+        Parameter priority: TRADE, REFRESH or another int; lower is sent first
+        Precondition: priority is an int
+        """
+        assert type(priority) == int, f'{priority} is not an int'
+        with self._cond:
+            assert not self._closed, 'the scheduler is closed'
+            self.requests += 1
+            job = self._jobs.get(key)
+            if job is not None:
+                self.coalesced += 1
+                if not job.sent and priority < job.priority:
+                    job.priority = priority
+                    heapq.heappush(self._queue,(priority,next(self._order),job))
+                    self._cond.notify()
+                return job.future
+            job = _Job(key,fetch,priority,self._Future())
+            self._jobs[key] = job
+            heapq.heappush(self._queue,(priority,next(self._order),job))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch,name="a3-scheduler",daemon=True)
+                self._thread.start()
+            self._cond.notify()
+            return job.future
+
+    def call(self,key,fetch,priority=TRADE,timeout=None):
+        """
+        Returns: the result of fetch(), as request(key,fetch,priority) gives it, waiting for it.
+
+        Raises whatever fetch raised, or TimeoutError after timeout seconds.
+        """
+        return self.request(key,fetch,priority).result(timeout)
+
+    def _next_job(self):
+        """
+        Returns: the next job to send, once the quota allows it, or None once the scheduler is closed.
+
+        Called with the lock held. A job moved up has an older entry left in the queue,
+        which is skipped when it comes up.
+        """
+        queue = self._queue
+        while not self._closed:
+            while queue and (queue[0][2].sent or queue[0][0] != queue[0][2].priority):
+                heapq.heappop(queue)
+            if not queue:
+                self._cond.wait()
+                continue
+            wait = max([bucket.wait_time() for bucket in self.buckets],default=0.0)
+            if wait > 0:
+                # A higher priority job can arrive while waiting; it is looked at again after.
+                self._cond.wait(wait)
+                continue
+            for bucket in self.buckets:
+                bucket.take()
+            job = heapq.heappop(queue)[2]
+            job.sent = True
+            self.sent += 1
+            return job
+        return None
+
+    def _dispatch(self):
+        """
+        Hands the jobs to the workers in order, as the quota allows, until the scheduler is closed.
+        """
+        while True:
+            with self._cond:
+                job = self._next_job()
+            if job is None:
+                return
+            self._executor.submit(self._run,job)
+
+    def _run(self,job):
+        """
+        Calls the fetch of job on a worker thread and settles its Future.
+        """
+        try:
+            result = job.fetch()
+        except Throttled as error:
+            a3metrics.count("a3scheduler.throttled")
+            with self._cond:
+                self.throttled += 1
+                for bucket in self.buckets:
+                    bucket.drain()
+                if job.tries < self.retries and not self._closed:
+                    job.tries += 1
+                    job.sent = False
+                    heapq.heappush(self._queue,(job.priority,next(self._order),job))
+                    self._cond.notify()
+                    return
+                del self._jobs[job.key]
+            job.future.set_exception(error)
+            return
+        except BaseException as error:
+            with self._cond:
+                del self._jobs[job.key]
+            job.future.set_exception(error)
+            return
+        with self._cond:
+            del self._jobs[job.key]
+        job.future.set_result(result)
+
+    def close(self):
+        """
+        Stops the scheduler. Calls in flight finish; waiting requests fail with RuntimeError.
+        """
+        with self._cond:
+            self._closed = True
+            waiting = [job for job in self._jobs.values() if not job.sent]
+            for job in waiting:
+                del self._jobs[job.key]
+            self._queue = []
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown(wait=True)
+        for job in waiting:
+            job.future.set_exception(RuntimeError('the scheduler was closed'))
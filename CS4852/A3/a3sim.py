@@ -0,0 +1,207 @@
+"""
+Multi-portfolio simulation for A3.
+
+run_simulation opens many portfolios with a3.open_portfolio, runs a strategy on
+each one through the ordinary trading functions, and spreads the portfolios over a
+process pool in shards. Each worker returns only the final cash of its portfolios
+and a trade count, and the shards are merged in account order at the end.
+
+Prices come from the TEST constants or, with price_file, from an a3prices tick
+file. Every worker opens the tick file once when it starts and installs it with
+a3helpers.set_price_source; since the file is memory-mapped, all workers read the
+same pages from the OS page cache and no price data is pickled per task.
+
+A strategy is a function strategy(portfolio, account, time) defined at module
+level (so it can be sent to the workers), returning the number of trades it made.
+
+Run from this folder with
+
+    python a3sim.py [accounts]
+
+for a stress test that uses every core.
+"""
+
+import os
+import sys
+import array
+import time as timer
+import datetime
+import concurrent.futures
+import a3
+import a3helpers
+import a3prices
+
+# A Monday during trading hours, so strategies can trade with the TEST prices.
+DEFAULT_TIME = datetime.datetime(2019,3,4,11)
+
+
+class SimulationResult(object):
+    """
+    The class SimulationResult is the merged outcome of run_simulation. It has 5 attributes.
+        accounts - A int representing how many portfolios were simulated
+        cash - An array('d') with the final cash of every portfolio, in account order;
+               0.0 for accounts that could not be opened
+        trades - A int representing the total trades the strategy reported
+        unopened - A int representing how many portfolios open_portfolio refused
+        seconds - A float representing the wall-clock time of the run
+    """
+
+    def __init__(self,accounts,cash,trades,unopened,seconds):
+        self.accounts = accounts
+        self.cash = cash
+        self.trades = trades
+        self.unopened = unopened
+        self.seconds = seconds
+
+    def summary(self):
+        """
+        Returns: a dict with the totals of the run, the mean final cash and accounts per second.
+        """
+        return {'accounts': self.accounts, 'trades': self.trades, 'unopened': self.unopened,
+                'mean_cash': sum(self.cash)/max(len(self.cash),1), 'seconds': self.seconds,
+                'accounts_per_second': self.accounts/self.seconds if self.seconds else float('inf')}
+
+
+def buy_and_hold(portfolio,account,time):
+    """
+    Returns: the number of trades made.
+
+    A sample strategy: buys as many whole shares of CORNELL as the cash allows.
+    """
+    price = a3helpers.get_stock_price("CORNELL")
+    shares = int((portfolio.cash-portfolio.commission_fee)//price) if price > 0 else 0
+    if shares <= 0:
+        return 0
+    stock = a3.buy_stock(portfolio,"CORNELL",shares,False,time)
+    if stock is None:
+        return 0
+    portfolio.add_stock(stock)
+    return 1
+
+
+def round_trip(portfolio,account,time):
+    """
+    Returns: the number of trades made.
+
+    A sample strategy: buys one share of CORNELL and one BitCoin, then sells both.
+    """
+    trades = 0
+    stock = a3.buy_stock(portfolio,"CORNELL",1,account % 2 == 1,time)
+    if stock is not None:
+        portfolio.add_stock(stock)
+        sold = a3.sell_stock(portfolio,1,time,stock)
+        trades += 1 + (1 if sold else 0)
+    if a3.invest_BitCoin(portfolio,1):
+        sold = a3.sell_BitCoin(portfolio,1)
+        trades += 1 + (1 if sold else 0)
+    return trades
+
+
+def _init_worker(price_file,key,time):
+    """
+    Sets up a worker process: the API key, and the shared tick file if there is one.
+    """
+    a3helpers.key = key
+    if price_file is not None:
+        source = a3prices.ReplaySource(price_file)
+        source.time = time
+        a3helpers.set_price_source(source)
+
+
+def _run_shard(strategy,start,stop,start_cash,fee,time):
+    """
+    Returns: a tuple (start, cash array, trades, unopened) for accounts start to stop-1.
+    """
+    cash = array.array('d')
+    trades = 0
+    unopened = 0
+    for account in range(start,stop):
+        portfolio = a3.open_portfolio(start_cash,fee)
+        if portfolio is None:
+            cash.append(0.0)
+            unopened += 1
+            continue
+        trades += strategy(portfolio,account,time) or 0
+        cash.append(portfolio.cash)
+    return start, cash, trades, unopened
+
+
+def run_simulation(accounts,strategy,start_cash=1000.0,fee=1.0,time=DEFAULT_TIME,price_file=None,
+                   workers=None,shard_size=10000):
+    """
+    Returns: a SimulationResult for `accounts` portfolios each run through strategy.
+
+    Parameter accounts: how many portfolios to simulate
+    Precondition: accounts is a non-negative int
+
+    Parameter strategy: the strategy run on every portfolio
+    Precondition: strategy is a module-level function strategy(portfolio, account, time)
+
+    Parameter start_cash: the amount each portfolio opens with
+    Precondition: start_cash is a non-negative float
+
+    Parameter fee: the enrollment fee passed to open_portfolio
+    Precondition: fee is a non-negative float
+
+    Parameter time: the time every trade happens at, and the time prices are read at
+    Precondition: time is a datetime object
+
+    Parameter price_file: a tick file written by a3prices.write_replay_file, or None for
+    the TEST constants or the network. A price source installed in this process with
+    a3helpers.set_price_source is not sent to the worker processes, so it is only used
+    when the simulation runs in this process; pass its tick file here instead
+    Precondition: price_file is a str or None; if it is None and a price source is
+    installed, the simulation runs in this process (one shard or workers is 1)
+
+    Parameter workers: how many processes to use; None uses every core and 1 runs in this process
+    Precondition: workers is a positive int or None
+
+    Parameter shard_size: how many portfolios each task simulates
+    Precondition: shard_size is a positive int
+    """
+    assert type(accounts) == int and accounts >= 0
+    assert type(start_cash) == float and start_cash >= 0.0
+    assert type(fee) == float and fee >= 0.0
+    assert isinstance(time,datetime.datetime)
+    assert workers is None or (type(workers) == int and workers > 0)
+    assert type(shard_size) == int and shard_size > 0
+    if workers is None:
+        workers = os.cpu_count() or 1
+    shards = [(start,min(start+shard_size,accounts)) for start in range(0,accounts,shard_size)]
+    assert price_file is not None or a3helpers.price_source is None or workers == 1 or len(shards) <= 1, \
+        'the installed price source cannot be sent to worker processes; pass price_file instead'
+    began = timer.perf_counter()
+    if workers == 1 or len(shards) <= 1:
+        previous = a3helpers.price_source
+        source = a3prices.ReplaySource(price_file) if price_file is not None else None
+        if source is not None:
+            source.time = time
+            a3helpers.set_price_source(source)
+        try:
+            parts = [_run_shard(strategy,start,stop,start_cash,fee,time) for start, stop in shards]
+        finally:
+            if source is not None:
+                a3helpers.set_price_source(previous)
+                source.close()
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers,len(shards)),initializer=_init_worker,
+                                                    initargs=(price_file,a3helpers.key,time)) as pool:
+            futures = [pool.submit(_run_shard,strategy,start,stop,start_cash,fee,time) for start, stop in shards]
+            parts = [future.result() for future in concurrent.futures.as_completed(futures)]
+    parts.sort(key=lambda part: part[0])
+    cash = array.array('d')
+    trades = 0
+    unopened = 0
+    for start, shard_cash, shard_trades, shard_unopened in parts:
+        cash.extend(shard_cash)
+        trades += shard_trades
+        unopened += shard_unopened
+    return SimulationResult(accounts,cash,trades,unopened,timer.perf_counter()-began)
+
+
+if __name__ == "__main__":
+    accounts = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    result = run_simulation(accounts,round_trip)
+    summary = result.summary()
+    print(f"{summary['accounts']} accounts on {os.cpu_count()} cores: {summary['seconds']:.1f}s "
+          f"({summary['accounts_per_second']:.0f} accounts/s), {summary['trades']} trades")
@@ -0,0 +1,205 @@
+"""
+Thread-safe trading for A3.
+
+The functions of a3 read a Portfolio's cash, check it and write it back with no
+synchronization, so two threads trading on one account can overdraw it or lose
+one another's updates. This module has a version of each of them that can be
+called from many threads at once on shared portfolios:
+
+    import a3sync
+    a3sync.buy_stock(portfolio,"IBM",10,False,time)       # from any thread
+
+Every Portfolio gets its own re-entrant lock (made on first use and kept in a
+table here, not on the portfolio, so the portfolio can still be pickled), and each
+function here does its read-check-write while holding the lock of the portfolio
+it trades on. Threads trading on different portfolios never wait for each other.
+
+Quotes are fetched before the lock is taken (except by sell_lots and
+execute_orders, which fetch theirs as part of the sale or batch), so a slow price
+request never keeps other threads off the account; the cash, trading-hours and
+fee checks are then made under the lock, against the balance as it is at that
+moment, as the async functions of a3 do after awaiting their quote.
+
+Several steps can be made one atomic transaction with transaction(), which also
+locks several portfolios at once without deadlocking:
+
+    with a3sync.transaction(portfolio):
+        stock = a3.buy_stock(portfolio,"IBM",10,False,time)
+        if stock is not None:
+            portfolio.add_stock(stock)
+
+Code holding the lock may call the functions of this module again.
+"""
+
+import weakref
+import datetime
+import threading
+import contextlib
+import a3
+import a3assets
+import a3helpers
+import a3lots
+import a3orders
+
+# Guards the first creation of each portfolio's lock, so two threads cannot make two locks.
+_create_lock = threading.Lock()
+
+# The lock of each portfolio; an entry goes away with its portfolio.
+_locks = weakref.WeakKeyDictionary()
+
+
+def lock(portfolio):
+    """
+    Returns: the re-entrant lock of portfolio, made on first use.
+
+    Parameter portfolio: the portfolio whose lock is wanted
+    Precondition: portfolio is a Portfolio object
+    """
+    found = _locks.get(portfolio)
+    if found is None:
+        with _create_lock:
+            found = _locks.get(portfolio)
+            if found is None:
+                found = threading.RLock()
+                _locks[portfolio] = found
+    return found
+
+
+@contextlib.contextmanager
+def transaction(*portfolios):
+    """
+    Holds the locks of every portfolio given for the body of a with statement.
+
+    The locks are always taken in the same order (by id), so threads locking the same
+    portfolios in different orders cannot deadlock. A portfolio given twice is locked once.
+
+    Parameter portfolios: the portfolios to lock
+    Precondition: each is a Portfolio object
+    """
+    locks = []
+    for portfolio in sorted({id(portfolio): portfolio for portfolio in portfolios}.values(),key=id):
+        assert isinstance(portfolio,a3assets.Portfolio), f'{portfolio} is not a Portfolio'
+        locks.append(lock(portfolio))
+    taken = []
+    try:
+        for held in locks:
+            held.acquire()
+            taken.append(held)
+        yield
+    finally:
+        for held in reversed(taken):
+            held.release()
+
+
+def invest_BitCoin(portfolio,amount):
+    """
+    Returns: a bool; the thread-safe version of a3.invest_BitCoin.
+    """
+    assert type(amount)==int and amount>0
+    assert isinstance(portfolio,a3assets.Portfolio)
+    bitcoins = a3helpers.get_BTC_price()
+    with lock(portfolio):
+        return a3._invest_BitCoin_at(portfolio,amount,bitcoins)
+
+
+def sell_BitCoin(portfolio,amount):
+    """
+    Returns: a bool; the thread-safe version of a3.sell_BitCoin.
+    """
+    assert type(amount)==int and amount>0
+    assert isinstance(portfolio,a3assets.Portfolio)
+    bitcoins = a3helpers.get_BTC_price()
+    with lock(portfolio):
+        return a3._sell_BitCoin_at(portfolio,amount,bitcoins)
+
+
+def compute_interest(portfolio,rate,years,times_compounded):
+    """
+    Returns: a float; the thread-safe version of a3.compute_interest.
+    """
+    with lock(portfolio):
+        return a3.compute_interest(portfolio,rate,years,times_compounded)
+
+
+def take_loan(portfolio,amount,length):
+    """
+    Returns: a Loan object or None; the thread-safe version of a3.take_loan.
+
+    The new loan is also added to portfolio.loans under the same lock, so no other
+    thread sees the cash without the loan.
+    """
+    with lock(portfolio):
+        loan = a3.take_loan(portfolio,amount,length)
+        if loan is not None:
+            portfolio.loans.append(loan)
+        return loan
+
+
+def pay_loan(portfolio,loan):
+    """
+    Returns: a bool; the thread-safe version of a3.pay_loan.
+    """
+    with lock(portfolio):
+        return a3.pay_loan(portfolio,loan)
+
+
+def buy_stock(portfolio,stock,amount_shares,short,time):
+    """
+    Returns: a Stock object or None; the thread-safe version of a3.buy_stock.
+
+    The new lot is also added with portfolio.add_stock under the same lock, so no other
+    thread sees the cash spent without the shares, and the lot returned is the one in
+    the portfolio.
+    """
+    assert type(stock)==str
+    assert type(amount_shares)==int and amount_shares>0
+    assert type(short)==bool
+    assert isinstance(portfolio,a3assets.Portfolio)
+    sprice = a3helpers.get_stock_price(stock)
+    with lock(portfolio):
+        bought = a3._buy_stock_at(portfolio,stock,amount_shares,short,time,sprice)
+        if bought is not None:
+            bought = portfolio.add_stock(bought)
+        return bought
+
+
+def pay_dividends(portfolio,stock,company,payments):
+    """
+    Returns: a bool; the thread-safe version of a3.pay_dividends.
+    """
+    with lock(portfolio):
+        return a3.pay_dividends(portfolio,stock,company,payments)
+
+
+def sell_stock(portfolio,amount_shares,time,stock):
+    """
+    Returns: a bool; the thread-safe version of a3.sell_stock.
+
+    Parameter stock: the lot to sell from
+    Precondition: stock is a Stock object held by portfolio
+    """
+    assert isinstance(portfolio,a3assets.Portfolio)
+    assert isinstance(stock,a3assets.Stock)
+    assert isinstance(time,datetime.datetime)
+    assert type(amount_shares)==int and amount_shares>0
+    sprice = a3helpers.get_stock_price(stock.company)
+    with lock(portfolio):
+        return a3._sell_stock_at(portfolio,amount_shares,time,stock,sprice)
+
+
+def sell_lots(portfolio,ticker,amount_shares,time,method=a3lots.FIFO,short=False,lots=None):
+    """
+    Returns: the number of shares sold as an int; the thread-safe version of a3lots.sell_lots.
+    """
+    with lock(portfolio):
+        return a3lots.sell_lots(portfolio,ticker,amount_shares,time,method,short,lots)
+
+
+def execute_orders(portfolio,orders,time=None):
+    """
+    Returns: a list of OrderResult; the thread-safe version of a3orders.execute_orders.
+
+    The whole batch runs under the lock of portfolio, so it is applied as one transaction.
+    """
+    with lock(portfolio):
+        return a3orders.execute_orders(portfolio,orders,time)
@@ -0,0 +1,163 @@
+"""
+Tax brackets for A3.
+
+The income tax (short-term) and capital-gains tax (long-term) schedules from the
+write-up are kept here as tables instead of if/elif chains. Each table stores the
+upper limit and rate of every bracket, plus the tax owed on all the brackets below
+it (its offset), so the tax on a profit is
+
+    offset[k] + rate[k] * (profit - lower[k])
+
+for the bracket k the profit falls in. The scalar function after_tax uses a binary
+search over the limits; after_tax_array does the same for a whole NumPy array at
+once with numpy.searchsorted. Both give exactly the results of a3.calculate_taxes.
+
+NumPy is only needed for after_tax_array, and is imported the first time it is used
+by load_numpy, which the other modules of A3 share.
+"""
+
+import bisect
+
+numpy = None
+
+
+def load_numpy():
+    """
+    Returns: the numpy module, importing it on first use.
+
+    Every module of A3 that can work without NumPy gets it here, and falls back (or
+    fails) by catching the ImportError raised when NumPy is not installed.
+    """
+    global numpy
+    if numpy is None:
+        try:
+            import numpy as module
+        except ImportError as error:
+            raise ImportError('NumPy is required for array calculations') from error
+        numpy = module
+    return numpy
+
+
+class TaxTable(object):
+    """
+    The class TaxTable is a progressive tax schedule. It has 4 attributes.
+        uppers - A tuple of floats; the inclusive upper limit of every bracket but the last
+        rates - A tuple of floats; the rate of every bracket, one more than uppers
+        lowers - A tuple of floats; the lower limit of every bracket, starting at 0.0
+        offsets - A tuple of floats; the tax owed on everything below each bracket
+
+    The constructor can be called like this
+    TaxTable([10000.0],[0.1,0.2])
+    Which taxes the first $10000 at 10% and the rest at 20%.
+    """
+
+    def __init__(self,uppers,rates):
+        """
+        :param uppers: increasing inclusive upper limits of all but the last bracket
+        :type uppers:  list of ``float`` >0
+
+        :param rates: the rate of each bracket
+        :type rates:  list of ``float``, len(rates) == len(uppers)+1
+        """
+        assert len(rates) == len(uppers)+1, 'there must be one more rate than upper limit'
+        assert all(a < b for a, b in zip(uppers,uppers[1:])), 'upper limits must increase'
+        self.uppers = tuple(float(u) for u in uppers)
+        self.rates = tuple(float(r) for r in rates)
+        self.lowers = (0.0,) + self.uppers
+        # Summed left to right so each offset is the same float the old inline formulas produced.
+        offsets = []
+        for k in range(len(self.rates)):
+            total = 0.0
+            for j in range(k):
+                part = self.rates[j]*(self.uppers[j]-self.lowers[j])
+                total = part if j == 0 else total+part
+            offsets.append(total)
+        self.offsets = tuple(offsets)
+        self._arrays = None
+
+    def bracket(self,profit):
+        """
+        Returns: the index of the bracket profit falls in, as an int.
+        """
+        return bisect.bisect_left(self.uppers,profit)
+
+    def tax(self,profit):
+        """
+        Returns: the tax owed on profit as a float.
+        """
+        k = bisect.bisect_left(self.uppers,profit)
+        return self.offsets[k]+self.rates[k]*(profit-self.lowers[k])
+
+    def after_tax(self,profit):
+        """
+        Returns: profit minus the tax owed on it, as a float.
+        """
+        return profit-self.tax(profit)
+
+    def after_tax_array(self,profits):
+        """
+        Returns: a NumPy float64 array of every profit minus the tax owed on it.
+
+        Parameter profits: the profits to tax
+        Precondition: profits is a 1-D NumPy array or sequence of numbers
+        """
+        uppers, rates, lowers, offsets = self._numpy_arrays()
+        profits = numpy.asarray(profits,dtype=numpy.float64)
+        k = numpy.searchsorted(uppers,profits,side='left')
+        return profits-(offsets[k]+rates[k]*(profits-lowers[k]))
+
+    def _numpy_arrays(self):
+        """
+        Returns: the table columns as NumPy arrays, built on first use.
+        """
+        load_numpy()
+        if self._arrays is None:
+            self._arrays = tuple(numpy.array(column,dtype=numpy.float64) for column in
+                                 (self.uppers,self.rates,self.lowers,self.offsets))
+        return self._arrays
+
+
+# Income tax, paid on short-term profits and dividends.
+SHORT_TERM = TaxTable([10000,100000,1000000,10000000],[0.1,0.2,0.3,0.4,0.7])
+# Capital-gains tax, paid on profits from stock held more than a year.
+LONG_TERM = TaxTable([38600,425800],[0.0,0.15,0.3])
+
+
+def after_tax(profit,long_term):
+    """
+    Returns: a float representing profit after the tax rate applied
+
+    Parameter profit: the profit to tax
+    Precondition: profit is a float
+
+    Parameter long_term: True for capital-gains tax, False for income tax
+    Precondition: long_term is a bool
+    """
+    if long_term:
+        return LONG_TERM.after_tax(profit)
+    return SHORT_TERM.after_tax(profit)
+
+
+def after_tax_array(profits,long_term):
+    """
+    Returns: a NumPy float64 array with every profit after its tax rate applied.
+
+    Each profit is taxed exactly as a3.calculate_taxes would tax it, in one
+    vectorized pass per tax table.
+
+    Parameter profits: the profits to tax
+    Precondition: profits is a 1-D NumPy array or sequence of numbers
+
+    Parameter long_term: which profits are long-term
+    Precondition: long_term is a bool, or a bool array the same length as profits
+    """
+    load_numpy()
+    profits = numpy.asarray(profits,dtype=numpy.float64)
+    if isinstance(long_term,bool):
+        return (LONG_TERM if long_term else SHORT_TERM).after_tax_array(profits)
+    mask = numpy.asarray(long_term,dtype=bool)
+    assert mask.shape == profits.shape, 'long_term must match profits in shape'
+    result = numpy.empty_like(profits)
+    result[mask] = LONG_TERM.after_tax_array(profits[mask])
+    result[~mask] = SHORT_TERM.after_tax_array(profits[~mask])
+    return result
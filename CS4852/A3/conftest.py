@@ -0,0 +1,93 @@
+"""
+Fixtures shared by the tests of A3.
+
+Run the tests from this folder with  python -m pytest
+
+Every test starts from the TEST key (CORNELL and BitCoin quoted at 18.65, HARVARD at
+0.0 and every other stock at 1.0) with no price source, quote store or scheduler
+installed and an empty quote cache; whatever a test installs is taken out after it.
+"""
+
+import datetime
+import pytest
+import a3
+import a3assets
+import a3cache
+import a3helpers
+import a3prices
+
+
+@pytest.fixture(autouse=True)
+def quiet_helpers(monkeypatch):
+    """
+    Puts the module-level state of a3helpers back to the TEST defaults around each test.
+    """
+    monkeypatch.setattr(a3helpers,"key","TEST")
+    monkeypatch.setattr(a3helpers,"price_source",None)
+    monkeypatch.setattr(a3helpers,"quote_store",None)
+    monkeypatch.setattr(a3helpers,"scheduler",None)
+    monkeypatch.setattr(a3helpers,"quote_cache",a3cache.QuoteCache(60.0,1024))
+
+
+@pytest.fixture
+def trading_time():
+    """
+    Returns: a Monday at 11 am, when a3 trades.
+    """
+    return datetime.datetime(2019,3,4,11)
+
+
+@pytest.fixture
+def make_portfolio():
+    """
+    Returns: a function make_portfolio(cash, lots, store) giving a new Portfolio with
+    cash (no enrollment fee) and every lot of lots, a tuple of the arguments of
+    a3assets.Stock, added with add_stock; with store, its lots are kept in a LotStore.
+    """
+    def make(cash=1000.0,lots=(),store=False):
+        portfolio = a3.open_portfolio(cash,0.0)
+        if store:
+            portfolio.stocks = a3assets.LotStore()
+        for lot in lots:
+            portfolio.add_stock(a3assets.Stock(*lot))
+        return portfolio
+    return make
+
+
+@pytest.fixture
+def install_prices(tmp_path):
+    """
+    Returns: a function install_prices(ticks) that writes ticks, as for
+    a3prices.write_replay_file, and installs a ReplaySource over them as the price
+    source of a3helpers until the test ends.
+    """
+    sources = []
+
+    def install(ticks):
+        path = str(tmp_path/f"prices{len(sources)}.a3tk")
+        a3prices.write_replay_file(path,ticks)
+        source = a3prices.ReplaySource(path)
+        sources.append(source)
+        a3helpers.set_price_source(source)
+        return source
+
+    yield install
+    a3helpers.set_price_source(None)
+    for source in sources:
+        source.close()
+
+
+@pytest.fixture
+def portfolio_state():
+    """
+    Returns: a function giving everything that describes a portfolio (cash, fees, coins,
+    every lot and loan in order, and the shares held of each ticker) as plain values,
+    for comparing two portfolios that should be the same.
+    """
+    def state(portfolio):
+        stocks = portfolio.stocks
+        lots = None if stocks is None else [(s.company,s.shares,s.buy_price,s.buy_date,s.short) for s in stocks]
+        loans = None if portfolio.loans is None else [(l.balance,l.length,l.late_fee) for l in portfolio.loans]
+        return (portfolio.cash,portfolio.commission_fee,portfolio.loan_rate,portfolio.coins,lots,loans,
+                sorted((t,portfolio.shares_of(t)) for t in portfolio.tickers()))
+    return state
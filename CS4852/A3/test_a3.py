@@ -0,0 +1,34 @@
+"""
+What invest_BitCoin and buy_stock charge and return, at the TEST quote of 18.65.
+"""
+
+import asyncio
+import a3
+import a3assets
+
+BTC = 18.65
+
+
+def test_invest_BitCoin_charges_every_coin_and_adds_to_the_balance(make_portfolio):
+    portfolio = make_portfolio()
+    assert a3.invest_BitCoin(portfolio,3)
+    assert a3.invest_BitCoin(portfolio,2)
+    assert portfolio.coins == 5
+    assert portfolio.cash == 1000.0-(BTC*3+portfolio.commission_fee)-(BTC*2+portfolio.commission_fee)
+
+
+def test_invest_BitCoin_refuses_what_the_cash_cannot_cover(make_portfolio):
+    portfolio = make_portfolio(50.0)
+    assert not a3.invest_BitCoin(portfolio,3)
+    assert (portfolio.coins,portfolio.cash) == (0,50.0)
+    assert asyncio.run(a3.invest_BitCoin_async(portfolio,2))
+    assert portfolio.coins == 2
+
+
+def test_buy_stock_returns_the_lot_bought(make_portfolio,trading_time):
+    portfolio = make_portfolio(100.0)
+    stock = a3.buy_stock(portfolio,"CORNELL",2,False,trading_time)
+    assert isinstance(stock,a3assets.Stock)
+    assert (stock.company,stock.shares,stock.buy_price,stock.short,stock.buy_date) == ("CORNELL",2,BTC,False,trading_time)
+    assert portfolio.cash == 100.0-2*BTC-portfolio.commission_fee
+    assert a3.buy_stock(portfolio,"CORNELL",100,False,trading_time) is None
@@ -0,0 +1,158 @@
+"""
+A portfolio whose lots are kept in a LotStore against one keeping them in a list
+(the same trades give the same portfolio, and LotViews act as Stocks), and the
+ticker index of Portfolio with the events its watchers are sent.
+"""
+
+import os
+import time
+import datetime
+import pytest
+import a3
+import a3assets
+import a3lots
+
+LOTS = [("CORNELL",12.0,10,False,datetime.datetime(2017,5,1,10,15)),
+        ("IBM",140.25,4,False,datetime.datetime(2018,11,4,1,30)),
+        ("CORNELL",25.5,6,True,datetime.datetime(2018,12,24,15)),
+        ("CORNELL",19.0,8,False,datetime.datetime(2019,1,2,11,0,0,250))]
+
+
+def trade(portfolio,time):
+    """
+    Runs the same buys, sales, dividends and compaction on portfolio, returning what each call returned.
+    """
+    done = []
+    bought = a3.buy_stock(portfolio,"CORNELL",5,False,time)
+    done.append(portfolio.add_stock(bought).buy_price)
+    first = portfolio.lots("CORNELL")[0]
+    done.append(a3.sell_stock(portfolio,3,time,first))
+    done.append(a3.pay_dividends(portfolio,first,"CORNELL",0.5))
+    done.append(a3lots.sell_lots(portfolio,"CORNELL",9,time))
+    done.append(a3lots.sell_lots(portfolio,"CORNELL",2,time,short=True))
+    done.append(a3.sell_stock(portfolio,4,time,portfolio.lots("IBM")[0]))
+    if isinstance(portfolio.stocks,a3assets.LotStore):
+        portfolio.stocks.compact()
+    else:
+        portfolio.stocks = [lot for lot in portfolio.stocks if lot.shares]
+    return done
+
+
+@pytest.mark.parametrize('fill',['add_stock','constructor'])
+def test_lot_store_trades_like_a_list(make_portfolio,portfolio_state,trading_time,fill):
+    listed = make_portfolio(5000.0,LOTS)
+    if fill == 'add_stock':
+        stored = make_portfolio(5000.0,LOTS,store=True)
+    else:
+        store = a3assets.LotStore()
+        for lot in LOTS:
+            store.add(*lot)
+        stored = make_portfolio(5000.0)
+        stored.stocks = store
+    assert portfolio_state(stored) == portfolio_state(listed)
+    assert trade(stored,trading_time) == trade(listed,trading_time)
+    assert portfolio_state(stored) == portfolio_state(listed)
+    assert len(stored.stocks) == len(listed.stocks) == 3
+
+
+def test_lot_views_are_stocks(make_portfolio):
+    stored = make_portfolio(100.0,LOTS,store=True)
+    views = list(stored.stocks)
+    assert all(isinstance(view,a3assets.Stock) for view in views)
+    assert [(v.company,v.buy_price,v.shares,v.short,v.buy_date) for v in views] == LOTS
+    assert views[0] == stored.stocks[0] and views[-1] == stored.stocks[-1]
+    assert stored.stocks.sell(0,15) == 10 and views[0].shares == 0
+    views[1].buy_date = datetime.datetime(2020,2,29,12)
+    views[1].company = "MSFT"
+    assert (views[1].company,views[1].buy_date) == ("MSFT",datetime.datetime(2020,2,29,12))
+    assert stored.shares_of("MSFT") == 4 and stored.shares_of("IBM") == 0
+    with pytest.raises(IndexError):
+        stored.stocks[4]
+
+
+@pytest.fixture
+def new_york():
+    """
+    Runs the test with the local time zone set to New York, where clocks change.
+    """
+    before = os.environ.get('TZ')
+    os.environ['TZ'] = 'America/New_York'
+    time.tzset()
+    yield
+    if before is None:
+        del os.environ['TZ']
+    else:
+        os.environ['TZ'] = before
+    time.tzset()
+
+
+@pytest.mark.skipif(not hasattr(time,'tzset'),reason='time zones cannot be switched here')
+def test_buy_dates_read_back_exactly_around_clock_changes(new_york):
+    # 1:30 am on 2018-11-04 happens twice, and 2:30 am on 2019-03-10 never happens, in New York.
+    dates = [datetime.datetime(2018,11,4,1,30),datetime.datetime(2018,11,4,1,30,fold=1),
+             datetime.datetime(2019,3,10,2,30),datetime.datetime(1969,12,31,23,59,59,999999)]
+    store = a3assets.LotStore()
+    for date in dates:
+        store.add("IBM",1.0,1,False,date)
+    assert [view.buy_date for view in store] == dates
+    store[0].buy_date = dates[2]
+    assert store[0].buy_date == dates[2]
+
+
+class Recorder(object):
+    """
+    A watcher of a Portfolio that writes down every call it gets.
+    """
+
+    def __init__(self,portfolio):
+        self.events = []
+        portfolio._watchers = portfolio._watchers+(self,)
+
+    def opened(self,portfolio,ticker):
+        self.events.append(('opened',ticker))
+
+    def changed(self,portfolio,ticker):
+        self.events.append(('changed',ticker,portfolio.shares_of(ticker)))
+
+    def closed(self,portfolio,ticker):
+        self.events.append(('closed',ticker))
+
+    def take(self):
+        events = self.events
+        self.events = []
+        return events
+
+
+@pytest.mark.parametrize('store',[False,True])
+def test_watchers_hear_of_every_position_change(make_portfolio,store):
+    portfolio = make_portfolio(store=store)
+    recorder = Recorder(portfolio)
+    first = portfolio.add_stock(a3assets.Stock(*LOTS[0]))
+    second = portfolio.add_stock(a3assets.Stock(*LOTS[2]))
+    assert recorder.take() == [('opened','CORNELL'),('changed','CORNELL',10),('changed','CORNELL',16)]
+    first.shares = 4
+    second.shares = 0
+    assert recorder.take() == [('changed','CORNELL',10),('changed','CORNELL',4)]
+    assert portfolio.cost_basis("CORNELL") == 4*12.0 and portfolio.lots("CORNELL") == [first]
+    first.company = "IBM"
+    assert recorder.take() == [('closed','CORNELL'),('opened','IBM'),('changed','IBM',4)]
+    first.shares = 0
+    second.shares = 2
+    assert recorder.take() == [('closed','IBM'),('opened','CORNELL'),('changed','CORNELL',2)]
+    assert portfolio.tickers() == ["CORNELL"] and portfolio.position("IBM") is None
+
+
+def test_reindex_follows_a_new_stocks_list(make_portfolio):
+    portfolio = make_portfolio(100.0,LOTS)
+    old = portfolio.lots("CORNELL")
+    recorder = Recorder(portfolio)
+    portfolio.stocks = [a3assets.Stock(*LOTS[1]),a3assets.Stock("MSFT",3.0,2,False,LOTS[1][4])]
+    assert sorted(recorder.take()) == [('changed','IBM',4),('changed','MSFT',2),('closed','CORNELL'),
+                                       ('closed','IBM'),('opened','IBM'),('opened','MSFT')]
+    assert sorted(portfolio.tickers()) == ["IBM","MSFT"] and portfolio.shares_of("CORNELL") == 0
+    old[0].shares = 1
+    assert recorder.take() == [] and portfolio.lots("CORNELL") == []
+    portfolio.stocks.append(a3assets.Stock("IBM",150.0,1,False,LOTS[1][4]))
+    portfolio.reindex()
+    assert portfolio.shares_of("IBM") == 5 and portfolio.cost_basis("IBM") == 4*140.25+150.0
+    assert len(portfolio.position("IBM").long_queue) == 2
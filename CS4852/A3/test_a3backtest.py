@@ -0,0 +1,76 @@
+"""
+run_backtest over a HistoryStore of daily closes and a tick file with several ticks a
+day: when the strategy trades and which prices it may see.
+"""
+
+import datetime
+import a3
+import a3backtest
+import a3history
+import a3prices
+
+# Daily closes of one week, Monday to Friday; each is stamped at 4 pm on its date.
+CLOSES = [("2019-03-01",10.0),("2019-03-04",11.0),("2019-03-05",12.0),("2019-03-06",13.0)]
+
+
+def closes(tmp_path):
+    """
+    Returns: a HistoryStore in tmp_path holding the IBM closes of CLOSES.
+    """
+    history = a3history.HistoryStore(str(tmp_path))
+    history.ingest("IBM",[(a3history.close_timestamp(day),price) for day, price in CLOSES])
+    return history
+
+
+def test_trade_before_the_close_fills_at_the_previous_close(tmp_path,make_portfolio):
+    bought = []
+
+    def strategy(portfolio,time):
+        if not bought:
+            stock = a3.buy_stock(portfolio,"IBM",10,False,time)
+            bought.append(portfolio.add_stock(stock))
+
+    portfolio = make_portfolio()
+    with closes(tmp_path) as history:
+        result = a3backtest.run_backtest(portfolio,history,strategy,datetime.datetime(2019,3,2),
+                                         datetime.datetime(2019,3,6,23),trade_time=datetime.time(15,59))
+    assert bought[0].buy_date == datetime.datetime(2019,3,4,15,59)
+    assert bought[0].buy_price == 10.0
+    assert portfolio.cash == 900.0-portfolio.commission_fee
+    assert result.times[0] == a3history.close_timestamp("2019-03-04")
+
+
+def test_strategy_cannot_ask_for_a_later_price(tmp_path,make_portfolio):
+    seen = []
+
+    def strategy(portfolio,time):
+        feed = a3.a3helpers.price_source
+        seen.append((feed.price("IBM"),feed.price_at("IBM",time)))
+
+    with closes(tmp_path) as history:
+        a3backtest.run_backtest(make_portfolio(),history,strategy,datetime.datetime(2019,3,2),
+                                datetime.datetime(2019,3,6,23),trade_time=datetime.time(15,59))
+    assert seen == [(10.0,10.0),(11.0,11.0),(12.0,12.0)]
+
+
+def test_several_ticks_a_day_trade_once_a_day(tmp_path,make_portfolio):
+    monday, tuesday = datetime.datetime(2019,3,4), datetime.datetime(2019,3,5)
+    ticks = [(datetime.datetime(2019,3,1,15),19.0)]+[(day.replace(hour=hour),price) for day, hour, price in
+             [(monday,10,20.0),(monday,11,21.0),(monday,12,22.0),(tuesday,10,23.0),(tuesday,11,24.0),(tuesday,13,25.0)]]
+    path = str(tmp_path/"ibm.a3tk")
+    a3prices.write_replay_file(path,{"IBM": ticks})
+    expected = {datetime.time(9,30): [(monday.replace(hour=9,minute=30),19.0),(tuesday.replace(hour=9,minute=30),22.0)],
+                datetime.time(11,30): [(monday.replace(hour=11,minute=30),21.0),(tuesday.replace(hour=11,minute=30),24.0)],
+                datetime.time(12,30): [(tuesday.replace(hour=12,minute=30),24.0)],
+                None: [(time,price) for time, price in ticks[1:]]}
+    for trade_time, calls in expected.items():
+        seen = []
+
+        def strategy(portfolio,time):
+            seen.append((time,a3.a3helpers.get_stock_price("IBM")))
+
+        with a3prices.ReplaySource(path) as source:
+            result = a3backtest.run_backtest(make_portfolio(),source,strategy,datetime.datetime(2019,3,2),
+                                             datetime.datetime(2019,3,5,23),["IBM"],trade_time=trade_time)
+        assert seen == calls
+        assert list(result.times) == [a3prices.to_timestamp(time) for time, _ in ticks[1:]]
@@ -0,0 +1,103 @@
+"""
+Checkpoints written by a3checkpoint.dumps and save: round trips of every kind of
+portfolio, bytes that are not a checkpoint or are corrupt, and saves that fail half way.
+"""
+
+import os
+import random
+import struct
+import datetime
+import pytest
+import a3assets
+import a3checkpoint
+
+
+@pytest.fixture
+def kinds(make_portfolio):
+    """
+    Returns: a portfolio with its lots in a list, one with a LotStore, and one with no stocks or loans.
+    """
+    bought = datetime.datetime(2018,1,2,9,30,0,123456)
+    listed = make_portfolio(5000.0,[(company,10.0+i,i+1,i == 2,bought)
+                                    for i, company in enumerate(("IBM","CORNELL","ÉTÉ","IBM"))])
+    listed.commission_fee = 2.5
+    listed.coins = 3
+    listed.loans.append(a3assets.Loan(200.0,10))
+    stored = make_portfolio(100.0,[("MSFT",2.5,7,False,datetime.datetime(2019,3,4,11))],store=True)
+    empty = make_portfolio(1.0)
+    empty.stocks = None
+    empty.loans = None
+    return [listed,stored,empty]
+
+
+@pytest.mark.parametrize('compress',[False,True,9])
+def test_loads_rebuilds_every_portfolio(compress,kinds,portfolio_state):
+    portfolios = kinds
+    loaded = a3checkpoint.loads(a3checkpoint.dumps(portfolios,compress))
+    assert [portfolio_state(p) for p in loaded] == [portfolio_state(p) for p in portfolios]
+    assert loaded[0].lots("IBM")[1].shares == 4
+
+
+def test_loads_refuses_bytes_that_are_not_a_checkpoint(kinds):
+    data = a3checkpoint.dumps(kinds,True)
+    for bad in (b"",b"A3CK",b"XXXX"+data[4:],data[:-1],data[:16]+bytes(len(data)-16)):
+        with pytest.raises(ValueError):
+            a3checkpoint.loads(bad)
+
+
+def with_body(data,body):
+    """
+    Returns: the uncompressed checkpoint data with its body replaced by body.
+    """
+    magic, version, flags, length = a3checkpoint._HEADER.unpack_from(data,0)
+    return a3checkpoint._HEADER.pack(magic,version,flags,len(body))+body
+
+
+def test_loads_refuses_a_corrupt_body(kinds,make_portfolio):
+    data = a3checkpoint.dumps(kinds)
+    body = data[a3checkpoint._HEADER.size:]
+    for n in range(len(body)):
+        with pytest.raises(ValueError):
+            a3checkpoint.loads(with_body(data,body[:n]))
+    bought = datetime.datetime(2019,3,4,11)
+    stamp = struct.pack("<q",(bought-a3checkpoint.EPOCH)//a3checkpoint.MICROSECOND)
+    # The one lot's ticker id, then its shares, in the lot columns of a list or a LotStore alike.
+    lot = struct.pack("<Iq",0,12345)
+    for store in (False,True):
+        data = a3checkpoint.dumps([make_portfolio(10.0,[("IBM",2.0,12345,False,bought)],store=store)])
+        assert data.count(stamp) == data.count(lot) == 1
+        for bad in (data.replace(stamp,struct.pack("<q",2**62)),data.replace(stamp,struct.pack("<q",-2**62)),
+                    data.replace(lot,struct.pack("<Iq",7,12345)),data.replace(lot,struct.pack("<Iq",2**32-1,12345))):
+            with pytest.raises(ValueError):
+                a3checkpoint.loads(bad)
+
+
+def test_loads_of_garbage_raises_only_value_error(kinds):
+    data = a3checkpoint.dumps(kinds)
+    size = a3checkpoint._HEADER.size
+    rng = random.Random(4852)
+    for _ in range(3000):
+        bad = bytearray(data)
+        for _ in range(rng.randint(1,4)):
+            bad[rng.randrange(size,len(bad))] = rng.randrange(256)
+        try:
+            a3checkpoint.loads(bytes(bad))
+        except ValueError:
+            pass
+
+
+def test_save_replaces_the_file_and_cleans_up_a_failed_write(tmp_path,monkeypatch,kinds,portfolio_state):
+    path = str(tmp_path/"book.a3ck")
+    portfolios = kinds
+    a3checkpoint.save(path,portfolios)
+    assert [portfolio_state(p) for p in a3checkpoint.load(path)] == [portfolio_state(p) for p in portfolios]
+    assert os.listdir(str(tmp_path)) == ["book.a3ck"]
+
+    def broken(fd):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(os,"fsync",broken)
+    with pytest.raises(OSError):
+        a3checkpoint.save(path,portfolios[1:])
+    assert os.listdir(str(tmp_path)) == ["book.a3ck"]
+    assert len(a3checkpoint.load(path)) == 3
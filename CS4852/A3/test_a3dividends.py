@@ -0,0 +1,68 @@
+"""
+distribute_many against paying every lot with a3.pay_dividends, over lists, iterators
+and HolderIndexes of portfolios.
+"""
+
+import sys
+import datetime
+import pytest
+import a3
+import a3dividends
+import a3taxes
+
+
+@pytest.fixture
+def portfolios(make_portfolio):
+    """
+    Returns: a function giving n new portfolios, each holding two IBM lots (one shorted) and one MSFT lot.
+    """
+    bought = datetime.datetime(2018,1,2)
+
+    def make(n):
+        return [make_portfolio(1000.0+i,[("IBM",1.0,10+i,False,bought),("IBM",1.0,3,True,bought),
+                                         ("MSFT",1.0,5+i,False,bought)]) for i in range(n)]
+    return make
+
+
+def test_distribute_many_matches_pay_dividends(portfolios):
+    dividends = [("IBM",0.25),("MSFT",1.5),("IBM",0.75)]
+    for n in (3,100):
+        expected = portfolios(n)
+        for company, payment in dividends:
+            for portfolio in expected:
+                for lot in portfolio.lots(company):
+                    if not lot.short:
+                        a3.pay_dividends(portfolio,lot,company,payment)
+        for holders in (portfolios(n),a3dividends.HolderIndex(portfolios(n))):
+            paid = a3dividends.distribute_many(dividends,holders)
+            assert paid[:2] == (n,3*n)
+            actual = holders if isinstance(holders,list) else holders.holders("IBM")
+            assert [portfolio.cash for portfolio in actual] == [portfolio.cash for portfolio in expected]
+
+
+def test_distribute_many_reads_an_iterator_once(portfolios):
+    holders = portfolios(4)
+    assert a3dividends.distribute_many([("IBM",1.0),("MSFT",1.0)],iter(holders))[:2] == (4,8)
+
+
+def test_holding_matches_holders(portfolios):
+    holders = portfolios(2)
+    index = a3dividends.HolderIndex(holders)
+    assert list(index.holding("MSFT")) == index.holders("MSFT") == holders
+    assert len(index.holding("AAPL")) == 0
+    for lot in holders[0].lots("MSFT"):
+        lot.shares = 0
+    assert list(index.holding("MSFT")) == holders[1:]
+
+
+def test_distribute_many_without_numpy_pays_the_same(portfolios,monkeypatch):
+    dividends = [("IBM",0.25),("MSFT",1.5)]
+    expected = portfolios(a3dividends.VECTOR_MIN)
+    a3dividends.distribute_many(dividends,expected)
+    monkeypatch.setitem(sys.modules,'numpy',None)
+    monkeypatch.setattr(a3taxes,'numpy',None)
+    monkeypatch.setattr(a3dividends,'_vectorized',None)
+    actual = portfolios(a3dividends.VECTOR_MIN)
+    a3dividends.distribute_many(dividends,actual)
+    assert a3dividends._vectorized is False
+    assert [portfolio.cash for portfolio in actual] == [portfolio.cash for portfolio in expected]
@@ -0,0 +1,98 @@
+"""
+The quote cache in front of the live fetchers of a3helpers, with the network replaced
+by a session that counts its calls and a clock that only moves when told to.
+"""
+
+import pytest
+import a3
+import a3cache
+import a3helpers
+
+
+class Response(object):
+    """
+    A response with only the text of its body.
+    """
+
+
+class Session(object):
+    """
+    Answers GLOBAL_QUOTE and CURRENCY_EXCHANGE_RATE calls from a dict of prices.
+    """
+
+    def __init__(self,prices):
+        self.prices = prices
+        self.calls = []
+
+    def get(self,url):
+        response = Response()
+        if url.startswith(a3helpers.BTC_URL):
+            self.calls.append(a3helpers.BTC_SYMBOL)
+            response.text = '{"5. Exchange Rate": "%s", "6. Last Refreshed": ""}' % self.prices[a3helpers.BTC_SYMBOL]
+        else:
+            symbol = url[len(a3helpers.QUOTE_URL):url.index("&apikey")]
+            self.calls.append(symbol)
+            response.text = '{"Global Quote": {"05. price": "%s", "06. volume": "1"}}' % self.prices[symbol]
+        return response
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def live(monkeypatch):
+    """
+    Returns: a tuple (session, clock) once a3helpers fetches through session with a
+    demo key and keeps quotes for 60 seconds of clock.
+    """
+    session = Session({"IBM": 120.5, "MSFT": 250.0, a3helpers.BTC_SYMBOL: 3900.25})
+    clock = Clock()
+    monkeypatch.setattr(a3helpers,"key","demo")
+    monkeypatch.setattr(a3helpers,"get_session",lambda: session)
+    monkeypatch.setattr(a3helpers,"quote_cache",a3cache.QuoteCache(60.0,16,clock))
+    return session, clock
+
+
+def test_one_trading_action_reads_one_quote(live,make_portfolio,trading_time):
+    session, clock = live
+    portfolio = make_portfolio(10000.0)
+    stock = portfolio.add_stock(a3.buy_stock(portfolio,"IBM",2,False,trading_time))
+    assert a3.sell_stock(portfolio,1,trading_time,stock)
+    assert a3helpers.get_stock_price("ibm") == 120.5
+    assert a3.invest_BitCoin(portfolio,1) and a3.sell_BitCoin(portfolio,1)
+    assert session.calls == ["IBM",a3helpers.BTC_SYMBOL]
+    assert a3helpers.quote_cache.hits == 3
+
+
+def test_quotes_expire_after_the_ttl(live):
+    session, clock = live
+    a3helpers.quote_cache.set_ttl("MSFT",5.0)
+    assert a3helpers.get_stock_price("IBM") == a3helpers.get_stock_price("MSFT")-129.5
+    clock.now += 4.9
+    a3helpers.get_stock_prices(["IBM","MSFT"])
+    assert session.calls == ["IBM","MSFT"]
+    clock.now += 0.1
+    session.prices["MSFT"] = 251.0
+    assert a3helpers.get_stock_price("MSFT") == 251.0
+    assert a3helpers.get_stock_price("IBM") == 120.5
+    clock.now += 55.0
+    assert a3helpers.get_stock_price("IBM") == 120.5
+    assert session.calls == ["IBM","MSFT","MSFT","IBM"]
+
+
+def test_invalidate_quotes_forgets_them(live):
+    session, clock = live
+    for symbol in ("IBM","MSFT"):
+        a3helpers.get_stock_price(symbol)
+    a3helpers.get_BTC_price()
+    assert a3helpers.invalidate_quotes("ibm") == 1
+    a3helpers.get_stock_price("MSFT")
+    a3helpers.get_stock_price("IBM")
+    assert a3helpers.invalidate_quotes() == 3
+    a3helpers.get_BTC_price()
+    assert session.calls == ["IBM","MSFT",a3helpers.BTC_SYMBOL,"IBM",a3helpers.BTC_SYMBOL]
@@ -0,0 +1,102 @@
+"""
+The CSV and JSON dump parsers of a3history, read whole and in small chunks, and
+series written to a HistoryStore and read back, on any machine time zone.
+"""
+
+import io
+import os
+import json
+import time
+import datetime
+import pytest
+import a3history
+
+# Newest first, as Alpha Vantage sends them; 2019-03-08 is a Friday, and clocks change on 2019-03-10.
+DAYS = [("2019-03-11",129.5,128.0),("2019-03-08",127.25,126.0),("2019-03-07",126.0,125.5),("2019-03-04",125.0,124.0)]
+CSV = "timestamp,open,high,low,close,adjusted_close,volume\n"+"".join(
+    f"{day},1,2,0.5,{close},{adjusted},100\n" for day, close, adjusted in DAYS)
+JSON = json.dumps({"Meta Data": {"2. Symbol": "IBM"},
+                   "Time Series (Daily)": {day: {"1. open": "1.0","4. close": str(close),
+                                                 "5. adjusted close": str(adjusted)}
+                                           for day, close, adjusted in DAYS}},indent=1)
+
+
+def closes():
+    """
+    Returns: the (timestamp, close) pairs of DAYS, newest first.
+    """
+    return [(a3history.close_timestamp(day),close) for day, close, _ in DAYS]
+
+
+@pytest.fixture(params=['UTC','Asia/Kolkata','America/Los_Angeles'])
+def machine_zone(request):
+    """
+    Runs the test with the local time zone of the machine set to each of a few zones.
+    """
+    if not hasattr(time,'tzset'):
+        pytest.skip('time zones cannot be switched here')
+    before = os.environ.get('TZ')
+    os.environ['TZ'] = request.param
+    time.tzset()
+    yield request.param
+    if before is None:
+        del os.environ['TZ']
+    else:
+        os.environ['TZ'] = before
+    time.tzset()
+
+
+def test_closes_are_stamped_at_four_in_new_york(machine_zone):
+    utc = datetime.timezone.utc
+    assert a3history.close_timestamp("2019-03-08") == datetime.datetime(2019,3,8,21,tzinfo=utc).timestamp()
+    assert a3history.close_timestamp(datetime.date(2019,3,11)) == datetime.datetime(2019,3,11,20,tzinfo=utc).timestamp()
+    assert a3history.close_timestamp("2019-03-11T00:00:00") == a3history.close_timestamp(datetime.datetime(2019,3,11,9))
+
+
+def test_csv_and_json_dumps_give_the_same_closes():
+    assert list(a3history.iter_csv(io.StringIO(CSV))) == closes()
+    assert list(a3history.iter_json(io.StringIO(JSON))) == closes()
+    quoted = '"Date","Volume","Price"\n\n"2019-03-04",100,125.0\n'
+    assert list(a3history.iter_csv(quoted.splitlines(True))) == [closes()[-1]]
+
+
+@pytest.mark.parametrize('chunk',[1,7,64])
+def test_json_dump_read_in_small_chunks(monkeypatch,chunk):
+    monkeypatch.setattr(a3history,"CHUNK",chunk)
+    assert list(a3history.iter_json(io.StringIO(JSON))) == closes()
+
+
+def test_bad_dumps_raise_value_error():
+    with pytest.raises(ValueError):
+        list(a3history.iter_csv(io.StringIO("when,what\n2019-03-04,1\n")))
+    with pytest.raises(ValueError):
+        list(a3history.iter_json(io.StringIO('{"Note": "API call frequency"}')))
+    with pytest.raises(ValueError):
+        list(a3history.iter_json(io.StringIO(JSON[:len(JSON)//2])))
+
+
+def test_store_round_trip(tmp_path,machine_zone):
+    dump = tmp_path/"ibm.csv"
+    dump.write_text(CSV)
+    (tmp_path/"btc.json").write_text(JSON)
+    with a3history.HistoryStore(str(tmp_path/"history")) as store:
+        assert store.ingest_dump(str(dump)) == 4
+        assert store.ingest_dump(str(tmp_path/"btc.json"),"BTC/USD") == 4
+        assert store.symbols() == ["BTC/USD","IBM"] and "btc/usd" in store
+        times, prices = store.series("IBM")
+        assert list(zip(times,prices)) == sorted(closes())
+        assert store.first_time("IBM") == datetime.datetime(2019,3,4,16)
+        assert store.last_time("IBM") == datetime.datetime(2019,3,11,16)
+        assert store.price_at("IBM",datetime.datetime(2019,3,8,15,59)) == 126.0
+        assert store.price_at("IBM",datetime.datetime(2019,3,8,16)) == 127.25
+        assert store.price_at("IBM",datetime.datetime(2019,3,11,11)) == 127.25
+        assert store.price_at("BTC/USD",None) == 129.5
+        with pytest.raises(KeyError):
+            store.price_at("IBM",datetime.datetime(2019,3,4,12))
+        window = store.window("IBM",datetime.datetime(2019,3,5),datetime.datetime(2019,3,8,16))
+        assert list(window[1]) == [126.0,127.25]
+        assert store.ingest("IBM",[(datetime.datetime(2019,3,8,16),130.0),(datetime.datetime(2019,3,12,16),131.0)]) == 5
+    with a3history.HistoryStore(str(tmp_path/"history")) as store:
+        assert list(store.series("IBM")[1]) == [125.0,126.0,130.0,129.5,131.0]
+        assert store.ingest("IBM",[(datetime.datetime(2019,3,4,16),1.0)],merge=False) == 1
+        assert list(store.series("IBM")[1]) == [1.0]
@@ -0,0 +1,106 @@
+"""
+Journals written through a3journal.Journal and read back with Journal.restore,
+whole, cut short, and with records after the last snapshot.
+"""
+
+import os
+import a3journal
+
+
+def trade(journal,rounds,time):
+    """
+    Runs `rounds` rounds of every kind of transaction through journal, at time.
+    """
+    for i in range(rounds):
+        lot = journal.buy_stock("CORNELL",3,i % 2 == 1,time)
+        journal.sell_stock(1,time,lot)
+        journal.invest_BitCoin(1)
+        journal.sell_BitCoin(1)
+        loan = journal.take_loan(10.0,2)
+        if loan is not None:
+            journal.pay_loan(loan)
+        journal.pay_dividends(lot,"CORNELL",0.25)
+        journal.compute_interest(1.0,0.5,4.0)
+
+
+def snapshots(path):
+    return os.path.getsize(path+".snap")//a3journal._OFFSET.size
+
+
+def test_restore_rebuilds_portfolio_exactly(tmp_path,trading_time):
+    path = str(tmp_path/"book.a3j")
+    portfolio = a3journal.a3.open_portfolio(5000.0,1.0)
+    with a3journal.Journal.create(path,portfolio,snapshot_every=7) as journal:
+        trade(journal,20,trading_time)
+    restored = a3journal.Journal.restore(path)
+    restored.close()
+    assert a3journal.encode_state(restored.portfolio) == a3journal.encode_state(portfolio)
+    assert sorted(restored.portfolio.tickers()) == sorted(portfolio.tickers())
+    assert restored.portfolio.shares_of("CORNELL") == portfolio.shares_of("CORNELL")
+
+
+def test_restore_ignores_a_record_cut_short(tmp_path,trading_time):
+    path = str(tmp_path/"book.a3j")
+    portfolio = a3journal.a3.open_portfolio(5000.0,1.0)
+    with a3journal.Journal.create(path,portfolio) as journal:
+        trade(journal,3,trading_time)
+        before = a3journal.encode_state(portfolio)
+        journal.invest_BitCoin(1)
+    with open(path,"r+b") as file:
+        file.truncate(os.path.getsize(path)-3)
+    with a3journal.Journal.restore(path) as journal:
+        assert a3journal.encode_state(journal.portfolio) == before
+        journal.invest_BitCoin(1)
+    with a3journal.Journal.restore(path) as journal:
+        assert journal.portfolio.coins == 1
+
+
+def test_restore_counts_the_tail_towards_the_next_snapshot(tmp_path):
+    path = str(tmp_path/"book.a3j")
+    portfolio = a3journal.a3.open_portfolio(5000.0,1.0)
+    with a3journal.Journal.create(path,portfolio,snapshot_every=10) as journal:
+        for _ in range(6):
+            journal.invest_BitCoin(1)
+    assert snapshots(path) == 1
+    with a3journal.Journal.restore(path,snapshot_every=10) as journal:
+        for _ in range(3):
+            journal.invest_BitCoin(1)
+        assert snapshots(path) == 1
+        journal.invest_BitCoin(1)
+        assert snapshots(path) == 2
+
+
+def test_restore_keeps_lots_in_a_lot_store(tmp_path,make_portfolio,portfolio_state,trading_time):
+    for store in (False,True):
+        path = str(tmp_path/f"book{store}.a3j")
+        portfolio = make_portfolio(5000.0,store=store)
+        with a3journal.Journal.create(path,portfolio,snapshot_every=5) as journal:
+            trade(journal,4,trading_time)
+        with a3journal.Journal.restore(path) as journal:
+            assert isinstance(journal.portfolio.stocks,a3journal.a3assets.LotStore) == store
+            assert portfolio_state(journal.portfolio) == portfolio_state(portfolio)
+            journal.sell_stock(1,trading_time,journal.portfolio.lots("CORNELL")[-1])
+            after = portfolio_state(journal.portfolio)
+        with a3journal.Journal.restore(path) as journal:
+            assert portfolio_state(journal.portfolio) == after
+
+
+def test_loans_keep_their_number_when_the_loans_list_changes(tmp_path,make_portfolio,portfolio_state):
+    path = str(tmp_path/"book.a3j")
+    portfolio = make_portfolio(5000.0)
+    with a3journal.Journal.create(path,portfolio,snapshot_every=6) as journal:
+        first = journal.take_loan(100.0,1)
+        second = journal.take_loan(200.0,3)
+        assert journal.pay_loan(first)
+        portfolio.loans.remove(first)
+        third = journal.take_loan(300.0,2)
+        for loan in (third,second,third,second):
+            journal.pay_loan(loan)
+        del first
+        fourth = journal.take_loan(400.0,4)
+        journal.pay_loan(fourth)
+        journal.pay_loan(second)
+        assert snapshots(path) == 2
+    with a3journal.Journal.restore(path) as journal:
+        assert portfolio_state(journal.portfolio) == portfolio_state(portfolio)
+        assert [loan.length for loan in journal.portfolio.loans] == [0,0,3]
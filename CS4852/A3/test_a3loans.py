@@ -0,0 +1,55 @@
+"""
+A LoanBook against calling a3.pay_loan on each loan in turn: the same loans, run for
+the same months, leave exactly the same cash, loan rates, balances and months left.
+"""
+
+import pytest
+pytest.importorskip('numpy')
+import a3
+import a3assets
+import a3loans
+
+# Per portfolio: its cash and the (balance, months, late fee) of each of its loans, in order.
+OWED = [(500.0,[(1000.0/3,4,100.0),(250.5,2,12.25)]),
+        (90.0,[(123.45,3,7.5)]),
+        (0.0,[(10.0,1,1.0),(55.0,5,0.3)]),
+        (1e4,[]),
+        (2000.0/7,[(99.99,6,0.01),(300.0,1,50.0),(0.0,0,5.0),(77.7,7,7.7)])]
+
+
+def owe(make_portfolio):
+    """
+    Returns: a new list of the portfolios of OWED, each owing its loans.
+    """
+    portfolios = []
+    for cash, loans in OWED:
+        portfolio = make_portfolio(cash)
+        portfolio.loan_rate = 0.05+0.01*len(loans)
+        for balance, length, late_fee in loans:
+            loan = a3assets.Loan(balance,length)
+            loan.late_fee = late_fee
+            portfolio.loans.append(loan)
+        portfolios.append(portfolio)
+    return portfolios
+
+
+@pytest.mark.parametrize('months',[0,1,3,8])
+def test_loan_book_pays_like_pay_loan(make_portfolio,portfolio_state,months):
+    looped = owe(make_portfolio)
+    late = []
+    for month in range(months):
+        number = 0
+        for portfolio in looped:
+            for loan in portfolio.loans:
+                if loan.length > 0 and not a3.pay_loan(portfolio,loan):
+                    late.append((month,number))
+                number += 1
+    booked = owe(make_portfolio)
+    book = a3loans.LoanBook.from_portfolios(booked)
+    schedule = book.advance(months,record=True)
+    book.write_back()
+    assert [portfolio_state(p) for p in booked] == [portfolio_state(p) for p in looped]
+    assert [(int(m),int(n)) for m, n in zip(*schedule.late.nonzero())] == late
+    assert months < 3 or late
+    assert [type(p.cash) for p in booked] == [float]*len(OWED)
+    assert all(type(l.balance) == float and type(l.length) == int for p in booked for l in p.loans)
@@ -0,0 +1,61 @@
+"""
+Which lots a3lots.select and sell_lots take shares from, where split draws the
+one-year line, and how each lot of a sale is taxed. CORNELL sells at 18.65.
+"""
+
+import datetime
+import pytest
+import a3
+import a3lots
+
+
+@pytest.fixture
+def cornell(make_portfolio):
+    """
+    Returns: a portfolio with five CORNELL lots bought over four years and one shorted lot,
+    added out of date order, and its long lots by buy year.
+    """
+    years = ((2018,15.0,4),(2016,12.0,1),(2019,20.0,2),(2017,25.0,3),(2018,9.0,5))
+    portfolio = make_portfolio(10000.0,[("CORNELL",price,shares,False,datetime.datetime(year,1,2))
+                                        for year, price, shares in years]
+                               +[("CORNELL",18.0,7,True,datetime.datetime(2016,6,1))])
+    lots = {}
+    for lot in portfolio.lots("CORNELL"):
+        if not lot.short:
+            lots.setdefault(lot.buy_date.year,[]).append(lot)
+    return portfolio, lots
+
+
+def test_select_orders_lots_by_method(cornell):
+    portfolio, lots = cornell
+    fifo = a3lots.select(portfolio,"CORNELL",5)
+    assert [(lot.buy_date.year,shares) for lot, shares in fifo] == [(2016,1),(2017,3),(2018,1)]
+    lifo = a3lots.select(portfolio,"CORNELL",5,a3lots.LIFO)
+    assert [(lot.buy_date.year,shares) for lot, shares in lifo] == [(2019,2),(2018,3)]
+    highest = a3lots.select(portfolio,"CORNELL",6,a3lots.HIGHEST_COST)
+    assert [(lot.buy_price,shares) for lot, shares in highest] == [(25.0,3),(20.0,2),(15.0,1)]
+    specific = a3lots.select(portfolio,"CORNELL",20,a3lots.SPECIFIC,lots=[lots[2019][0],lots[2016][0]])
+    assert specific == [(lots[2019][0],2),(lots[2016][0],1)]
+    assert a3lots.select(portfolio,"CORNELL",100,a3lots.FIFO,True)[0][1] == 7
+
+
+def test_split_leaves_out_emptied_lots(cornell,trading_time):
+    portfolio, lots = cornell
+    long_term, short_term = a3lots.split(portfolio,"CORNELL",trading_time)
+    assert [lot.buy_date.year for lot in long_term] == [2016,2017,2018,2018]
+    assert short_term == lots[2019]
+    assert a3lots.sell_lots(portfolio,"CORNELL",4,trading_time) == 4
+    long_term, short_term = a3lots.split(portfolio,"CORNELL",trading_time)
+    assert [(lot.buy_date.year,lot.shares) for lot in long_term] == [(2018,4),(2018,5)]
+    assert a3lots.split(portfolio,"CORNELL",trading_time,True)[0][0].shares == 7
+    assert a3lots.split(portfolio,"IBM",trading_time) == ([],[])
+
+
+def test_sell_lots_taxes_each_lot_on_its_own(cornell,trading_time):
+    portfolio, lots = cornell
+    before = portfolio.cash
+    expected = (a3._taxed_profit(lots[2017][0],3,18.65,True)+a3._taxed_profit(lots[2019][0],2,18.65,False)
+                +a3._taxed_profit(lots[2018][0],1,18.65,True))
+    assert a3lots.sell_lots(portfolio,"CORNELL",6,trading_time,a3lots.HIGHEST_COST) == 6
+    assert portfolio.cash == before-portfolio.commission_fee+expected
+    assert portfolio.shares_of("CORNELL") == 15-6+7
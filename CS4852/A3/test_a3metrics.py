@@ -0,0 +1,81 @@
+"""
+The timed wrappers of a3metrics: trades count whichever module they go through,
+and disable() puts back exactly the functions and setters it replaced.
+"""
+
+import datetime
+import pytest
+import a3
+import a3assets
+import a3dividends
+import a3journal
+import a3lots
+import a3metrics
+import a3sync
+
+LOT = ("CORNELL",12.0,10,False,datetime.datetime(2017,5,1,10,15))
+
+
+@pytest.fixture
+def metrics():
+    """
+    Turns instrumentation on from no data, and off again when the test ends.
+    """
+    a3metrics.reset()
+    a3metrics.enable()
+    yield
+    a3metrics.disable()
+    a3metrics.reset()
+
+
+def calls():
+    """
+    Returns: a dict mapping every name that was called to its number of calls.
+    """
+    return {name: stat['calls'] for name, stat in a3metrics.snapshot()['functions'].items()}
+
+
+def test_trades_through_a3sync_are_counted(metrics,make_portfolio,trading_time):
+    portfolio = make_portfolio(10000.0)
+    lot = a3sync.buy_stock(portfolio,"CORNELL",4,False,trading_time)
+    assert a3sync.sell_stock(portfolio,1,trading_time,lot)
+    assert a3sync.invest_BitCoin(portfolio,1) and a3sync.sell_BitCoin(portfolio,1)
+    assert a3sync.buy_stock(portfolio,"CORNELL",10000,False,trading_time) is None
+    counted = calls()
+    for name in ('sell_stock','invest_BitCoin','sell_BitCoin'):
+        assert counted['a3sync.'+name] == counted[f'a3._{name}_at'] == 1
+    assert counted['a3sync.buy_stock'] == counted['a3._buy_stock_at'] == 2
+    assert a3metrics.snapshot()['functions']['a3._buy_stock_at']['failures'] == 1
+    assert 'a3.buy_stock' not in counted and 'a3.sell_stock' not in counted
+
+
+def test_trades_through_a_lot_store_are_counted(metrics,make_portfolio,trading_time):
+    portfolio = make_portfolio(1000.0,[LOT],store=True)
+    view = portfolio.lots("CORNELL")[0]
+    assert a3.sell_stock(portfolio,2,trading_time,view)
+    assert a3lots.sell_lots(portfolio,"CORNELL",3,trading_time) == 3
+    a3dividends.distribute("CORNELL",0.5,[portfolio])
+    counted = calls()
+    assert counted['a3.sell_stock'] == counted['a3._sell_stock_at'] == counted['a3lots.sell_lots'] == 1
+    assert counted['a3assets.LotView.shares.set'] == 2
+    assert counted['a3dividends.distribute'] == counted['a3dividends.distribute_many'] == 1
+
+
+def test_journal_writes_are_counted(metrics,make_portfolio,trading_time,tmp_path):
+    with a3journal.Journal.create(str(tmp_path/"book.a3j"),make_portfolio(),snapshot_every=2) as journal:
+        lot = journal.buy_stock("CORNELL",3,False,trading_time)
+        journal.sell_stock(1,trading_time,lot)
+        journal.invest_BitCoin(1)
+        journal.flush()
+    counted = calls()
+    assert counted['a3journal.Journal._write'] == 3
+    assert counted['a3journal.Journal.snapshot'] == 2 and counted['a3journal.Journal.flush'] == 1
+
+
+def test_disable_puts_back_the_originals():
+    before = (a3._buy_stock_at,a3journal.Journal._write,vars(a3assets.LotView)['shares'])
+    a3metrics.enable()
+    assert a3._buy_stock_at is not before[0] and a3journal.Journal._write is not before[1]
+    a3metrics.disable()
+    a3metrics.reset()
+    assert (a3._buy_stock_at,a3journal.Journal._write,vars(a3assets.LotView)['shares']) == before
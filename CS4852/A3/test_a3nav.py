@@ -0,0 +1,67 @@
+"""
+NavBoard and NavTracker: which portfolios a tick reaches, priming from a price source
+that may not quote BitCoin, and the market value against the equity of a3backtest.
+"""
+
+import datetime
+import pytest
+import a3
+import a3assets
+import a3backtest
+import a3helpers
+import a3nav
+
+BOUGHT = datetime.datetime(2018,1,2)
+
+
+@pytest.fixture
+def ibm_holder(make_portfolio):
+    """
+    Returns: a function giving a new portfolio with 100.0 cash, 3 IBM shares bought at 10.0 and coins BitCoins.
+    """
+    def make(coins=0):
+        portfolio = make_portfolio(100.0,[("IBM",10.0,3,False,BOUGHT)])
+        portfolio.coins = coins
+        return portfolio
+    return make
+
+
+def test_board_ticks_only_holders(ibm_holder,make_portfolio):
+    holders = [ibm_holder(),ibm_holder()]
+    other = make_portfolio(50.0,[("MSFT",5.0,2,False,BOUGHT)])
+    board = a3nav.NavBoard(holders+[other])
+    assert board.tick("IBM",12.0) == 2
+    assert board.market_values() == [136.0,136.0,60.0]
+    holders[0].lots("IBM")[0].shares = 0
+    assert board.tick("IBM",11.0) == 1
+    assert board.market_values() == [100.0,133.0,60.0]
+
+
+def test_prime_without_a_BitCoin_price(ibm_holder,install_prices):
+    install_prices({"IBM": [(BOUGHT,12.0)]})
+    board = a3nav.NavBoard([ibm_holder(),ibm_holder(2)])
+    assert board.prime() == 1
+    assert board.market_values() == [136.0,136.0]
+    tracker = a3nav.NavTracker(ibm_holder(2))
+    assert tracker.prime() == 1
+    assert tracker.market_value() == 136.0
+
+
+def test_market_value_and_equity(ibm_holder,trading_time):
+    portfolio = ibm_holder(2)
+    portfolio.add_stock(a3assets.Stock("MSFT",20.0,4,True,trading_time-datetime.timedelta(days=30)))
+    portfolio.add_stock(a3assets.Stock("MSFT",5.0,1,False,BOUGHT))
+    tracker = a3nav.NavTracker(portfolio)
+    for ticker, price in (("IBM",12.0),("MSFT",15.0),(a3helpers.BTC_SYMBOL,100.0)):
+        tracker.tick(ticker,price)
+    # Mark to market: cash, coins, IBM and the long MSFT lot at their prices, and the short
+    # lot at twice what it was sold for less what buying it back costs.
+    assert tracker.market_value() == 100.0+200.0+3*12.0+(2*4*20.0-4*15.0)+15.0
+    # a3 returns twice the gain of each lot after tax (long-term for IBM and the long MSFT
+    # lot, short-term for the short one) and no principal.
+    proceeds = a3.calculate_taxes(2*3*2.0,True)+a3.calculate_taxes(2*4*5.0,False)+a3.calculate_taxes(2*10.0,True)
+    assert tracker.equity(trading_time) == a3backtest.equity(portfolio,trading_time,tracker.prices)
+    assert tracker.equity(trading_time) == pytest.approx(100.0+200.0+proceeds)
+    tracker.tick("MSFT",25.0)
+    assert tracker.equity(trading_time) == a3backtest.equity(portfolio,trading_time,tracker.prices)
+    assert tracker.equity(trading_time) == pytest.approx(100.0+200.0+a3.calculate_taxes(12.0,True)+a3.calculate_taxes(40.0,True))
@@ -0,0 +1,37 @@
+"""
+Batch orders of a3orders: which lots a SELL order sells from, and what it may be given.
+"""
+
+import datetime
+import pytest
+import a3
+import a3orders
+
+LOTS = [("CORNELL",12.0,10,False,datetime.datetime(2017,5,1,10,15)),
+        ("CORNELL",25.5,6,True,datetime.datetime(2018,12,24,15)),
+        ("CORNELL",19.0,8,False,datetime.datetime(2019,1,2,11))]
+
+
+def test_sell_without_a_lot_leaves_shorted_lots(make_portfolio,trading_time):
+    portfolio = make_portfolio(100.0,LOTS)
+    first, shorted, last = portfolio.lots("CORNELL")
+    proceeds = a3._sale_proceeds(first,10,trading_time,18.65)+a3._sale_proceeds(last,8,trading_time,18.65)
+    result, = a3orders.execute_orders(portfolio,[a3orders.Order(a3orders.SELL,"CORNELL",20)],trading_time)
+    assert result.success and result.shares == 18
+    assert (first.shares,shorted.shares,last.shares) == (0,6,0)
+    assert portfolio.cash == pytest.approx(100.0+proceeds-1.0)
+    result, = a3orders.execute_orders(portfolio,[a3orders.Order(a3orders.SELL,"CORNELL",1)],trading_time)
+    assert not result.success and shorted.shares == 6
+
+
+def test_sell_of_a_named_lot(make_portfolio,trading_time):
+    portfolio = make_portfolio(100.0,LOTS)
+    shorted = portfolio.lots("CORNELL")[1]
+    orders = [a3orders.Order(a3orders.SELL,"CORNELL",6,lot=shorted),a3orders.Order(a3orders.SELL,"CORNELL",1,lot=shorted)]
+    sold, again = a3orders.execute_orders(portfolio,orders,trading_time)
+    assert sold.success and sold.shares == 6 and shorted.shares == 0
+    assert not again.success and again.reason == 'no shares of CORNELL to sell'
+    other = make_portfolio(100.0,LOTS).lots("CORNELL")[0]
+    with pytest.raises(AssertionError):
+        a3orders.execute_orders(portfolio,[a3orders.Order(a3orders.SELL,"CORNELL",1,lot=other)],trading_time)
+    assert other.shares == 10
@@ -0,0 +1,74 @@
+"""
+The SQLite quote store of a3quotestore: newer quotes win, warm() fills a quote
+cache with each quote's age, and every thread talks to the file on its own connection.
+"""
+
+import threading
+import pytest
+import a3cache
+import a3helpers
+import a3quotestore
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def store(tmp_path):
+    """
+    Returns: a new QuoteStore whose quotes stay fresh for 60 seconds of its clock.
+    """
+    store = a3quotestore.QuoteStore(str(tmp_path/"quotes.db"),60.0,Clock())
+    yield store
+    store.close()
+
+
+def test_an_older_quote_never_replaces_a_newer_one(store):
+    store.put("IBM",120.5,1000.0)
+    store.put("IBM",99.0,990.0)
+    assert store.get("IBM") == (120.5,0.0)
+    store.put_many([("IBM",121.0,1000.0),("IBM",98.0,999.0),("MSFT",250.0,995.0)])
+    assert store.get_many(["IBM","MSFT","AAPL"]) == {"IBM": (121.0,0.0),"MSFT": (250.0,5.0)}
+    store.clock.now = 1010.0
+    store.put("IBM",122.0)
+    assert store.get("IBM") == (122.0,0.0) and len(store) == 2
+
+
+def test_warm_fills_a_cache_with_the_age_of_each_quote(store):
+    store.put_many([("IBM",120.5,1000.0),("MSFT",250.0,970.0),("OLD",1.0,900.0)])
+    clock = Clock()
+    cache = a3cache.QuoteCache(60.0,16,clock)
+    assert store.warm(cache) == 2
+    assert cache.get("IBM") == 120.5 and cache.get("MSFT") == 250.0 and cache.get("OLD") is None
+    clock.now += 30.0
+    assert cache.get("IBM") == 120.5 and cache.get("MSFT") is None
+    assert a3helpers.set_quote_store(store) is None
+    assert a3helpers.quote_cache.get("IBM",False) == 120.5
+    assert a3helpers.set_quote_store(None) is store
+
+
+def test_every_thread_has_its_own_connection(store):
+    main = store._connection()
+    seen = []
+
+    def work(symbol,price):
+        store.put(symbol,price,1000.0)
+        seen.append((store._connection(),store.get("IBM")))
+        store.close()
+
+    store.put("IBM",120.5,1000.0)
+    threads = [threading.Thread(target=work,args=(f"S{i}",float(i))) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    connections = {id(db) for db, _ in seen}
+    assert len(connections) == 4 and id(main) not in connections
+    assert [found for _, found in seen] == [(120.5,0.0)]*4
+    assert store._connection() is main and len(store) == 5
+    assert store.get_many(f"S{i}" for i in range(4)) == {f"S{i}": (float(i),0.0) for i in range(4)}
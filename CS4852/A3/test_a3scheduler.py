@@ -0,0 +1,107 @@
+"""
+RequestScheduler and TokenBucket: calls shared per key, sent by priority within the
+quota, tried again when throttled, and failed when the scheduler closes.
+"""
+
+import threading
+import pytest
+import a3scheduler
+
+
+class Clock(object):
+    """
+    A clock that only moves when told to.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills_at_its_rate():
+    clock = Clock()
+    bucket = a3scheduler.TokenBucket(5,60.0,clock)
+    assert [bucket.take() for _ in range(6)] == [True]*5+[False]
+    assert bucket.wait_time() == 12.0
+    clock.now = 30.0
+    assert bucket.tokens() == 2.5
+    bucket.drain()
+    assert bucket.tokens() == 0.0
+    clock.now = 1000.0
+    assert bucket.tokens() == 5.0
+
+
+def test_requests_for_one_key_share_one_call():
+    calls = []
+    release = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return 42.0
+
+    scheduler = a3scheduler.RequestScheduler(((100,1.0),))
+    try:
+        futures = [scheduler.request("IBM",fetch) for _ in range(5)]
+        release.set()
+        assert [future.result(5) for future in futures] == [42.0]*5
+        assert calls == [1]
+        assert (scheduler.requests,scheduler.coalesced,scheduler.sent) == (5,4,1)
+        assert scheduler.call("IBM",lambda: 43.0) == 43.0
+    finally:
+        scheduler.close()
+
+
+def test_trade_requests_go_before_waiting_refreshes():
+    order = []
+    scheduler = a3scheduler.RequestScheduler(((1,0.3),),workers=1)
+    try:
+        # The first call takes the only token, so the rest wait and are sent by priority.
+        scheduler.call("A",lambda: order.append("A"),timeout=5)
+        futures = [scheduler.request(key,lambda key=key: order.append(key),priority)
+                   for key, priority in (("B",a3scheduler.REFRESH),("C",a3scheduler.REFRESH),
+                                         ("D",a3scheduler.TRADE))]
+        # A TRADE request for a waiting REFRESH moves it up, behind the TRADE before it.
+        futures.append(scheduler.request("C",lambda: order.append("C again"),a3scheduler.TRADE))
+        for future in futures:
+            future.result(5)
+        assert order == ["A","D","C","B"]
+        assert scheduler.coalesced == 1
+    finally:
+        scheduler.close()
+
+
+def refused():
+    raise a3scheduler.Throttled('over the quota')
+
+
+def test_throttled_calls_are_tried_again():
+    tries = []
+
+    def fetch():
+        tries.append(1)
+        if len(tries) < 3:
+            raise a3scheduler.Throttled('over the quota')
+        return 7.0
+
+    scheduler = a3scheduler.RequestScheduler(((100,1.0),),retries=2)
+    try:
+        assert scheduler.call("IBM",fetch,timeout=5) == 7.0
+        assert (scheduler.sent,scheduler.throttled) == (3,2)
+        with pytest.raises(a3scheduler.Throttled):
+            scheduler.call("MSFT",refused,timeout=5)
+        assert (scheduler.sent,scheduler.throttled) == (6,5)
+        assert len(scheduler) == 0
+    finally:
+        scheduler.close()
+
+
+def test_close_fails_waiting_requests():
+    scheduler = a3scheduler.RequestScheduler(((1,3600.0),))
+    scheduler.call("A",lambda: 1.0,timeout=5)
+    waiting = scheduler.request("B",lambda: 2.0)
+    scheduler.close()
+    with pytest.raises(RuntimeError):
+        waiting.result(5)
@@ -0,0 +1,35 @@
+"""
+run_simulation over a pool of worker processes, each reading the tick file it is
+given, against the same simulation run shard by shard in this process.
+"""
+
+import datetime
+import pytest
+import a3helpers
+import a3prices
+import a3sim
+
+BEFORE = a3sim.DEFAULT_TIME-datetime.timedelta(hours=1)
+AFTER = a3sim.DEFAULT_TIME+datetime.timedelta(hours=1)
+
+
+@pytest.fixture
+def price_file(tmp_path):
+    """
+    Returns: the path of a tick file whose prices at DEFAULT_TIME differ from the TEST ones.
+    """
+    path = str(tmp_path/"sim.a3tk")
+    a3prices.write_replay_file(path,{"CORNELL": [(BEFORE,17.5),(AFTER,99.0)],
+                                     a3helpers.BTC_SYMBOL: [(BEFORE,310.25),(AFTER,1.0)]})
+    return path
+
+
+@pytest.mark.parametrize('strategy',[a3sim.buy_and_hold,a3sim.round_trip])
+def test_two_shards_in_worker_processes_match_a_serial_run(price_file,strategy):
+    serial = a3sim.run_simulation(25,strategy,1000.0/3,price_file=price_file,workers=1,shard_size=10)
+    pooled = a3sim.run_simulation(25,strategy,1000.0/3,price_file=price_file,workers=2,shard_size=10)
+    assert (pooled.cash,pooled.trades,pooled.unopened) == (serial.cash,serial.trades,serial.unopened)
+    assert len(pooled.cash) == 25 and pooled.trades > 0
+    constants = a3sim.run_simulation(25,strategy,1000.0/3,workers=1,shard_size=10)
+    assert constants.cash != serial.cash
+    assert a3helpers.price_source is None
@@ -0,0 +1,38 @@
+"""
+a3sync from many threads at once: shared portfolios are never overdrawn, and the
+locks they are given do not stop them being pickled.
+"""
+
+import pickle
+import threading
+import a3sync
+
+
+def test_locked_portfolio_still_pickles(make_portfolio,trading_time):
+    portfolio = make_portfolio()
+    a3sync.buy_stock(portfolio,"CORNELL",4,False,trading_time)
+    with a3sync.transaction(portfolio):
+        copy = pickle.loads(pickle.dumps(portfolio))
+    assert copy.cash == portfolio.cash and copy.shares_of("CORNELL") == 4
+    assert a3sync.lock(copy) is not a3sync.lock(portfolio)
+    assert a3sync.lock(portfolio) is a3sync.lock(portfolio)
+
+
+def test_threads_never_overdraw_a_shared_portfolio(make_portfolio,trading_time):
+    portfolio = make_portfolio()
+    cost = 18.65*10+portfolio.commission_fee
+    start = threading.Barrier(8)
+
+    def buy():
+        start.wait()
+        for _ in range(20):
+            a3sync.buy_stock(portfolio,"CORNELL",10,False,trading_time)
+
+    threads = [threading.Thread(target=buy) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    bought = portfolio.shares_of("CORNELL")//10
+    assert bought == int(1000.0//cost)
+    assert abs(portfolio.cash-(1000.0-bought*cost)) < 1e-6
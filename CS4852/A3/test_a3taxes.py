@@ -0,0 +1,75 @@
+"""
+The tax tables of a3taxes against the if/elif formula they replaced, scalar and batched.
+"""
+
+import sys
+import random
+import datetime
+import pytest
+import a3
+import a3calendar
+import a3taxes
+
+
+def old_calculate_taxes(profit,long_term):
+    """
+    Returns: profit after tax, by the if/elif formula a3.calculate_taxes used before a3taxes.
+    """
+    if not long_term:
+        if profit <= 10000:
+            return profit-0.1*profit
+        elif profit <= 100000:
+            return profit-(0.1*10000+0.2*(profit-10000))
+        elif profit <= 1000000:
+            return profit-(0.1*10000+0.2*90000+0.3*(profit-100000))
+        elif profit <= 10000000:
+            return profit-(0.1*10000+0.2*90000+0.3*900000+0.4*(profit-1000000))
+        return profit-(0.1*10000+0.2*90000+0.3*900000+0.4*9000000+0.7*(profit-10000000))
+    if profit <= 38600:
+        return profit-0
+    elif profit <= 425800:
+        return profit-0.15*(profit-38600)
+    return profit-(0.15*387200+0.3*(profit-425800))
+
+
+def profits(n=100000,seed=4852):
+    """
+    Returns: n random profits over every bracket, plus every limit and its neighbours.
+    """
+    rng = random.Random(seed)
+    values = [rng.uniform(-1000.0,20000000.0) for _ in range(n)]
+    values += [rng.uniform(0.0,50000.0) for _ in range(n)]
+    for limit in (0.0,10000.0,38600.0,100000.0,425800.0,1000000.0,10000000.0):
+        values += [limit,limit-0.01,limit+0.01]
+    return values
+
+
+@pytest.mark.parametrize('long_term',[False,True])
+def test_calculate_taxes_matches_old_formula(long_term):
+    for profit in profits():
+        assert a3.calculate_taxes(profit,long_term) == old_calculate_taxes(profit,long_term), profit
+
+
+def test_bracket_limits_are_inclusive():
+    assert a3taxes.SHORT_TERM.bracket(10000.0) == 0
+    assert a3taxes.SHORT_TERM.bracket(10000.01) == 1
+    assert a3taxes.LONG_TERM.bracket(425800.0) == 1
+    assert a3taxes.LONG_TERM.bracket(425800.01) == 2
+
+
+def test_after_tax_array_matches_scalar():
+    numpy = pytest.importorskip('numpy')
+    values = profits(20000)
+    mask = [i % 3 == 0 for i in range(len(values))]
+    expected = [a3.calculate_taxes(p,m) for p, m in zip(values,mask)]
+    assert a3taxes.after_tax_array(numpy.array(values),numpy.array(mask)).tolist() == expected
+    assert a3taxes.after_tax_array(values,False).tolist() == [a3.calculate_taxes(p,False) for p in values]
+
+
+def test_load_numpy_raises_import_error_without_numpy(monkeypatch):
+    monkeypatch.setitem(sys.modules,'numpy',None)
+    monkeypatch.setattr(a3taxes,'numpy',None)
+    with pytest.raises(ImportError):
+        a3taxes.load_numpy()
+    with pytest.raises(ImportError):
+        a3calendar.calendar.is_open_array([datetime.datetime(2019,3,4,11)])